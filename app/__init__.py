@@ -1,5 +1,4 @@
 import numpy as np
-import textwrap
 import random
 import json
 import time
@@ -37,38 +36,12 @@ CSVExporter.export = plot_csv_export
 
 class App(QtGui.QMainWindow):
 
-    data_file_loaded = QtCore.pyqtSignal(int)
+    data_file_loaded = QtCore.pyqtSignal(tuple)
 
     SAVE_FILE = lambda x: f'data/stdev_data_{int(x)}.npy'
 
     MAX_NUM_DATA_POINTS = 5  # Maximum number of data point records to average
 
-    class DataV1():
-        COL_STDEV_X = 0  # Deviation along x-axis
-        COL_STDEV_Y = 1  # Deviation along y-axis
-        COL_STDEV_T = 2  # Deviation along hit time
-        COL_BPM     = 3  # BPM of the pattern (60/s)
-        COL_PX      = 4  # Distance between notes in the pattern (osu!px)
-        COL_ANGLE   = 5  # Angle between notes in the pattern (deg)
-        COL_ROT     = 6  # Rotation of pattern (deg)
-        COL_NUM     = 7  # Number of notes in the pattern before pattern reverses
-        NUM_COLS    = 8
-
-    class DataV2():
-        COL_STDEV_X = 0   # Deviation along x-axis
-        COL_AVG_X   = 1   # Average along x-axis
-        COL_STDEV_Y = 2   # Deviation along y-axis
-        COL_AVG_Y   = 3   # Average along y-axis
-        COL_STDEV_T = 4   # Deviation along hit time
-        COL_AVG_T   = 5   # Average along hit time
-        COL_BPM     = 6   # BPM of the pattern (60/s)
-        COL_PX      = 7   # Distance between notes in the pattern (osu!px)
-        COL_ANGLE   = 8   # Angle between notes in the pattern (deg)
-        COL_ROT     = 9   # Rotation of pattern (deg)
-        COL_NUM     = 10  # Number of notes in the pattern before pattern reverses
-        COL_CS      = 11  # Circle size of pattern (osu!px)
-        NUM_COLS    = 12
-
     DEV_X  = 0
     DEV_Y  = 1
     DEV_XY = 2
@@ -81,6 +54,29 @@ class App(QtGui.QMainWindow):
     from .widgets.value_edit import ValueEdit
     from .misc.monitor import Monitor
     from .misc._osu_utils import OsuUtils
+    from .misc._pattern_cache import PatternCache
+    from .misc._map_generator import MapGenerator
+    from .misc._data_log import DataLog
+    from .misc._data_schema import DataV1, DataV2, DataV3
+    from .misc._record_index import RecordIndex
+    from .misc._hit_archive import HitArchive
+    from .misc._aggregate_table import AggregateTable
+    from .misc._selection_cache import SelectionCache
+    from .misc._derived_columns import DerivedColumns
+    from .misc._replot_scheduler import ReplotScheduler
+    from .misc._fit_worker import FitWorker
+    from .misc._timing import Timing
+
+    # Record column each deviation select maps to
+    DEV_COLS = {
+        DEV_X  : DataV3.COL_STDEV_X,
+        DEV_Y  : DataV3.COL_STDEV_Y,
+        DEV_XY : DataV3.COL_STDEV_XY,
+        DEV_T  : DataV3.COL_STDEV_T,
+        AVG_X  : DataV3.COL_AVG_X,
+        AVG_Y  : DataV3.COL_AVG_Y,
+        AVG_T  : DataV3.COL_AVG_T,
+    }
 
     # Left column
     from .graphs._stdev_graph_bpm import StddevGraphBpm
@@ -90,11 +86,13 @@ class App(QtGui.QMainWindow):
     from .graphs._stdev_graph_vel import StddevGraphVel
     from .graphs._stdev_graph_skill import StddevGraphSkill
     from .graphs._stdev_graph_tap_dev import StddevGraphTapDev
+    from .graphs._stdev_graph_grid import StddevGraphGrid
 
     from .views._aim_graph import AimGraph
     from .views._offset_graph import HitOffsetGraph
     from .views._pattern_visual import PatternVisual
     from .views._data_list import DataList
+    from .views._diagnostics import Diagnostics
 
     def __init__(self):
         QtGui.QMainWindow.__init__(self)
@@ -105,7 +103,7 @@ class App(QtGui.QMainWindow):
         self.__init_gui()
         self.__build_layout()
 
-        self.DataVer = App.DataV2
+        self.DataVer = App.DataV3
         self.data_file_loaded.connect(self.__data_file_load_handler)
 
         if not self.load_data_file(self.user_id):
@@ -155,6 +153,19 @@ class App(QtGui.QMainWindow):
     def __init_gui(self):
         self.graphs = {}
         self.engaged = False
+        self.selection_cache = App.SelectionCache()
+        self.data_columns = App.DerivedColumns()
+        self.pattern_cache = App.PatternCache()
+
+        # Stage timings are off unless enabled in config or from the diagnostics dock
+        try: timing = bool(AppConfig.cfg['timing'])
+        except KeyError:
+            timing = False
+
+        self.timing = App.Timing(enabled=timing)
+        self.replot_scheduler = App.ReplotScheduler(self, timing=self.timing)
+        self.fit_worker = App.FitWorker(parent=self, timing=self.timing)
+        self.map_generator = App.MapGenerator(pattern_cache=self.pattern_cache, timing=self.timing)
         self.dev_select = App.DEV_X
 
         self.model_compensation = False
@@ -167,6 +178,10 @@ class App(QtGui.QMainWindow):
         self.info_text = ''
         self.stats_text = ''
 
+        # Map data of the last generated map and md5 of its file
+        self.map_data = None
+        self.map_md5  = None
+
         self.menu_bar  = QtGui.QMenuBar()
         self.view_menu = QtGui.QMenu("&View", self)
 
@@ -221,6 +236,7 @@ class App(QtGui.QMainWindow):
         self.offset_graph = App.HitOffsetGraph()
         self.pattern_visual = App.PatternVisual()
         self.data_list = App.DataList(self)
+        self.diagnostics = App.Diagnostics(self.timing)
         
 
     def __build_layout(self):
@@ -293,6 +309,8 @@ class App(QtGui.QMainWindow):
         App.StddevGraphVel.__init__(self, pos='below', relative_to='StddevGraphAngle', dock_name='Deviation vs Velocity')
         App.StddevGraphSkill.__init__(self, pos='below', relative_to='StddevGraphVel', dock_name='Skill vs Angle')
         App.StddevGraphTapDev.__init__(self, pos='below', relative_to='StddevGraphSkill', dock_name='Tap Deviation vs Aim mean')
+        App.StddevGraphGrid.__init__(self, pos='below', relative_to='StddevGraphTapDev', dock_name='Deviation vs BPM × Spacing')
+        self._create_graph(graph_id='Diagnostics', pos='below', relative_to='StddevGraphGrid', dock_name='Diagnostics', widget=self.diagnostics)
 
         # Connect checkbox events
         self.avg_chkbx.stateChanged.connect(self.__avg_chkbx_event)
@@ -315,7 +333,9 @@ class App(QtGui.QMainWindow):
     def __record_results(self, replay_path):
         time.sleep(2)
 
-        try: self.replay = ReplayIO.open_replay(replay_path)
+        try:
+            with self.timing.span('open_replay', 'ingest'):
+                self.replay = ReplayIO.open_replay(replay_path)
         except Exception as e:
             print(f'Error opening replay: {e}')
             self.monitor.pause()
@@ -430,6 +450,11 @@ class App(QtGui.QMainWindow):
             map_path = f'{AppConfig.cfg["osu_dir"]}/Songs/aim_tool'
 
             self.__generate_map(map_path)
+
+            # The next map is made while this one is played
+            if self.auto_increase:
+                self.__prepare_next_map(map_path)
+
             self.__monitor_replay()
 
             # This needs to be after `monitor_replay`. `monitor replay` will wait until a replay is detected
@@ -462,7 +487,8 @@ class App(QtGui.QMainWindow):
                     continue
 
             # Update deviation data and plots
-            self.__write_data(aim_x_offsets, aim_y_offsets, tap_offsets)
+            with self.timing.span('write_data', 'ingest'):
+                self.__write_data(aim_x_offsets, aim_y_offsets, tap_offsets)
 
             self.replot_graphs()
             self.aim_graph.plot_data(aim_x_offsets, aim_y_offsets)
@@ -483,94 +509,13 @@ class App(QtGui.QMainWindow):
 
 
     def __generate_map(self, map_path):
-        # Handle DT/NC vs nomod setting
-        rate_multiplier = 1.0 if (AppConfig.cfg["ar"] <= 10) else 1.5
-        
-        ar = min(AppConfig.cfg["ar"], 10)
-        ar = ar if (AppConfig.cfg["ar"] <= 10) else App.OsuUtils.ms_to_ar(App.OsuUtils.ar_to_ms(AppConfig.cfg["ar"])*rate_multiplier)
-
-        beatmap_data = textwrap.dedent(
-            f"""\
-            osu file format v14
-
-            [General]
-            AudioFilename: blank.mp3
-            AudioLeadIn: 0
-            PreviewTime: -1
-            Countdown: 0
-            SampleSet: Normal
-            StackLeniency: 0
-            Mode: 0
-            LetterboxInBreaks: 1
-            WidescreenStoryboard: 1
-
-            [Editor]
-            DistanceSpacing: 0.9
-            BeatDivisor: 1
-            GridSize: 32
-            TimelineZoom: 0.2000059
-
-            [Metadata]
-            Title:unknown
-            TitleUnicode:unknown
-            Artist:abraker
-            ArtistUnicode:abraker
-            Creator:abraker
-            Version:aim__bpm-{AppConfig.cfg["bpm"]}_dx-{AppConfig.cfg["dx"]}_rot-{AppConfig.cfg["rot"]}_deg-{AppConfig.cfg["angle"]}
-            Source:
-            Tags:
-            BeatmapID:0
-            BeatmapSetID:882805
-
-            [Difficulty]
-            HPDrainRate:8
-            CircleSize:{AppConfig.cfg["cs"]}
-            OverallDifficulty:10
-            ApproachRate:{ar}
-            SliderMultiplier:1.4
-            SliderTickRate:1
-
-            [Events]\
-            """
-        )
-
-        # Generate notes
-        pattern, _ = App.OsuUtils.generate_pattern2(AppConfig.cfg["rot"]*math.pi/180, AppConfig.cfg["dx"], 60/AppConfig.cfg["bpm"]*rate_multiplier, AppConfig.cfg["angle"]*math.pi/180, AppConfig.cfg["notes"], AppConfig.cfg["repeats"])
-        audio_offset = -48  # ms
-
-        for note in pattern:
-            beatmap_data += textwrap.dedent(
-                f"""
-                Sample,{int(note[2]*1000 + audio_offset*rate_multiplier)},3,"pluck.wav",100\
-                """
-            )
+        # Swaps in the map if it was prepared ahead of time, otherwise generates it now
+        settings = { key : AppConfig.cfg[key] for key in App.MapGenerator.SETTINGS }
+        generated = self.map_generator.generate(settings, map_path)
 
-        beatmap_data += textwrap.dedent(
-            f"""
-
-            [TimingPoints]
-            0,1000,4,1,1,100,1,0
-
-            [HitObjects]\
-            """
-        )
-
-        for note in pattern:
-            beatmap_data += textwrap.dedent(
-                f"""
-                {int(note[0])},{int(note[1])},{int(note[2]*1000 + audio_offset*rate_multiplier)},1,0,0:0:0:0:\
-                """
-            )
-
-        # Remove leading whitespace
-        beatmap_data = beatmap_data.split('\n')
-        for i in range(len(beatmap_data)):
-            beatmap_data[i] = beatmap_data[i].strip()
-        self.beatmap_data = '\n'.join(beatmap_data)
-
-        # Write to beatmap file
-        os.makedirs(map_path, exist_ok=True)
-        BeatmapIO.save_beatmap(self.beatmap_data, f'{map_path}/map.osu')
+        self.beatmap_data = generated['text']
+        self.map_md5      = generated['md5']
+        self.map_data     = generated['map_data']
 
         if not os.path.isfile(f'{map_path}/pluck.wav'):
             shutil.copy2('pluck.wav', f'{map_path}/pluck.wav')
@@ -579,6 +524,16 @@ class App(QtGui.QMainWindow):
             shutil.copy2('blank.wav', f'{map_path}/normal-hitnormal.wav')
 
 
+    def __prepare_next_map(self, map_path):
+        # Settings the auto increment will move to once the replay comes in
+        settings = { key : AppConfig.cfg[key] for key in App.MapGenerator.SETTINGS }
+        for key, widget in self.cfg_widgets.items():
+            if key in settings:
+                settings[key] = widget.next_value()
+
+        self.map_generator.prepare(settings, map_path)
+
+
     def __monitor_replay(self):
         self.info_text = 'Open osu! and play the map! Waiting for play...\n'
         self.status_txt.setText(self.info_text + self.stats_text)
@@ -599,7 +554,6 @@ class App(QtGui.QMainWindow):
 
     def __get_data(self, map_path):
         invalid_data = None, None, None, None, None, None
-        beatmap = BeatmapIO.open_beatmap(f'{map_path}/map.osu')
 
         # Check if mods are valid
         if AppConfig.cfg["ar"] > 10:
@@ -624,8 +578,15 @@ class App(QtGui.QMainWindow):
                 self.status_txt.setText(self.info_text + self.stats_text)
                 return invalid_data
 
-        # Read beatmap
-        try: map_data = StdMapData.get_map_data(beatmap)
+        # Read beatmap, unless it is the one just generated
+        try:
+            with self.timing.span('get_map_data', 'ingest'):
+                map_data = self.map_data
+                if type(map_data) == type(None) or App.MapGenerator.file_md5(f'{map_path}/map.osu') != self.map_md5:
+                    with self.timing.span('open_beatmap', 'ingest'):
+                        beatmap = BeatmapIO.open_beatmap(f'{map_path}/map.osu')
+
+                    map_data = StdMapData.get_map_data(beatmap)
         except TypeError as e:
             self.info_text = 'Error reading beatmap!\n'
             self.status_txt.setText(self.info_text + self.stats_text)
@@ -633,7 +594,9 @@ class App(QtGui.QMainWindow):
             return invalid_data
 
         # Read replay
-        try: replay_data = StdReplayData.get_replay_data(self.replay)
+        try:
+            with self.timing.span('get_replay_data', 'ingest'):
+                replay_data = StdReplayData.get_replay_data(self.replay)
         except Exception as e:
             self.info_text = 'Error reading replay!\n'
             self.status_txt.setText(self.info_text + self.stats_text)
@@ -665,7 +628,8 @@ class App(QtGui.QMainWindow):
             settings.require_aim_hold    = False
             settings.require_aim_release = False
 
-        score_data = StdScoreData.get_score_data(replay_data, map_data, settings)
+        with self.timing.span('get_score_data', 'ingest'):
+            score_data = StdScoreData.get_score_data(replay_data, map_data, settings)
         print(score_data)
 
         if (self.replay.mods.value & Mod.Relax) > 0:
@@ -808,25 +772,18 @@ class App(QtGui.QMainWindow):
 
         stddev_xy = (stddev_x**2 + stddev_y**2)**0.5
 
-        # Close data file for writing
-        self.data_file.close()
+        # Find records made with the same settings
+        setting = (AppConfig.cfg["bpm"], AppConfig.cfg["dx"], AppConfig.cfg["rot"], AppConfig.cfg["angle"], AppConfig.cfg["notes"])
+        data_select = self.data_index.lookup(setting)
 
-        # Find record based on bpm and spacing
-        data_select = \
-            (self.data[:, self.DataVer.COL_BPM] == AppConfig.cfg["bpm"]) & \
-            (self.data[:, self.DataVer.COL_PX] == AppConfig.cfg["dx"]) & \
-            (self.data[:, self.DataVer.COL_ROT] == AppConfig.cfg["rot"]) & \
-            (self.data[:, self.DataVer.COL_ANGLE] == AppConfig.cfg["angle"]) & \
-            (self.data[:, self.DataVer.COL_NUM] == AppConfig.cfg["notes"])
-
-        num_records = data_select.sum()
+        num_records = data_select.shape[0]
 
         # Print play/record info
         if num_records != 0:
             # Get current records
-            stddev_x_curr = self.data[data_select, self.DataVer.COL_STDEV_X]
-            stddev_y_curr = self.data[data_select, self.DataVer.COL_STDEV_Y]
-            stddev_t_curr = self.data[data_select, self.DataVer.COL_STDEV_T]
+            stddev_x_curr = self.data[self.DataVer.COL_STDEV_X][data_select]
+            stddev_y_curr = self.data[self.DataVer.COL_STDEV_Y][data_select]
+            stddev_t_curr = self.data[self.DataVer.COL_STDEV_T][data_select]
 
             # Calculate stdev-xy for each data point and figure out which one is largest
             stddev_xy_curr = (stddev_x_curr**2 + stddev_y_curr**2)**0.5
@@ -847,85 +804,154 @@ class App(QtGui.QMainWindow):
         self.status_txt.setText(self.info_text + self.stats_text)
         print(self.stats_text)
     
-        # Update data and save to file
-        if self.DataVer.NUM_COLS == App.DataV1.NUM_COLS:
-            data = [ stddev_x, stddev_y, stddev_t, AppConfig.cfg['bpm'], AppConfig.cfg['dx'], AppConfig.cfg['angle'], AppConfig.cfg['rot'], AppConfig.cfg['notes'] ]
-            assert(len(data) == self.DataVer.NUM_COLS)
-
-            self.data = np.insert(self.data, 0, np.asarray(data), axis=0)
+        # Update data and append record to file
+        record = self.DataVer.record(self.data_log.dtype, {
+            self.DataVer.COL_STDEV_X : stddev_x,
+            self.DataVer.COL_AVG_X   : mean_x,
+            self.DataVer.COL_STDEV_Y : stddev_y,
+            self.DataVer.COL_AVG_Y   : mean_y,
+            self.DataVer.COL_STDEV_T : stddev_t,
+            self.DataVer.COL_AVG_T   : mean_t,
+            self.DataVer.COL_BPM     : AppConfig.cfg['bpm'],
+            self.DataVer.COL_PX      : AppConfig.cfg['dx'],
+            self.DataVer.COL_ANGLE   : AppConfig.cfg['angle'],
+            self.DataVer.COL_ROT     : AppConfig.cfg['rot'],
+            self.DataVer.COL_NUM     : AppConfig.cfg['notes'],
+            self.DataVer.COL_CS      : AppConfig.cfg['cs'],
+        })
+
+        # A memory mapped data file may be grown to fit the record, which Windows only allows once
+        # no views of the mapping are left. Cached selections and derived columns no longer cover
+        # all records either way
+        self.data = None
+        self.selection_cache.invalidate()
+        self.data_columns.invalidate()
+
+        # Records stay available to the graphs even if the record could not be appended
+        try:
+            with self.timing.span('data_log.append', 'io'):
+                self.data_log.append(record)
+        finally:
+            self.data = self.data_log.data
+
+        self.data_index.add(setting, self.data.shape[0] - 1)
+        self.data_aggregates.update(setting, record)
+
+        # Records appended since the index and aggregates were last saved are added to them on load,
+        # so besides closing and switching data files they are only saved once a compaction has
+        # rewritten the data file
+        if self.data_log.num_compactions != self.__saved_compactions:
+            with self.timing.span('save_data_tables', 'io'):
+                self.__save_data_tables()
+
+        # Keep the per-note offsets so the play can be re-aggregated later
+        with self.timing.span('hit_archive.append', 'io'):
+            self.hit_archive.append(self.data.shape[0] - 1, aim_offsets_x, aim_offsets_y, tap_offsets)
 
-        elif self.DataVer.NUM_COLS == App.DataV2.NUM_COLS:
-            data = [ stddev_x, mean_x, stddev_y, mean_y, stddev_t, mean_t, AppConfig.cfg['bpm'], AppConfig.cfg['dx'], AppConfig.cfg['angle'], AppConfig.cfg['rot'], AppConfig.cfg['notes'], AppConfig.cfg['cs'] ]
-            assert(len(data) == self.DataVer.NUM_COLS)
 
-            self.data = np.insert(self.data, 0, np.asarray([ stddev_x, mean_x, stddev_y, mean_y, stddev_t, mean_t, AppConfig.cfg['bpm'], AppConfig.cfg['dx'], AppConfig.cfg['angle'], AppConfig.cfg['rot'], AppConfig.cfg['notes'], AppConfig.cfg['cs'] ]), axis=0)
-        
-        else:
-            raise Exception(f'Unknown data version with {self.DataVer.NUM_COLS} columns')
+    def load_data_file(self, user_id):
+        save_file = App.SAVE_FILE(user_id)
 
-        np.save(App.SAVE_FILE(self.user_id), self.data, allow_pickle=False)
+        # Already open, e.g. when it gets selected in the DataList on startup. Opening it again
+        # could rewrite it, which Windows does not allow while views of its mapping are alive
+        if hasattr(self, 'data_log') and os.path.abspath(self.data_log.save_file) == os.path.abspath(save_file):
+            return True
 
-        # Now reopen it so it can be used
-        self.data_file = open(App.SAVE_FILE(self.user_id), 'rb+')
-        self.data = np.load(self.data_file, allow_pickle=False)
+        # The new data file is opened and checked first, so the open one stays in use if that fails
+        data_log = self.__open_data_file(save_file)
+        if type(data_log) == type(None):
+            return False
 
+        print(f'Loaded data file containing {data_log.data.shape[0]} records with columns: {", ".join(data_log.dtype.names)}')
 
-    def load_data_file(self, user_id):
-        try: 
-            data_file = open(App.SAVE_FILE(user_id), 'rb+')
-            data = np.load(data_file, allow_pickle=False)
+        data_index = App.RecordIndex(f'{data_log.log_dir}/index.npz', data_log.data)
+        data_aggregates = App.AggregateTable(data_log.data, App.MAX_NUM_DATA_POINTS, f'{data_log.log_dir}/aggregates.npz')
 
-            num_cols = data.shape[1]
-            print(f'Loaded data file containing {data.shape[1]} columns.')
+        # Let any pending compaction of the previously opened data file finish
+        if hasattr(self, 'data_log'):
+            self.data_log.close()
+            self.__save_data_tables()
 
-            if num_cols < 8:
-                print('Invalid data file!')
-                return False
+        self.DataVer    = self.DataV3
+        self.data_log   = data_log
+        self.data       = data_log.data
+        self.data_index = data_index
+        self.hit_archive = App.HitArchive(f'{data_log.log_dir}/hits')
+        self.data_aggregates = data_aggregates
+        self.selection_cache.invalidate()
+        self.data_columns.invalidate()
+        self.__saved_compactions = data_log.num_compactions
 
-            if num_cols == self.DataV1.NUM_COLS:
-                print('Data file v1 detected!')
-                self.DataVer = self.DataV1
-                self.data_file_loaded.emit(self.DataVer.NUM_COLS)
-                
-                self.data_file = data_file
-                self.data = data
-                return True
+        self.data_file_loaded.emit(data_log.dtype.names)
+        return True
 
-            if num_cols == self.DataV2.NUM_COLS:
-                print('Data file v2 detected!')
-                self.DataVer = self.DataV2
-                self.data_file_loaded.emit(self.DataVer.NUM_COLS)
 
-                self.data_file = data_file
-                self.data = data
-                return True
+    def __open_data_file(self, save_file):
+        # Data log of `save_file` converted to the current format, None if it can not be used
 
-            return False
+        # Memory mapping keeps load time independent of data file size
+        try: mmap = bool(AppConfig.cfg['mmap_data'])
+        except KeyError:
+            mmap = False
 
+        try: 
+            data_log = App.DataLog(save_file, mmap=mmap)
         except FileNotFoundError:
             print('Data file not found. Creating...')
-
-            self.data = np.asarray([])
-            np.save(App.SAVE_FILE(user_id), np.empty((0, self.DataVer.NUM_COLS)), allow_pickle=False)
-            
-            self.data_file = open(App.SAVE_FILE(user_id), 'rb+')
-            self.data = np.load(self.data_file, allow_pickle=False)
-            self.DataVer = self.DataV2
-
-            print(f'Loaded data file containing {self.data.shape[1]} columns.')
-
-            self.data_file_loaded.emit(self.DataVer.NUM_COLS)
-            return True
+            data_log = App.DataLog(save_file, empty=np.empty(0, dtype=self.DataV3.DTYPE), mmap=mmap)
+        except (OSError, ValueError) as e:
+            print(f'Unable to open data file! {type(e).__name__} due to "{e}"')
+            return None
+
+        # Data files from before v3 store a float64 matrix. Convert them to the structured format once,
+        # keeping the original records next to the data file
+        if self.DataV3.is_legacy(data_log.dtype):
+            try: data = self.DataV3.from_legacy(data_log.data)
+            except ValueError as e:
+                print(f'Invalid data file! {e}')
+                data_log.close()
+                return None
+
+            backup_file = f'{os.path.splitext(data_log.save_file)[0]}.legacy.bak'
+            print(f'Converting data file with {data_log.data.shape[1]} columns to v{self.DataV3.VERSION}. Original kept as {backup_file}...')
+            try: data_log.rewrite(data, version=self.DataV3.VERSION, backup_file=backup_file)
+            except OSError as e:
+                print(f'Converting data file failed! {type(e).__name__} due to "{e}"')
+                data_log.close()
+                return None
+
+        elif type(data_log.version) == type(None):
+            # New data file, or one written before the version was recorded
+            data_log.write_version(self.DataV3.VERSION)
+
+        elif data_log.version > self.DataV3.VERSION:
+            print(f'Data file is v{data_log.version}, only up to v{self.DataV3.VERSION} is supported!')
+            data_log.close()
+            return None
+
+        return data_log
+
+
+    def __save_data_tables(self):
+        self.data_index.save(self.data)
+        self.data_aggregates.save(self.data)
+        self.__saved_compactions = self.data_log.num_compactions
 
 
     def replot_graphs(self):
-        App.StddevGraphBpm.plot_data(self, self.data)
-        App.StddevGraphDx.plot_data(self, self.data)
-        App.StddevGraphNumNotes.plot_data(self, self.data)
-        App.StddevGraphAngle.plot_data(self, self.data)
-        App.StddevGraphVel.plot_data(self, self.data)
-        App.StddevGraphSkill.plot_data(self, self.data)
-        App.StddevGraphTapDev.plot_data(self, self.data)
+        # Bursts of events replot each graph once, on the next frame. Graphs in
+        # docks that are not visible are only marked dirty and replot when raised
+        for graph in [
+            App.StddevGraphBpm,
+            App.StddevGraphDx,
+            App.StddevGraphNumNotes,
+            App.StddevGraphAngle,
+            App.StddevGraphVel,
+            App.StddevGraphSkill,
+            App.StddevGraphTapDev,
+            App.StddevGraphGrid,
+        ]:
+            self.replot_scheduler.request(graph.__name__, lambda graph=graph: graph.plot_data(self, self.data), self.graphs[graph.__name__]['dock'])
 
 
     def __update_generated_map(self):
@@ -936,7 +962,7 @@ class App(QtGui.QMainWindow):
         num   = AppConfig.cfg['repeats']
         notes = AppConfig.cfg['notes']
 
-        pattern, is_clip = App.OsuUtils.generate_pattern2(rot*math.pi/180, dx, 60/bpm, angle*math.pi/180, notes, num)
+        pattern, is_clip = self.pattern_cache.get(rot, dx, bpm, angle, notes, num)
 
         data_x = pattern[:, 0]
         data_y = -pattern[:, 1]
@@ -952,8 +978,9 @@ class App(QtGui.QMainWindow):
             widget.setEnabled(enabled)
 
 
-    def __data_file_load_handler(self, num_cols):
-        if num_cols == self.DataV1.NUM_COLS:
+    def __data_file_load_handler(self, col_names):
+        # Average columns are not present in data files converted from v1
+        if self.DataV3.COL_AVG_X not in col_names:
             self.xavg_radio_btn.hide()
             self.yavg_radio_btn.hide()
             self.tavg_radio_btn.hide()
@@ -967,7 +994,7 @@ class App(QtGui.QMainWindow):
             if True in is_checked:
                 self.xdev_radio_btn.setChecked(True)
 
-        elif num_cols == self.DataV2.NUM_COLS:
+        else:
             self.xavg_radio_btn.show()
             self.yavg_radio_btn.show()
             self.tavg_radio_btn.show()
@@ -985,6 +1012,18 @@ class App(QtGui.QMainWindow):
         self.pattern_visual.hide()
         self.data_list.hide()
 
+        print(f'Replots: {self.replot_scheduler.num_runs} ran, {self.replot_scheduler.num_dropped} of {self.replot_scheduler.num_requests} requests coalesced')
+        print(f'Patterns: {self.pattern_cache.num_hits} cached, {self.pattern_cache.num_misses} generated')
+        print(f'Maps: {self.map_generator.num_used} of {self.map_generator.num_prepared} prepared ahead used')
+
+        # Drop any curve fits still running
+        self.fit_worker.close()
+        self.map_generator.close()
+
+        # Let any pending data compaction finish
+        self.data_log.close()
+        self.__save_data_tables()
+
         # Proceed
         event.accept()
 
@@ -1,13 +1,11 @@
 import pyqtgraph
 from pyqtgraph.Qt import QtGui
-from pyqtgraph.Qt import QtCore
 
-import math
 import random
-import numpy as np
 
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 class StddevGraphAngle():
@@ -34,6 +32,9 @@ class StddevGraphAngle():
         self.__graph.setLabel('bottom', 'angle', units='deg', unitPrefix='')
         self.__graph.addLegend()
 
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
+
         # Deviation marker indicating expected deviation according to set CS
         self.__dev_marker_95 = pyqtgraph.InfiniteLine(angle=0, movable=False, pen=pyqtgraph.mkPen(color=(255, 100, 0, 100), style=pyqtgraph.QtCore.Qt.DashLine))
         self.__graph.addItem(self.__dev_marker_95, ignoreBounds=True)
@@ -88,170 +89,96 @@ class StddevGraphAngle():
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
-
-        # Select data slices by bpm
-        bpm0, bpm1 = self.__bpm_plot.get_region()
-        bpm_select = ((bpm0 <= data[:, DataRec.COL_BPM]) & (data[:, DataRec.COL_BPM] <= bpm1))
-
-        # Select data slices by distance
-        px0, px1 = self.__px_plot.get_region()
-        px_select = ((px0 <= data[:, DataRec.COL_PX]) & (data[:, DataRec.COL_PX] <= px1))
+        # Select data slices by bpm, distance and rotation
+        ranges = {
+            DataRec.COL_BPM : self.__bpm_plot.get_region(),
+            DataRec.COL_PX  : self.__px_plot.get_region(),
+            DataRec.COL_ROT : self.__rot_plot.get_region(),
+        }
 
-        # Select data slices by rotation
-        rot0, rot1 = self.__rot_plot.get_region()
-        rot_select = ((rot0 <= data[:, DataRec.COL_ROT]) & (data[:, DataRec.COL_ROT] <= rot1))
-
-        unique_bpms = np.unique(data[:, DataRec.COL_BPM])
+        unique_bpms = self.selection_cache.unique(data, DataRec.COL_BPM)
         self.__bpm_plot.plot(unique_bpms)
 
-        unique_pxs = np.unique(data[:, DataRec.COL_PX])
+        unique_pxs = self.selection_cache.unique(data, DataRec.COL_PX)
         self.__px_plot.plot(unique_pxs)
 
-        unique_rots = np.unique(data[:, DataRec.COL_ROT])
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
         self.__rot_plot.plot(unique_rots)
 
-        # Selected rotation region has no data. Nothing else to do
-        if not any(bpm_select & px_select & rot_select):
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
+
+        # Deviation vs angle points, a group for every unique BPM recorded
+        unique_bpms, groups = analytics.angle_groups(ranges, self.DEV_COLS[self.dev_select], self.avg_data_points, self.MAX_NUM_DATA_POINTS)
+
+        # Selected region has no data. Nothing else to do
+        if len(groups) == 0:
+            self.fit_worker.cancel(StddevGraphAngle.__name__)
+            self.__pool.clear()
             return
 
-        # Colored gradient r->g->b multiple plots at different osu!px
-        unique_bpms = np.unique(data[bpm_select & px_select & rot_select, DataRec.COL_BPM])
-
-        bpm_lut = pyqtgraph.ColorMap(
-            np.linspace(min(unique_bpms), max(unique_bpms), 3),
-            np.array(
-                [
-                    [  0, 100, 255, 200],
-                    [100, 255, 100, 200],
-                    [255, 100, 100, 200],
-                ]
-            )
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (angle)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (angle)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (angle)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (angle)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm)')
+
+        # Only deviations are fit. Other selections are drawn as is
+        if self.dev_select not in [ self.DEV_X, self.DEV_Y, self.DEV_XY ]:
+            self.fit_worker.cancel(StddevGraphAngle.__name__)
+            StddevGraphAngle.__draw(self, unique_bpms, groups, [ None ]*len(groups))
+            return
+
+        # Fit off the GUI thread. Replaces any fit still running for the previous selection
+        self.fit_worker.submit(StddevGraphAngle.__name__, self.fit_worker.MODEL_EXP, groups,
+            lambda fits: StddevGraphAngle.__draw(self, unique_bpms, groups, fits)
         )
 
-        # Main plot - deviation vs osu!px
+
+    def __draw(self, unique_bpms, groups, fits):
+        # Reuse plot items for redraw
+        self.__pool.begin()
+
+        # Colored gradient r->g->b multiple plots at different BPM
+        bpm_lut = PlotPool.color_map(min(unique_bpms), max(unique_bpms))
+
+        # Main plot - deviation vs angle
         # Adds a plot for every unique BPM recorded
-        for bpm in unique_bpms:
-            # Determine data selected by BPM
-            bpm_select = (data[:, DataRec.COL_BPM] == bpm)
-            data_select = bpm_select & px_select & rot_select
-            if not any(data_select):
-                # Selected region has no data. Nothing else to do
-                continue
+        for s in Analytics.angle_series(unique_bpms, groups, fits, self.model_compensation):
+            color = bpm_lut.map(s['key'], 'qcolor')
+            self.__pool.plot((s['key'], 'data'), x=s['x'], y=s['y'], symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=s['label'])
 
-            angles = data[data_select, DataRec.COL_ANGLE]
-
-            # Determine data selected by osu!px
-            if self.dev_select == self.DEV_X:
-                self.__graph.setTitle('Aim dev-x (angle)')
-                stdevs = data[data_select, DataRec.COL_STDEV_X]
-            elif self.dev_select == self.DEV_Y:
-                self.__graph.setTitle('Aim dev-y (angle)')
-                stdevs = data[data_select, DataRec.COL_STDEV_Y]
-            elif self.dev_select == self.DEV_XY:
-                self.__graph.setTitle('Aim dev-xy (angle)')
-                stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
-            elif self.dev_select == self.DEV_T:
-                self.__graph.setTitle('Aim dev-t (angle)')
-                stdevs = data[data_select, DataRec.COL_STDEV_T]
-            elif self.dev_select == self.AVG_X:
-                self.__graph.setTitle('Aim avg-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_X]
-            elif self.dev_select == self.AVG_Y:
-                self.__graph.setTitle('Aim avg-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_Y]
-            elif self.dev_select == self.AVG_T:
-                self.__graph.setTitle('Aim avg-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_T]
-                
-            if self.avg_data_points:
-                # Use best N points for data display
-                num_points = min(len(stdevs), self.MAX_NUM_DATA_POINTS)
-
-                # Average overlapping data points (those that fall on same angle)
-                stdevs = np.asarray([ np.sort(stdevs[angles == angle])[:num_points].mean() for angle in np.unique(angles) ])
-                angles = np.unique(angles)
-
-                # Get sort mapping to make points on line graph connect in proper order
-                idx_sort = np.argsort(angles)
-                angles = angles[idx_sort]
-                stdevs = stdevs[idx_sort]
-
-            # Draw plot
-            color = bpm_lut.map(bpm, 'qcolor')
-
-            if self.dev_select not in [ self.DEV_X, self.DEV_Y, self.DEV_XY ]:
-                self.__graph.plot(x=angles, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
+            if type(s['model']) == type(None):
                 continue
 
+            print(f'angle fit (y = a + be^(cx)): {s["label"]}')
+            self.__pool.plot((s['key'], 'model'), x=s['model'][0], y=s['model'][1], pen=(100, 100, 0, 150))
 
-            if self.dev_select in [ self.DEV_X, self.DEV_Y, self.DEV_XY ]:
-                try:
-                    a, b, c = MathUtils.exp_regresion(angles, stdevs)
-                    if None in (a, b, c):
-                        self.__graph.plot(x=angles, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
-                        continue
-                except np.linalg.LinAlgError:
-                    # Happens if there is perfect y=x correlation; most likely with 2 data points when collecting data
-                    self.__graph.plot(x=angles, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
-                    continue
-
-                y_model = a + b*np.exp(c*angles)
-                y_ground = stdevs - y_model
-
-                r_sq = MathUtils.r_squared(stdevs, y_model)
-                avg_win = min(5, stdevs.shape[0])
-                snr = (np.var(stdevs, ddof=1) / np.mean(np.var(np.lib.stride_tricks.sliding_window_view(stdevs, avg_win), ddof=1, axis=1)))
-                
-                x_model = np.linspace(min(angles), max(angles), 100)
-                y_model = a + b*np.exp(c*x_model)
-                
-                label = f'{bpm} bpm  r² = {r_sq:.4f}  snr={snr:.4f}  a={a:.2f}  b={b:.2f}  c={c:.5f}'
-                print(f'angle fit (y = a + be^(cx)): {label}')
-            
-
-            '''
-            if self.dev_select in [ self.DEV_X, self.DEV_Y, self.DEV_XY ]:
-                b, c = MathUtils.linear_regresion(angles, stdevs)
-                if None in (b, c):
-                    self.__graph.plot(x=angles, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
-                    continue
-
-                y_model = b*angles + c
-                y_ground = stdevs - y_model
-
-                r_sq = MathUtils.r_squared(stdevs, y_model)
-                snr = np.std(stdevs) / np.std(stdevs - y_model)
-
-                x_model = np.linspace(min(angles), max(angles), 100)
-                y_model = b*x_model + c
-                
-                label = f'{bpm} bpm  r² = {r_sq:.4f}  snr={snr:.4f}  b={b:.4f}  c={c:.5f}'
-                print(f'angle fit (y = bx + c): {label}')
-            ''' 
-
-            if self.model_compensation:
-                self.__graph.plot(x=angles, y=y_ground, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=label)
-                self.__graph.plot(x=[0, max(angles)], y=[0, 0], pen=(100, 100, 0, 150))
-            else:
-                self.__graph.plot(x=angles, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=label)
-                self.__graph.plot(x=x_model, y=y_model, pen=(100, 100, 0, 150))  
+        self.__pool.end()
 
 
     def __bpm_region_event(self):
         # When the selection on bpm plot changes, reprocess main graph
-        StddevGraphAngle.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphAngle.__name__, lambda: StddevGraphAngle.plot_data(self, self.data))
 
     
     def __px_region_event(self):
         # When the selection on distance plot changes, reprocess main graph
-        StddevGraphAngle.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphAngle.__name__, lambda: StddevGraphAngle.plot_data(self, self.data))
 
 
     def __rot_region_event(self):
         # When the selection on rotation plot changes, reprocess main graph
-        StddevGraphAngle.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphAngle.__name__, lambda: StddevGraphAngle.plot_data(self, self.data))
 
 
     def set_dev(self, dev):
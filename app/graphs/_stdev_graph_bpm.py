@@ -2,11 +2,11 @@ import pyqtgraph
 from pyqtgraph.Qt import QtGui
 
 import math
-import numpy as np
 import random
 
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 class StddevGraphBpm():
@@ -32,6 +32,9 @@ class StddevGraphBpm():
         self.__graph.setLabel('left', 'deviation', units='σ', unitPrefix='')
         self.__graph.setLabel('bottom', 'bpm', units='1/(60*s)', unitPrefix='')
         self.__graph.addLegend()
+
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
         self.__graph.getPlotItem().legend.setBrush(pyqtgraph.mkBrush(53, 54, 70, 150))
 
         # Deviation marker indicating expected deviation according to set CS
@@ -93,123 +96,71 @@ class StddevGraphBpm():
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
-
-        # Select data slices by angle
-        ang0, ang1 = self.__ang_plot.get_region()
-        ang_select = ((ang0 <= data[:, DataRec.COL_ANGLE]) & (data[:, DataRec.COL_ANGLE] <= ang1))
-
-        # Select data slices by distance
-        px0, px1 = self.__px_plot.get_region()
-        px_select = ((px0 <= data[:, DataRec.COL_PX]) & (data[:, DataRec.COL_PX] <= px1))
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-        # Select data slices by rotation
-        rot0, rot1 = self.__rot_plot.get_region()
-        rot_select = ((rot0 <= data[:, DataRec.COL_ROT]) & (data[:, DataRec.COL_ROT] <= rot1))
-
-        # Select data slices by number of notes
-        num0, num1 = self.__num_plot.get_region()
-        num_select = ((num0 <= data[:, DataRec.COL_NUM]) & (data[:, DataRec.COL_NUM] <= num1))
+        # Select data slices by angle, distance, rotation and number of notes
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_PX    : self.__px_plot.get_region(),
+            DataRec.COL_ROT   : self.__rot_plot.get_region(),
+            DataRec.COL_NUM   : self.__num_plot.get_region(),
+        }
 
         # Draw available rotation points on the plot to the right   
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
         self.__ang_plot.plot(unique_angs)
 
-        unique_pxs = np.unique(data[:, DataRec.COL_PX])
+        unique_pxs = self.selection_cache.unique(data, DataRec.COL_PX)
         self.__px_plot.plot(unique_pxs)
 
-        unique_rots = np.unique(data[:, DataRec.COL_ROT])
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
         self.__rot_plot.plot(unique_rots)
 
-        unique_nums = np.unique(data[:, DataRec.COL_NUM])
+        unique_nums = self.selection_cache.unique(data, DataRec.COL_NUM)
         self.__num_plot.plot(unique_nums)
 
-        # Selected rotation region has no data. Nothing else to do
-        if not any(ang_select & px_select & rot_select & num_select):
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
+
+        # Main plot - deviation vs BPM
+        # A series for every unique osu!px recorded
+        series = analytics.bpm(ranges, self.DEV_COLS[self.dev_select], self.avg_data_points, self.MAX_NUM_DATA_POINTS, self.model_compensation)
+
+        # Selected region has no data. Nothing else to do
+        if len(series) == 0:
+            self.__pool.end()
             return
 
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (bpm)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (bpm)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (bpm)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (bpm)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm)')
+
         # Colored gradient r->g->b multiple plots at different osu!px
-        unique_pxs = np.unique(data[rot_select & px_select & ang_select & num_select, DataRec.COL_PX])
-
-        px_lut = pyqtgraph.ColorMap(
-            np.linspace(min(unique_pxs), max(unique_pxs), 3),
-            np.array(
-                [
-                    [  0, 100, 255, 200],
-                    [100, 255, 100, 200],
-                    [255, 100, 100, 200],
-                ]
-            )
-        )
+        unique_pxs = [ s['key'] for s in series ]
+        px_lut = PlotPool.color_map(min(unique_pxs), max(unique_pxs))
 
-        # Main plot - deviation vs BPM
-        # Adds a plot for every unique osu!px recorded
-        for px in unique_pxs:
-            # Extract data
-            px_select = (data[:, DataRec.COL_PX] == px)
-            data_select = px_select & ang_select & rot_select & num_select
-            if not any(px_select):
-                # Selected region has no data. Nothing else to do
-                continue
-
-            bpms = data[data_select, DataRec.COL_BPM]
-
-            # Determine data selected by osu!px
-            if self.dev_select == self.DEV_X:
-                self.__graph.setTitle('Aim dev-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_STDEV_X]
-            elif self.dev_select == self.DEV_Y:
-                self.__graph.setTitle('Aim dev-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_STDEV_Y]
-            elif self.dev_select == self.DEV_XY:
-                self.__graph.setTitle('Aim dev-xy (bpm)')
-                stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
-            elif self.dev_select == self.DEV_T:
-                self.__graph.setTitle('Aim dev-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_STDEV_T]
-            elif self.dev_select == self.AVG_X:
-                self.__graph.setTitle('Aim avg-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_X]
-            elif self.dev_select == self.AVG_Y:
-                self.__graph.setTitle('Aim avg-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_Y]
-            elif self.dev_select == self.AVG_T:
-                self.__graph.setTitle('Aim avg-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_T]
-            
-            if self.avg_data_points:
-                # Use best N points for data display
-                num_points = min(len(stdevs), self.MAX_NUM_DATA_POINTS)
-
-                # Average overlapping data points (those that fall on same bpm)
-                stdevs = np.asarray([ np.sort(stdevs[bpms == bpm])[:num_points].mean() for bpm in np.unique(bpms) ])
-                bpms = np.unique(bpms)
-
-                # Get sort mapping to make points on line graph connect in proper order
-                idx_sort = np.argsort(bpms)
-                bpms = bpms[idx_sort]
-                stdevs = stdevs[idx_sort]
-
-            # Draw plot
-            color = px_lut.map(px, 'qcolor')
-            
-            m, b = MathUtils.linear_regresion(bpms, stdevs)
-            if type(m) == type(None) or type(b) == type(None):
-                # Linear regression failed, just plot the points
-                self.__graph.plot(x=bpms, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{px} osu!px')
-                continue
-
-            if self.model_compensation:
-                y_model = m*bpms + b
-                self.__graph.plot(x=bpms, y=stdevs - y_model, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{px} osu!px   σ = {np.std(stdevs - y_model):.2f}  m={m:.5f}  b={b:.2f}')
-            else:
-                self.__graph.plot(x=bpms, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{px} osu!px')
+        for s in series:
+            color = px_lut.map(s['key'], 'qcolor')
+            self.__pool.plot(s['key'], x=s['x'], y=s['y'], symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=s['label'])
+
+        self.__pool.end()
 
     
     def __region_event(self):
         # When the selection plot changes, reprocess main graph
-        StddevGraphBpm.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphBpm.__name__, lambda: StddevGraphBpm.plot_data(self, self.data))
 
 
     def set_dev(self, dev):
@@ -1,12 +1,11 @@
 import pyqtgraph
 from pyqtgraph.Qt import QtGui
 
-import math
-import numpy as np
 import random
 
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 
@@ -32,6 +31,9 @@ class StddevGraphDx():
         self.__graph.setLabel('left', 'deviation', units='σ', unitPrefix='')
         self.__graph.setLabel('bottom', 'distance', units='osu!px', unitPrefix='')
         self.__graph.addLegend()
+
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
         self.__graph.getPlotItem().legend.setBrush(pyqtgraph.mkBrush(53, 54, 70, 150))
         
         # Deviation marker indicating expected deviation according to set CS
@@ -82,126 +84,77 @@ class StddevGraphDx():
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
-
-        # Select data slices by angle
-        ang0, ang1 = self.__ang_plot.get_region()
-        ang_select = ((ang0 <= data[:, DataRec.COL_ANGLE]) & (data[:, DataRec.COL_ANGLE] <= ang1))
-
-        # Select data slices by bpm
-        bpm0, bpm1 = self.__bpm_plot.get_region()
-        bpm_select = ((bpm0 <= data[:, DataRec.COL_BPM]) & (data[:, DataRec.COL_BPM] <= bpm1))
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-        # Select data slices by rotation
-        rot0, rot1 = self.__rot_plot.get_region()
-        rot_select = ((rot0 <= data[:, DataRec.COL_ROT]) & (data[:, DataRec.COL_ROT] <= rot1))
+        # Select data slices by angle, bpm and rotation
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_BPM   : self.__bpm_plot.get_region(),
+            DataRec.COL_ROT   : self.__rot_plot.get_region(),
+        }
 
         # Draw available rotation points on the plot to the right
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
         self.__ang_plot.plot(unique_angs)
 
-        unique_bpms = np.unique(data[:, DataRec.COL_BPM])
+        unique_bpms = self.selection_cache.unique(data, DataRec.COL_BPM)
         self.__bpm_plot.plot(unique_bpms)
 
-        unique_rots = np.unique(data[:, DataRec.COL_ROT])
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
         self.__rot_plot.plot(unique_rots)
     
-        # Selected rotation region has no data. Nothing else to do
-        if not any(ang_select & bpm_select & rot_select):
-            return
-
-        # Colored gradient r->g->b multiple plots at different osu!px
-        unique_bpms = np.unique(data[ang_select & bpm_select & rot_select, DataRec.COL_BPM])
-        #unique_bpms = unique_bpms[::max(1, math.ceil(unique_bpms.shape[0]/5))]  # Limit display to 5 or 6 plots
-
-        bpm_lut = pyqtgraph.ColorMap(
-            np.linspace(min(unique_bpms), max(unique_bpms), 3),
-            np.array(
-                [
-                    [  0, 100, 255, 200],
-                    [100, 255, 100, 200],
-                    [255, 100, 100, 200],
-                ]
-            )
-        )
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
 
         # Main plot - deviation vs osu!px
-        # Adds a plot for every unique BPM recorded
-        for bpm in unique_bpms:
-            # Determine data selected by BPM
-            bpm_select = (data[:, DataRec.COL_BPM] == bpm)
-            data_select = bpm_select & rot_select & ang_select
-            if not any(data_select):
-                # Selected region has no data. Nothing else to do
-                continue
-                
-            pxs = data[data_select, DataRec.COL_PX]
-
-            # Determine data selected by osu!px
-            if self.dev_select == self.DEV_X:
-                self.__graph.setTitle('Aim dev-x (px)')
-                stdevs = data[data_select, DataRec.COL_STDEV_X]
-            elif self.dev_select == self.DEV_Y:
-                self.__graph.setTitle('Aim dev-y (px)')
-                stdevs = data[data_select, DataRec.COL_STDEV_Y]
-            elif self.dev_select == self.DEV_XY:
-                self.__graph.setTitle('Aim dev-xy (px)')
-                stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
-            elif self.dev_select == self.DEV_T:
-                self.__graph.setTitle('Aim dev-t (px)')
-                stdevs = data[data_select, DataRec.COL_STDEV_T]
-            elif self.dev_select == self.AVG_X:
-                self.__graph.setTitle('Aim avg-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_X]
-            elif self.dev_select == self.AVG_Y:
-                self.__graph.setTitle('Aim avg-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_Y]
-            elif self.dev_select == self.AVG_T:
-                self.__graph.setTitle('Aim avg-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_T]
-                
-            if self.avg_data_points:
-                # Use best N points for data display
-                num_points = min(len(stdevs), self.MAX_NUM_DATA_POINTS)
-
-                # Average overlapping data points (those that fall on same px)
-                stdevs = np.asarray([ np.sort(stdevs[pxs == px])[:num_points].mean() for px in np.unique(pxs) ])
-                pxs = np.unique(pxs)
-            
-                # Get sort mapping to make points on line graph connect in proper order
-                idx_sort = np.argsort(pxs)
-                pxs = pxs[idx_sort]
-                stdevs = stdevs[idx_sort]
-
-            # Draw plot
-            color = bpm_lut.map(bpm, 'qcolor')
-
-            m, b = MathUtils.linear_regresion(pxs, stdevs)
-            if type(m) == type(None) or type(b) == type(None):
-                self.__graph.plot(x=pxs, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
-                continue
-
-            if self.model_compensation:
-                y_model = m*pxs + b
-                self.__graph.plot(x=pxs, y=stdevs - y_model, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm   σ = {np.std(stdevs - y_model):.2f}  m={m:.5f}  b={b:.2f}')
-            else:
-                self.__graph.plot(x=pxs, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
+        # A series for every unique BPM recorded
+        series = analytics.dx(ranges, self.DEV_COLS[self.dev_select], self.avg_data_points, self.MAX_NUM_DATA_POINTS, self.model_compensation)
+
+        # Selected region has no data. Nothing else to do
+        if len(series) == 0:
+            self.__pool.end()
+            return
+
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (px)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (px)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (px)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (px)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm)')
+
+        # Colored gradient r->g->b multiple plots at different BPM
+        unique_bpms = [ s['key'] for s in series ]
+        bpm_lut = PlotPool.color_map(min(unique_bpms), max(unique_bpms))
+
+        for s in series:
+            color = bpm_lut.map(s['key'], 'qcolor')
+            self.__pool.plot(s['key'], x=s['x'], y=s['y'], symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=s['label'])
+
+        self.__pool.end()
 
     
     def __angle_region_event(self):
         # When the selection on angle plot changes, reprocess main graph
-        StddevGraphDx.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphDx.__name__, lambda: StddevGraphDx.plot_data(self, self.data))
 
 
     def __bpm_region_event(self):
         # When the selection on bpm plot changes, reprocess main graph
-        StddevGraphDx.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphDx.__name__, lambda: StddevGraphDx.plot_data(self, self.data))
 
 
     def __rot_region_event(self):
         # When the selection on rotation plot changes, reprocess main graph
-        StddevGraphDx.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphDx.__name__, lambda: StddevGraphDx.plot_data(self, self.data))
 
 
     def set_dev(self, dev):
@@ -0,0 +1,169 @@
+import pyqtgraph
+from pyqtgraph.Qt import QtGui
+
+import numpy as np
+
+from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
+
+
+
+class StddevGraphGrid():
+
+    BPM_EDGES = np.arange(0, 1200 + 10, 10)  # bpm bins, 10 bpm wide
+    PX_EDGES  = np.arange(0, 512 + 16, 16)   # osu!px bins, 16 osu!px wide
+
+    MAX_CACHED = 16  # Grids kept per data version
+
+    def __init__(self, pos, relative_to=None, dock_name=''):
+        self.__id = __class__.__name__
+        self._create_graph(
+            graph_id    = self.__id,
+            pos         = pos,
+            relative_to = relative_to,
+            dock_name   = dock_name,
+            widget      = QtGui.QWidget(),
+        )
+
+        # Deviation over bpm × spacing graph
+        self.__graph = pyqtgraph.PlotWidget(title='Aim dev-x (bpm × px)')
+        self.__graph.getPlotItem().getAxis('left').enableAutoSIPrefix(False)
+        self.__graph.getPlotItem().getAxis('bottom').enableAutoSIPrefix(False)
+        self.__graph.enableAutoRange(axis='x', enable=False)
+        self.__graph.enableAutoRange(axis='y', enable=False)
+        self.__graph.setLimits(xMin=0, xMax=1200, yMin=0, yMax=512)
+        self.__graph.setRange(xRange=[0, 500], yRange=[0, 512])
+        self.__graph.setLabel('left', 'distance', units='osu!px', unitPrefix='')
+        self.__graph.setLabel('bottom', 'bpm', units='1/(60*s)', unitPrefix='')
+
+        # Cells are drawn as an RGBA image scaled to the bin sizes, with empty cells transparent
+        self.__image = pyqtgraph.ImageItem(axisOrder='col-major')
+        self.__image.setTransform(QtGui.QTransform().translate(StddevGraphGrid.BPM_EDGES[0], StddevGraphGrid.PX_EDGES[0]).scale(
+            StddevGraphGrid.BPM_EDGES[1] - StddevGraphGrid.BPM_EDGES[0],
+            StddevGraphGrid.PX_EDGES[1]  - StddevGraphGrid.PX_EDGES[0]
+        ))
+        self.__graph.addItem(self.__image)
+
+        # Range of values the colors span
+        self.__text = pyqtgraph.TextItem('', anchor=(0, 0))
+        self.__text.setParentItem(self.__graph.getPlotItem().getViewBox())
+        self.__text.setPos(5, 5)
+
+        # Grids computed for the current data version
+        self.__cache = {}
+        self.__cache_version = None
+
+        # Interactive region plot to the right to select angle between notes in data
+        self.__ang_plot = SelectPlot(
+            view_min = 0, view_max = 180,
+            val_min  = 0, val_max  = 180,
+            init_min = 0, init_max = 180,
+            label = 'Angle',
+            region_event = lambda: StddevGraphGrid.__region_event(self)
+        )
+
+        # Interactive region plot to the right to select angle of rotation in data
+        self.__rot_plot = SelectPlot(
+            view_min = 0,  view_max = 180,
+            val_min  = 0,  val_max  = 180,
+            init_min = 0,  init_max = 30,
+            label = 'Rot',
+            region_event = lambda: StddevGraphGrid.__region_event(self)
+        )
+
+        # Put it all together
+        self.__layout = QtGui.QHBoxLayout(self.graphs[self.__id]['widget'])
+        self.__layout.setContentsMargins(0, 0, 0, 0)
+        self.__layout.setSpacing(2)
+        self.__layout.addWidget(self.__graph)
+        self.__layout.addWidget(self.__ang_plot)
+        self.__layout.addWidget(self.__rot_plot)
+
+
+    def plot_data(self, data):
+        if data.shape[0] == 0:
+            return
+
+        DataRec = self.DataVer
+
+        # Select data slices by angle and rotation
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_ROT   : self.__rot_plot.get_region(),
+        }
+
+        # Draw available points on the plots to the right
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
+        self.__ang_plot.plot(unique_angs)
+
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
+        self.__rot_plot.plot(unique_rots)
+
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (bpm × px)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (bpm × px)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (bpm × px)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (bpm × px)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm × px)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm × px)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm × px)')
+
+        grid = StddevGraphGrid.__get_grid(self, data, ranges)
+
+        mean  = grid['mean']
+        empty = np.isnan(mean)
+        if np.all(empty):
+            self.__image.clear()
+            self.__text.setText('')
+            return
+
+        # Colored gradient r->g->b from the lowest to the highest cell
+        val_min = np.min(mean[~empty])
+        val_max = np.max(mean[~empty])
+        if val_min == val_max:
+            val_max = val_min + 1
+
+        # Ranges are continuous here, so the color map is not taken from the shared cache
+        color_map = pyqtgraph.ColorMap(np.linspace(val_min, val_max, 3), PlotPool.COLORS)
+
+        colors = color_map.map(np.where(empty, val_min, mean).reshape(-1), 'byte')
+        colors = colors.reshape(mean.shape + (4,))
+        colors[empty, 3] = 0
+
+        self.__image.setImage(colors, autoLevels=False)
+        self.__text.setText(f'{val_min:.2f} (blue) .. {val_max:.2f} (red)')
+
+
+    def __get_grid(self, data, ranges):
+        # Grids only change when records are added or a different data file is loaded
+        if self.__cache_version != self.selection_cache.version:
+            self.__cache = {}
+            self.__cache_version = self.selection_cache.version
+
+        key = (tuple((col, tuple(bounds)) for col, bounds in sorted(ranges.items())), self.dev_select, self.avg_data_points)
+
+        try: return self.__cache[key]
+        except KeyError:
+            pass
+
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
+        grid = analytics.grid(ranges, self.DEV_COLS[self.dev_select], StddevGraphGrid.BPM_EDGES, StddevGraphGrid.PX_EDGES, self.avg_data_points, self.MAX_NUM_DATA_POINTS)
+
+        if len(self.__cache) >= StddevGraphGrid.MAX_CACHED:
+            del self.__cache[next(iter(self.__cache))]
+
+        self.__cache[key] = grid
+        return grid
+
+
+    def __region_event(self):
+        # When the selection plot changes, reprocess main graph
+        self.replot_scheduler.request(StddevGraphGrid.__name__, lambda: StddevGraphGrid.plot_data(self, self.data))
@@ -2,11 +2,11 @@ import pyqtgraph
 from pyqtgraph.Qt import QtGui
 
 import math
-import numpy as np
 import random
 
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 class StddevGraphNumNotes():
@@ -32,6 +32,9 @@ class StddevGraphNumNotes():
         self.__graph.setLabel('left', 'deviation', units='σ', unitPrefix='')
         self.__graph.setLabel('bottom', '# of notes', units='#', unitPrefix='')
         self.__graph.addLegend()
+
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
         self.__graph.getPlotItem().legend.setBrush(pyqtgraph.mkBrush(53, 54, 70, 150))
 
         # Deviation marker indicating expected deviation according to set CS
@@ -93,109 +96,82 @@ class StddevGraphNumNotes():
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
-
-        # Select data slices by angle
-        ang0, ang1 = self.__ang_plot.get_region()
-        ang_select = ((ang0 <= data[:, DataRec.COL_ANGLE]) & (data[:, DataRec.COL_ANGLE] <= ang1))
-
-        # Select data slices by distance
-        px0, px1 = self.__px_plot.get_region()
-        px_select = ((px0 <= data[:, DataRec.COL_PX]) & (data[:, DataRec.COL_PX] <= px1))
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-        # Select data slices by bpm
-        bpm0, bpm1 = self.__bpm_plot.get_region()
-        bpm_select = ((bpm0 <= data[:, DataRec.COL_BPM]) & (data[:, DataRec.COL_BPM] <= bpm1))
-
-        # Select data slices by rotation
-        rot0, rot1 = self.__rot_plot.get_region()
-        rot_select = ((rot0 <= data[:, DataRec.COL_ROT]) & (data[:, DataRec.COL_ROT] <= rot1))
+        # Select data slices by angle, distance, bpm and rotation
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_PX    : self.__px_plot.get_region(),
+            DataRec.COL_BPM   : self.__bpm_plot.get_region(),
+            DataRec.COL_ROT   : self.__rot_plot.get_region(),
+        }
 
         # Draw available rotation points on the plot to the right   
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
         self.__ang_plot.plot(unique_angs)
 
-        unique_pxs = np.unique(data[:, DataRec.COL_PX])
+        unique_pxs = self.selection_cache.unique(data, DataRec.COL_PX)
         self.__px_plot.plot(unique_pxs)
 
-        unique_bpms = np.unique(data[:, DataRec.COL_BPM])
+        unique_bpms = self.selection_cache.unique(data, DataRec.COL_BPM)
         self.__bpm_plot.plot(unique_bpms)
 
-        unique_rots = np.unique(data[:, DataRec.COL_ROT])
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
         self.__rot_plot.plot(unique_rots)
 
-        # Selected rotation region has no data. Nothing else to do
-        if not any(ang_select & px_select & bpm_select & rot_select):
-            return
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
 
-        # Determine data selected by BPM
-        data_select = ang_select & px_select & bpm_select & rot_select
-        if not any(bpm_select):
-            # Selected region has no data. Nothing else to do
+        # Deviation vs number of notes. When averaging, overlapping data points (those that fall on same # of notes) are averaged
+        series = analytics.num_notes(ranges, self.DEV_COLS[self.dev_select], self.avg_data_points, self.MAX_NUM_DATA_POINTS)
+
+        # Selected region has no data. Nothing else to do
+        if len(series) == 0:
+            self.__pool.end()
             return
 
-        # Determine data selected by osu!px
+        # Title according to selected deviation
         if self.dev_select == self.DEV_X:
             self.__graph.setTitle('Aim dev-x (bpm)')
-            stdevs = data[data_select, DataRec.COL_STDEV_X]
         elif self.dev_select == self.DEV_Y:
             self.__graph.setTitle('Aim dev-y (bpm)')
-            stdevs = data[data_select, DataRec.COL_STDEV_Y]
         elif self.dev_select == self.DEV_XY:
             self.__graph.setTitle('Aim dev-xy (bpm)')
-            stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
         elif self.dev_select == self.DEV_T:
             self.__graph.setTitle('Aim dev-t (bpm)')
-            stdevs = data[data_select, DataRec.COL_STDEV_T]
         elif self.dev_select == self.AVG_X:
             self.__graph.setTitle('Aim avg-x (bpm)')
-            stdevs = data[data_select, DataRec.COL_AVG_X]
         elif self.dev_select == self.AVG_Y:
             self.__graph.setTitle('Aim avg-y (bpm)')
-            stdevs = data[data_select, DataRec.COL_AVG_Y]
         elif self.dev_select == self.AVG_T:
             self.__graph.setTitle('Aim avg-t (bpm)')
-            stdevs = data[data_select, DataRec.COL_AVG_T]
-            
-        num_notes = data[data_select, DataRec.COL_NUM]
-
-        if self.avg_data_points:
-            # Average all displayed data points
-            num_points = len(stdevs)
-
-            # Average overlapping data points (those that fall on same angle)
-            stdevs = np.asarray([ np.sort(stdevs[num_notes == num_note])[:num_points].mean() for num_note in np.unique(num_notes) ])
-            num_notes = np.unique(num_notes)
-
-            # Get sort mapping to make points on line graph connect in proper order
-            idx_sort = np.argsort(num_notes)
-            num_notes = num_notes[idx_sort]
-            stdevs = stdevs[idx_sort]
 
         # Draw plot
         color = (  0, 100, 255, 200)
-        self.__graph.plot(x=num_notes, y=stdevs, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color)
+        for s in series:
+            self.__pool.plot(s['key'], x=s['x'], y=s['y'], symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color)
+
+        self.__pool.end()
     
 
     def __angle_region_event(self):
         # When the selection on angle plot changes, reprocess main graph
-        StddevGraphNumNotes.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphNumNotes.__name__, lambda: StddevGraphNumNotes.plot_data(self, self.data))
 
 
     def __bpm_region_event(self):
         # When the selection on number of notes plot changes, reprocess main graph
-        StddevGraphNumNotes.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphNumNotes.__name__, lambda: StddevGraphNumNotes.plot_data(self, self.data))
 
 
     def __px_region_event(self):
         # When the selection on distance plot changes, reprocess main graph
-        StddevGraphNumNotes.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphNumNotes.__name__, lambda: StddevGraphNumNotes.plot_data(self, self.data))
 
 
     def __rot_region_event(self):
         # When the selection on rotation plot changes, reprocess main graph
-        StddevGraphNumNotes.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphNumNotes.__name__, lambda: StddevGraphNumNotes.plot_data(self, self.data))
 
 
     def set_dev(self, dev):
@@ -1,11 +1,10 @@
 import pyqtgraph
 from pyqtgraph.Qt import QtGui
-from pyqtgraph.Qt import QtCore
 
-import math
 import numpy as np
 
-from app.misc._utils import MathUtils
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 class StddevGraphSkill():
@@ -32,6 +31,9 @@ class StddevGraphSkill():
         self.__graph.setLabel('bottom', 'angle', units='deg', unitPrefix='')
         self.__graph.addLegend()
 
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
+
         self.__error_bars = pyqtgraph.ErrorBarItem(beam=0.5)
         self.__graph.addItem(self.__error_bars)
 
@@ -45,98 +47,49 @@ class StddevGraphSkill():
         if data.shape[0] == 0:
             return
 
-        DataRec = self.DataVer
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (vel)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (vel)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (vel)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (vel)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm)')
+
+        # Deviation vs velocity points of all data, a group for every unique angle recorded
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
+        unique_angs, groups = analytics.skill_groups(self.DEV_COLS[self.dev_select])
+
+        # Fit off the GUI thread. Replaces any fit still running for the previous data
+        self.fit_worker.submit(StddevGraphSkill.__name__, self.fit_worker.MODEL_LINEAR, groups,
+            lambda fits: StddevGraphSkill.__draw(self, unique_angs, fits)
+        )
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
 
-        # Colored gradient r->g->b multiple plots at different angles
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
-        if unique_angs.shape[0] == 0:
-            # Data selection empty
-            return
+    def __draw(self, unique_angs, fits):
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-        unique_angs = np.sort(unique_angs)
-        plot_data = np.zeros((unique_angs.shape[0], 3))
-
-        # Adds a plot for every unique BPM recorded
-        for angle, i in zip(unique_angs, range(data.shape[0])):
-            # Determine data selected by angle
-            ang_select = (data[:, DataRec.COL_ANGLE] == angle)
-            data_select = ang_select
-            if not any(data_select):
-                # Selected region has no data. Nothing else to do
-                plot_data[i, 0] = np.nan
-                continue
-
-            # Extract relavent data
-            if self.dev_select == self.DEV_X:
-                self.__graph.setTitle('Aim dev-x (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_X]
-            elif self.dev_select == self.DEV_Y:
-                self.__graph.setTitle('Aim dev-y (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_Y]
-            elif self.dev_select == self.DEV_XY:
-                self.__graph.setTitle('Aim dev-xy (vel)')
-                stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
-            elif self.dev_select == self.DEV_T:
-                self.__graph.setTitle('Aim dev-t (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_T]
-            elif self.dev_select == self.AVG_X:
-                self.__graph.setTitle('Aim avg-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_X]
-            elif self.dev_select == self.AVG_Y:
-                self.__graph.setTitle('Aim avg-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_Y]
-            elif self.dev_select == self.AVG_T:
-                self.__graph.setTitle('Aim avg-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_T]
-                
-            pxs = data[data_select, DataRec.COL_PX]
-            bpms = data[data_select, DataRec.COL_BPM]
-
-            # Velocity
-            vels = pxs*bpms/60
-
-            # Calc linear regression
-            m, b = MathUtils.linear_regresion(vels, stdevs)
-            if type(m) == type(None) or type(b) == type(None):
-                plot_data[i, 0] = np.nan
-                continue
-
-            # Record slope and angle
-            plot_data[i, 0] = angle
-            plot_data[i, 1] = m*2*1000
-
-            if stdevs.shape[0] < 2:
-                plot_data[i, 2] = np.nan
-                continue
-
-            # Calc and record standard error
-            y_model = m*vels + b                # model: y = mx + b
-            x_model = (stdevs - b)/m            # model: x = (y - b)/m
-
-            m_dev_y = np.std(stdevs - y_model)  # deviation of y from model
-            m_dev_x = np.std(vels - x_model)    # deviation of x from model
-
-            if m_dev_x == 0:
-                plot_data[i, 2] = np.nan
-                continue
-
-            # Standard error of slope @ 95% confidence interval
-            m_se_95 = (m_dev_y/m_dev_x)/math.sqrt(stdevs.shape[0] - 2)*1.96
-            plot_data[i, 2] = m_se_95*2*1000
-
-        # Plot slope vs angle
-        plot_data = plot_data[~np.isnan(plot_data[:, 0])]  # Remove nan
-        if plot_data.shape[0] == 0:
+        # Slope vs angle for every unique angle that could be fit
+        series = Analytics.skill_series(unique_angs, fits)
+        if len(series) == 0:
+            self.__pool.end()
             return
 
-        self.__graph.plot(x=plot_data[:, 0], y=plot_data[:, 1], pen='y')
+        slope = series[0]
+        self.__pool.plot('slope', x=slope['x'], y=slope['y'], pen='y')
+        self.__pool.end()
 
         # Plot error bars
-        plot_data = plot_data[~np.isnan(plot_data[:, 2])]  # Remove nan
-        if plot_data.shape[0] == 0:
+        err_select = ~np.isnan(slope['err'])  # Remove nan
+        if not np.any(err_select):
             return
 
-        self.__error_bars.setData(x=plot_data[:, 0], y=plot_data[:, 1], top=plot_data[:, 2], bottom=plot_data[:, 2]) 
\ No newline at end of file
+        self.__error_bars.setData(x=slope['x'][err_select], y=slope['y'][err_select], top=slope['err'][err_select], bottom=slope['err'][err_select])
@@ -2,11 +2,11 @@ import pyqtgraph
 from pyqtgraph.Qt import QtGui
 
 import math
-import numpy as np
 import random
 
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 
@@ -32,6 +32,9 @@ class StddevGraphTapDev():
         self.__graph.setLabel('left', 'aim average x-pos', units='osu!px', unitPrefix='')
         self.__graph.setLabel('bottom', 'tap deviation', units='ms', unitPrefix='')
         self.__graph.addLegend()
+
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
         self.__graph.getPlotItem().legend.setBrush(pyqtgraph.mkBrush(53, 54, 70, 150))
 
         # Text
@@ -85,93 +88,60 @@ class StddevGraphTapDev():
         if data.shape[0] == 0:
             return
 
-        if self.DataVer == self.DataV1:
+        if self.DataVer.COL_AVG_X not in data.dtype.names:
             self.__graph_text.setText('Unable to display data for v1 data')
-            self.__graph.clearPlots()
+            self.__pool.clear()
             return
         else:
             self.__graph_text.setText('')
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
-
-        # Select data slices by angle
-        ang0, ang1 = self.__ang_plot.get_region()
-        ang_select = ((ang0 <= data[:, DataRec.COL_ANGLE]) & (data[:, DataRec.COL_ANGLE] <= ang1))
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-        # Select data slices by bpm
-        bpm0, bpm1 = self.__bpm_plot.get_region()
-        bpm_select = ((bpm0 <= data[:, DataRec.COL_BPM]) & (data[:, DataRec.COL_BPM] <= bpm1))
-
-        # Select data slices by distance
-        px0, px1 = self.__px_plot.get_region()
-        px_select = ((px0 <= data[:, DataRec.COL_PX]) & (data[:, DataRec.COL_PX] <= px1))
+        # Select data slices by angle, bpm and distance
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_BPM   : self.__bpm_plot.get_region(),
+            DataRec.COL_PX    : self.__px_plot.get_region(),
+        }
 
         # Draw available rotation points on the plot to the right
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
         self.__ang_plot.plot(unique_angs)
 
-        unique_bpms = np.unique(data[:, DataRec.COL_BPM])
+        unique_bpms = self.selection_cache.unique(data, DataRec.COL_BPM)
         self.__bpm_plot.plot(unique_bpms)
 
-        unique_pxs = np.unique(data[:, DataRec.COL_PX])
+        unique_pxs = self.selection_cache.unique(data, DataRec.COL_PX)
         self.__px_plot.plot(unique_pxs)
     
-        # Selected rotation region has no data. Nothing else to do
-        if not any(ang_select & bpm_select & px_select):
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
+
+        # Main plot - avg-x vs dev-t
+        # A series for every unique BPM recorded
+        series = analytics.tap_dev(ranges, self.avg_data_points, self.MAX_NUM_DATA_POINTS)
+
+        # Selected region has no data. Nothing else to do
+        if len(series) == 0:
+            self.__pool.end()
             return
 
-        # Colored gradient r->g->b multiple plots at different osu!px
-        unique_bpms = np.unique(data[ang_select & bpm_select & px_select, DataRec.COL_BPM])
-
-        bpm_lut = pyqtgraph.ColorMap(
-            np.linspace(min(unique_bpms), max(unique_bpms), 3),
-            np.array(
-                [
-                    [  0, 100, 255, 200],
-                    [100, 255, 100, 200],
-                    [255, 100, 100, 200],
-                ]
-            )
-        )
+        # Colored gradient r->g->b multiple plots at different BPM
+        unique_bpms = [ s['key'] for s in series ]
+        bpm_lut = PlotPool.color_map(min(unique_bpms), max(unique_bpms))
+
+        for s in series:
+            color = bpm_lut.map(s['key'], 'qcolor')
+            self.__pool.plot(s['key'], x=s['x'], y=s['y'], symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=s['label'])
 
-        # Main plot - deviation vs osu!px
-        # Adds a plot for every unique BPM recorded
-        for bpm in unique_bpms:
-            # Determine data selected by BPM
-            bpm_select = (data[:, DataRec.COL_BPM] == bpm)
-            data_select = bpm_select & px_select & ang_select
-            if not any(data_select):
-                # Selected region has no data. Nothing else to do
-                continue
-
-            # Determine data selected by osu!px
-            data_y = data[data_select, DataRec.COL_AVG_X]
-            data_x = data[data_select, DataRec.COL_STDEV_T]
-                
-            if self.avg_data_points:
-                # Use best N points for data display
-                num_points = min(len(data_y), self.MAX_NUM_DATA_POINTS)
-
-                # Average overlapping data points (those that fall on same px)
-                data_y = np.asarray([ np.sort(data_y[data_x == x])[:num_points].mean() for x in np.unique(data_x) ])
-                data_x = np.unique(data_x)
-            
-                # Get sort mapping to make points on line graph connect in proper order
-                idx_sort = np.argsort(data_x)
-                data_x = data_x[idx_sort]
-                data_y = data_y[idx_sort]
-
-            # Draw plot
-            color = bpm_lut.map(bpm, 'qcolor')
-            self.__graph.plot(x=data_x, y=data_y, symbol='o', symbolPen=None, symbolSize=5, pen=None, symbolBrush=color, name=f'{bpm} bpm')
+        self.__pool.end()
 
     
     def __region_event(self):
         # When the selection plot changes, reprocess main graph
-        StddevGraphTapDev.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphTapDev.__name__, lambda: StddevGraphTapDev.plot_data(self, self.data))
 
 
     def __on_view_range_changed(self, _=None):
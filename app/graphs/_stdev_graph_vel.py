@@ -1,12 +1,9 @@
 import pyqtgraph
 from pyqtgraph.Qt import QtGui
-from pyqtgraph.Qt import QtCore
 
-import math
-import numpy as np
-
-from app.misc._utils import MathUtils
 from app.misc._select_plot import SelectPlot
+from app.misc._plot_pool import PlotPool
+from app.misc._analytics import Analytics
 
 
 class StddevGraphVel():
@@ -33,6 +30,9 @@ class StddevGraphVel():
         self.__graph.setLabel('bottom', 'velocity', units='osu!px/s', unitPrefix='')
         self.__graph.addLegend()
 
+        # Plot items are reused between replots
+        self.__pool = PlotPool(self.__graph)
+
         # Deviation marker indicating expected deviation according to set CS
         self.__dev_marker_95 = pyqtgraph.InfiniteLine(angle=0, movable=False, pen=pyqtgraph.mkPen(color=(255, 100, 0, 100), style=pyqtgraph.QtCore.Qt.DashLine))
         self.__graph.addItem(self.__dev_marker_95, ignoreBounds=True)
@@ -92,145 +92,93 @@ class StddevGraphVel():
 
         DataRec = self.DataVer
 
-        # Clear plots for redraw
-        self.__graph.clearPlots()
         self.__text.setText(f'')
 
-        # Select data slices by angle
-        ang0, ang1 = self.__ang_plot.get_region()
-        ang_select = ((ang0 <= data[:, DataRec.COL_ANGLE]) & (data[:, DataRec.COL_ANGLE] <= ang1))
-
-        # Select data slices by distance
-        px0, px1 = self.__px_plot.get_region()
-        px_select = ((px0 <= data[:, DataRec.COL_PX]) & (data[:, DataRec.COL_PX] <= px1))
+        # Select data slices by angle, distance and rotation
+        ranges = {
+            DataRec.COL_ANGLE : self.__ang_plot.get_region(),
+            DataRec.COL_PX    : self.__px_plot.get_region(),
+            DataRec.COL_ROT   : self.__rot_plot.get_region(),
+        }
 
-        # Select data slices by rotation
-        rot0, rot1 = self.__rot_plot.get_region()
-        rot_select = ((rot0 <= data[:, DataRec.COL_ROT]) & (data[:, DataRec.COL_ROT] <= rot1))
-
-        unique_angs = np.unique(data[:, DataRec.COL_ANGLE])
+        unique_angs = self.selection_cache.unique(data, DataRec.COL_ANGLE)
         self.__ang_plot.plot(unique_angs)
 
-        unique_pxs = np.unique(data[:, DataRec.COL_PX])
+        unique_pxs = self.selection_cache.unique(data, DataRec.COL_PX)
         self.__px_plot.plot(unique_pxs)
 
-        unique_rots = np.unique(data[:, DataRec.COL_ROT])
+        unique_rots = self.selection_cache.unique(data, DataRec.COL_ROT)
         self.__rot_plot.plot(unique_rots)
 
-        # Colored gradient r->g->b multiple plots at different angles
-        unique_angs = np.unique(data[ang_select & rot_select & px_select, DataRec.COL_ANGLE])
-        if unique_angs.shape[0] == 0:
-            # Data selection empty
-            return
+        analytics = Analytics(data, self.data_aggregates, self.data_columns, self.selection_cache)
 
-        angle_lut = pyqtgraph.ColorMap(
-            np.linspace(min(unique_angs), max(unique_angs), 3),
-            np.array(
-                [
-                    [  0, 100, 255, 200],
-                    [100, 255, 100, 200],
-                    [255, 100, 100, 200],
-                ]
-            )
-        )
+        # Deviation vs velocity points, a group for every unique angle recorded
+        unique_angs, groups = analytics.vel_groups(ranges, self.DEV_COLS[self.dev_select])
 
-        print()
+        # Selected region has no data. Nothing else to do
+        if len(groups) == 0:
+            self.fit_worker.cancel(StddevGraphVel.__name__)
+            self.__pool.clear()
+            return
 
-        # Adds a plot for every unique BPM recorded
-        for angle in unique_angs:
-            # Determine data selected by angle
-            ang_select = (data[:, DataRec.COL_ANGLE] == angle)
-            data_select = ang_select & px_select & rot_select
-            if not any(data_select):
-                # Selected region has no data. Nothing else to do
-                continue
+        # Title according to selected deviation
+        if self.dev_select == self.DEV_X:
+            self.__graph.setTitle('Aim dev-x (vel)')
+        elif self.dev_select == self.DEV_Y:
+            self.__graph.setTitle('Aim dev-y (vel)')
+        elif self.dev_select == self.DEV_XY:
+            self.__graph.setTitle('Aim dev-xy (vel)')
+        elif self.dev_select == self.DEV_T:
+            self.__graph.setTitle('Aim dev-t (vel)')
+        elif self.dev_select == self.AVG_X:
+            self.__graph.setTitle('Aim avg-x (bpm)')
+        elif self.dev_select == self.AVG_Y:
+            self.__graph.setTitle('Aim avg-y (bpm)')
+        elif self.dev_select == self.AVG_T:
+            self.__graph.setTitle('Aim avg-t (bpm)')
+
+        # Fit off the GUI thread. Replaces any fit still running for the previous selection
+        self.fit_worker.submit(StddevGraphVel.__name__, self.fit_worker.MODEL_LINEAR, groups,
+            lambda fits: StddevGraphVel.__draw(self, unique_angs, groups, fits)
+        )
 
-            # Extract relavent data
-            if self.dev_select == self.DEV_X:
-                self.__graph.setTitle('Aim dev-x (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_X]
-            elif self.dev_select == self.DEV_Y:
-                self.__graph.setTitle('Aim dev-y (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_Y]
-            elif self.dev_select == self.DEV_XY:
-                self.__graph.setTitle('Aim dev-xy (vel)')
-                stdevs = (data[data_select, DataRec.COL_STDEV_X]**2 + data[data_select, DataRec.COL_STDEV_Y]**2)**0.5
-            elif self.dev_select == self.DEV_T:
-                self.__graph.setTitle('Aim dev-t (vel)')
-                stdevs = data[data_select, DataRec.COL_STDEV_T]
-            elif self.dev_select == self.AVG_X:
-                self.__graph.setTitle('Aim avg-x (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_X]
-            elif self.dev_select == self.AVG_Y:
-                self.__graph.setTitle('Aim avg-y (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_Y]
-            elif self.dev_select == self.AVG_T:
-                self.__graph.setTitle('Aim avg-t (bpm)')
-                stdevs = data[data_select, DataRec.COL_AVG_T]
-
-            pxs = data[data_select, DataRec.COL_PX]
-            bpms = data[data_select, DataRec.COL_BPM]
-
-            # Velocity
-            vels = pxs*bpms/60
-
-            # Plot color
-            color = angle_lut.map(angle, 'qcolor')
-
-            # Calc linear regression
-            m, b = MathUtils.linear_regresion(vels, stdevs)
-            if type(m) == type(None) or type(b) == type(None):
-                self.__graph.plot(x=vels, y=stdevs, pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color)
-                continue
 
-            y_model = m*vels + b                # model: y = mx + b
-            x_model = (stdevs - b)/m            # model: x = (y - b)/m
+    def __draw(self, unique_angs, groups, fits):
+        # Reuse plot items for redraw
+        self.__pool.begin()
 
-            m_dev_y = np.std(stdevs - y_model)  # deviation of y from model
-            m_dev_x = np.std(vels - x_model)    # deviation of x from model
+        # Colored gradient r->g->b multiple plots at different angles
+        angle_lut = PlotPool.color_map(min(unique_angs), max(unique_angs))
 
-            x_mean = np.mean(vels)
+        print()
 
-            if m_dev_x == 0:
-                label = f'∠={angle:.2f}  n={stdevs.shape[0]}'
-                self.__graph.plot(x=vels, y=stdevs, pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color, name=label)
-                continue
+        # Adds a plot for every unique angle recorded
+        for s in Analytics.vel_series(unique_angs, groups, fits, self.model_compensation):
+            color = angle_lut.map(s['key'], 'qcolor')
+            self.__pool.plot((s['key'], 'data'), x=s['x'], y=s['y'], pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color, name=s['label'])
 
-            if stdevs.shape[0] < 3:
-                label = f'∠={angle:.2f}  n={stdevs.shape[0]}'
-                self.__graph.plot(x=vels, y=stdevs, pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color, name=label)
+            if type(s['model']) == type(None):
                 continue
 
-            # Standard error of slope @ 95% confidence interval
-            m_se_95 = (m_dev_y/m_dev_x)/math.sqrt(stdevs.shape[0] - 2)*1.96
-
-            # Standard error of y-intercept @ 95% confidence interval
-            b_se_95 = 2*m_se_95*x_mean
-
-            label = f'∠={angle:.2f}  n={stdevs.shape[0]}  σ={m_dev_y:.2f}  m={m:.5f}±{m_se_95:.5f}  b={b:.2f}±{b_se_95:.2f}'
-            print(f'velocity fit (y = mx+b): {label}')
+            print(f'velocity fit (y = mx+b): {s["label"]}')
+            self.__pool.plot((s['key'], 'model'), x=s['model'][0], y=s['model'][1], pen=(100, 100, 0, 150))
 
-            if self.model_compensation:
-                self.__graph.plot(x=vels, y=stdevs - y_model, pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color, name=label)
-                self.__graph.plot(x=[0, max(vels)], y=[0, 0], pen=(100, 100, 0, 150))
-            else:
-                self.__graph.plot(x=vels, y=stdevs, pen=None, symbol='o', symbolPen=None, symbolSize=5, symbolBrush=color, name=label)
-                self.__graph.plot(x=[0, max(vels)], y=[b, m*max(vels) + b], pen=(100, 100, 0, 150))  
+        self.__pool.end()
 
     
     def __angle_region_event(self):
         # When the selection on angle plot changes, reprocess main graph
-        StddevGraphVel.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphVel.__name__, lambda: StddevGraphVel.plot_data(self, self.data))
     
     
     def __px_region_event(self):
         # When the selection on distance plot changes, reprocess main graph
-        StddevGraphVel.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphVel.__name__, lambda: StddevGraphVel.plot_data(self, self.data))
 
 
     def __rot_region_event(self):
         # When the selection on rotation plot changes, reprocess main graph
-        StddevGraphVel.plot_data(self, self.data)
+        self.replot_scheduler.request(StddevGraphVel.__name__, lambda: StddevGraphVel.plot_data(self, self.data))
 
 
     def set_dev(self, dev):
@@ -0,0 +1,318 @@
+import numpy as np
+import os
+
+from app.misc._data_schema import DataV3
+from app.misc._record_index import RecordIndex
+from app.misc._group_by import GroupBy
+
+
+class AggregateTable():
+    """
+    Per-setting aggregates of the records in a data file.
+
+    For every setting (bpm, px, rot, angle, notes) the table holds the number
+    of records along with the running mean, variance and the best (lowest)
+    `num_best` values of each stat column. The table is built once when the data
+    file is loaded and updated with every new record, so graphs can work off of
+    a row per setting instead of a row per play.
+
+    Best-N and mean are mergeable, so the aggregate of any selection of
+    settings can be computed from the table rows alone.
+
+    Given a `table_file`, the table can be saved there and is reused on load
+    the same way `RecordIndex` is: as long as the data file still starts with
+    the records it was made from. Records appended since are merged in, so
+    the table only needs to be saved once in a while, not with every record.
+    Otherwise it is rebuilt from the records.
+    """
+
+    KEY_COLS = RecordIndex.KEY_COLS
+
+    STAT_COLS = (
+        DataV3.COL_STDEV_X,
+        DataV3.COL_STDEV_Y,
+        DataV3.COL_STDEV_XY,
+        DataV3.COL_STDEV_T,
+        DataV3.COL_AVG_X,
+        DataV3.COL_AVG_Y,
+        DataV3.COL_AVG_T,
+    )
+
+    def __init__(self, data, num_best, table_file=None):
+        self.num_best   = num_best
+        self.stat_cols  = [ col for col in AggregateTable.STAT_COLS if col in DataV3.DERIVED or col in data.dtype.names ]
+        self.table_file = table_file
+
+        self.num_records = 0  # Number of records the table was made from
+        self.__rows = {}
+
+        if type(table_file) == type(None):
+            self.__build(data)
+            return
+
+        if not self.__load(data):
+            self.__build(data)
+            self.save(data)
+
+
+    @property
+    def keys(self):
+        # Settings of each table row. Accessed by column like the data itself
+        return self.__keys[:self.__num_rows]
+
+
+    def count(self):
+        return self.__count[:self.__num_rows]
+
+
+    def mean(self, col):
+        return self.__mean[col][:self.__num_rows]
+
+
+    def var(self, col):
+        count = self.count()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(count > 1, self.__m2[col][:self.__num_rows]/(count - 1), np.nan)
+
+
+    def best(self, col):
+        # Ascending best values of each row. Unused slots hold inf
+        return self.__best[col][:self.__num_rows]
+
+
+    def update(self, key, record):
+        key = tuple(key)
+
+        try: i = self.__rows[key]
+        except KeyError:
+            i = self.__add_row(key)
+
+        self.__count[i] += 1
+        n = self.__count[i]
+        self.num_records += 1
+
+        values = AggregateTable.__stat_values(record, self.stat_cols)
+        for col in self.stat_cols:
+            value = float(values[col])
+
+            # Welford's running mean and variance
+            delta = value - self.__mean[col][i]
+            self.__mean[col][i] += delta/n
+            self.__m2[col][i]   += delta*(value - self.__mean[col][i])
+
+            best = self.__best[col][i]
+            if value < best[-1]:
+                best[:] = np.sort(np.append(best, value))[:self.num_best]
+
+
+    def best_mean(self, col, rows, group_col, num_best):
+        """
+        Mean of the best `num_best` values of `col` for each unique value of
+        `group_col` among the table rows at indices `rows`.
+
+        returns:
+            (sorted unique group values, mean of best values per group)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # Flatten the best values of all selected rows, dropping unused slots
+        best  = self.best(col)[rows]
+        valid = np.arange(self.num_best)[None, :] < np.minimum(self.count()[rows], self.num_best)[:, None]
+
+        groups = GroupBy(np.broadcast_to(self.keys[group_col][rows].reshape(-1, 1), best.shape)[valid])
+        return groups.keys, groups.best_mean(best[valid], num_best)
+
+
+    def pooled_mean(self, col, rows, group_col):
+        """
+        Mean of all records of `col` for each unique value of `group_col` among the
+        table rows at indices `rows`.
+
+        returns:
+            (sorted unique group values, mean per group)
+        """
+        rows   = np.asarray(rows, dtype=np.int64)
+        groups = GroupBy(self.keys[group_col][rows])
+
+        counts = self.count()[rows]
+        return groups.keys, groups.sum(counts*self.mean(col)[rows])/groups.sum(counts)
+
+
+    def save(self, data):
+        # `data` are the records of the data file, the table was made from the first `num_records` of them
+        num_rows = self.__num_rows
+        table = {
+            'keys'        : np.column_stack([ self.__keys[col][:num_rows] for col in AggregateTable.KEY_COLS ]).reshape(-1, len(AggregateTable.KEY_COLS)),
+            'count'       : self.__count[:num_rows],
+            'stat_cols'   : np.asarray(self.stat_cols, dtype=str),
+            'num_best'    : self.num_best,
+            'num_records' : self.num_records,
+            'fingerprint' : RecordIndex.fingerprint(data[:self.num_records], data.dtype.names),
+        }
+
+        for col in self.stat_cols:
+            table[f'mean_{col}'] = self.__mean[col][:num_rows]
+            table[f'm2_{col}']   = self.__m2[col][:num_rows]
+            table[f'best_{col}'] = self.__best[col][:num_rows]
+
+        os.makedirs(os.path.dirname(self.table_file), exist_ok=True)
+
+        # Written to a temporary file first, so a crash never leaves a partial table behind
+        tmp_file = f'{os.path.splitext(self.table_file)[0]}.tmp.npz'
+        np.savez(tmp_file, **table)
+        os.replace(tmp_file, self.table_file)
+
+
+    def __load(self, data):
+        try:
+            with np.load(self.table_file, allow_pickle=False) as table:
+                # Table of a different data file, or of records that have changed since
+                num_records = int(table['num_records'])
+                if num_records > data.shape[0]:
+                    return False
+
+                if int(table['num_best']) != self.num_best or table['stat_cols'].tolist() != self.stat_cols:
+                    return False
+
+                if str(table['fingerprint']) != RecordIndex.fingerprint(data[:num_records], data.dtype.names):
+                    return False
+
+                self.num_records = num_records
+
+                keys     = table['keys']
+                num_rows = keys.shape[0]
+
+                self.__allocate(max(num_rows, 64))
+                self.__num_rows = num_rows
+
+                for i in range(len(AggregateTable.KEY_COLS)):
+                    self.__keys[AggregateTable.KEY_COLS[i]][:num_rows] = keys[:, i]
+
+                self.__count[:num_rows] = table['count']
+                for col in self.stat_cols:
+                    self.__mean[col][:num_rows] = table[f'mean_{col}']
+                    self.__m2[col][:num_rows]   = table[f'm2_{col}']
+                    self.__best[col][:num_rows] = table[f'best_{col}']
+
+        except (FileNotFoundError, KeyError, ValueError):
+            return False
+
+        self.__rows = {}
+        for i in range(num_rows):
+            self.__rows[tuple(keys[i].tolist())] = i
+
+        # Records appended since the table was saved
+        if data.shape[0] > self.num_records:
+            self.__merge(AggregateTable(data[self.num_records:], self.num_best))
+
+        return True
+
+
+    def __merge(self, other):
+        # Adds the records of `other`, a table of the same stat columns made from other records
+        other_keys = other.keys
+        rows = np.empty(other_keys.shape[0], dtype=np.int64)
+
+        for i in range(rows.shape[0]):
+            key = tuple(int(other_keys[col][i]) for col in AggregateTable.KEY_COLS)
+
+            try: rows[i] = self.__rows[key]
+            except KeyError:
+                rows[i] = self.__add_row(key)
+
+        n_a = self.__count[rows].astype(np.float64)
+        n_b = other.count().astype(np.float64)
+        n   = n_a + n_b
+
+        for col in self.stat_cols:
+            # Chan et al.'s pairwise combination of running means and variances
+            delta = other.mean(col) - self.__mean[col][rows]
+            self.__mean[col][rows] += delta*n_b/n
+            self.__m2[col][rows]   += other.__m2[col][:other.__num_rows] + delta*delta*n_a*n_b/n
+
+            best = np.concatenate((self.__best[col][rows], other.best(col)), axis=1)
+            self.__best[col][rows] = np.sort(best, axis=1)[:, :self.num_best]
+
+        self.__count[rows] += other.count()
+        self.num_records   += other.num_records
+
+
+    def __build(self, data):
+        keys = np.column_stack([ data[col].astype(np.int64) for col in AggregateTable.KEY_COLS ]).reshape(-1, len(AggregateTable.KEY_COLS))
+        unique_keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+        inverse = inverse.reshape(-1)
+
+        num_rows = unique_keys.shape[0]
+        self.__allocate(max(num_rows, 64))
+        self.__num_rows = num_rows
+        self.num_records = data.shape[0]
+
+        for i in range(len(AggregateTable.KEY_COLS)):
+            self.__keys[AggregateTable.KEY_COLS[i]][:num_rows] = unique_keys[:, i]
+
+        for i in range(num_rows):
+            self.__rows[tuple(unique_keys[i].tolist())] = i
+
+        self.__count[:num_rows] = counts
+        if num_rows == 0:
+            return
+
+        values = AggregateTable.__stat_values(data, self.stat_cols)
+        group_starts = np.concatenate(([ 0 ], np.cumsum(counts)[:-1]))
+
+        for col in self.stat_cols:
+            vals = values[col].astype(np.float64)
+
+            mean = np.bincount(inverse, weights=vals, minlength=num_rows)/counts
+            self.__mean[col][:num_rows] = mean
+            self.__m2[col][:num_rows]   = np.bincount(inverse, weights=(vals - mean[inverse])**2, minlength=num_rows)
+
+            # Best values per setting by ranking values within each setting
+            order = np.lexsort((vals, inverse))
+            idxs  = inverse[order]
+            rank  = np.arange(idxs.shape[0]) - group_starts[idxs]
+            keep  = rank < self.num_best
+
+            self.__best[col][idxs[keep], rank[keep]] = vals[order][keep]
+
+
+    def __allocate(self, capacity):
+        self.__keys  = np.zeros(capacity, dtype=[ (col, np.int64) for col in AggregateTable.KEY_COLS ])
+        self.__count = np.zeros(capacity, dtype=np.int64)
+        self.__mean  = { col : np.zeros(capacity) for col in self.stat_cols }
+        self.__m2    = { col : np.zeros(capacity) for col in self.stat_cols }
+        self.__best  = { col : np.full((capacity, self.num_best), np.inf) for col in self.stat_cols }
+
+
+    def __add_row(self, key):
+        i = self.__num_rows
+
+        if i == self.__keys.shape[0]:
+            keys, count, mean, m2, best = self.__keys, self.__count, self.__mean, self.__m2, self.__best
+
+            self.__allocate(2*i)
+            self.__keys[:i]  = keys
+            self.__count[:i] = count
+            for col in self.stat_cols:
+                self.__mean[col][:i] = mean[col]
+                self.__m2[col][:i]   = m2[col]
+                self.__best[col][:i] = best[col]
+
+        for col, value in zip(AggregateTable.KEY_COLS, key):
+            self.__keys[col][i] = value
+
+        self.__rows[key] = i
+        self.__num_rows += 1
+        return i
+
+
+    @staticmethod
+    def __stat_values(data, stat_cols):
+        values = {}
+        for col in stat_cols:
+            if col in DataV3.DERIVED:
+                values[col] = DataV3.derive(data, col)
+            else:
+                values[col] = data[col]
+
+        return values
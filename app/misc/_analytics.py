@@ -0,0 +1,542 @@
+import numpy as np
+
+from app.misc._data_schema import DataV3
+from app.misc._utils import MathUtils
+from app.misc._group_by import GroupBy
+from app.misc._aggregate_table import AggregateTable
+from app.misc._derived_columns import DerivedColumns
+
+
+class Analytics():
+    """
+    Series, fits and labels of the deviation graphs as plain numpy arrays.
+
+    Nothing here depends on Qt, so the same numbers the graphs show can be
+    computed headless (reports, benchmarks, batch processing of many data
+    files). The graphs only read their selection regions, pass them in as
+    `ranges` ({ col : (lo, hi) }) and draw the returned series.
+
+    Each graph has a method returning a list of series dicts:
+        key:   value the series is split by (e.g. px for the deviation vs bpm graph)
+        x, y:  points of the series. y is the residual from the model when compensating
+        fit:   fit dict (see `fit_linear` and `fit_exp`), or None if the series is not fit
+        label: legend name, or None if the series has no legend entry
+        model: (x, y) of the model curve, or None if there is nothing to draw
+
+    Graphs that are fit on the fit worker are split into a `*_groups` step
+    that selects the data and a static `*_series` step that turns the fits into
+    series, so the fits themselves can run on any thread.
+    """
+
+    MODEL_LINEAR = 0  # y = mx + b
+    MODEL_EXP    = 1  # y = a + be^(cx)
+
+    def __init__(self, data, aggregates=None, columns=None, selection_cache=None):
+        """
+        parameters:
+            data:            DataV3 records
+            aggregates:      AggregateTable of the records. Built on first use if not given
+            columns:         DerivedColumns of the records. A new one is used if not given
+            selection_cache: SelectionCache to take selection masks from. Masks are computed directly if not given
+        """
+        self.data = data
+
+        self.__aggregates = aggregates
+        self.__columns = columns if type(columns) != type(None) else DerivedColumns()
+        self.__selection_cache = selection_cache
+
+
+    def select(self, ranges):
+        # Records falling within all of the ranges
+        data_select = np.ones(self.data.shape[0], dtype=bool)
+        for col, (lo, hi) in ranges.items():
+            if type(self.__selection_cache) != type(None):
+                data_select &= self.__selection_cache.select(self.data, col, (lo, hi))
+            else:
+                data_select &= (lo <= self.data[col]) & (self.data[col] <= hi)
+
+        return data_select
+
+
+    def select_keys(self, ranges, num_best):
+        # Indices of the aggregate table rows falling within all of the ranges
+        keys = self.__get_aggregates(num_best).keys
+
+        key_select = np.ones(keys.shape[0], dtype=bool)
+        for col, (lo, hi) in ranges.items():
+            key_select &= (lo <= keys[col]) & (keys[col] <= hi)
+
+        return np.flatnonzero(key_select)
+
+
+    def bpm(self, ranges, dev_col, avg=False, num_best=5, compensate=False):
+        """
+        Deviation vs bpm, a series for every px. Selects by angle, px, rot and notes
+        """
+        return self.__linear_series(ranges, dev_col, DataV3.COL_PX, DataV3.COL_BPM, avg, num_best, compensate,
+            lambda px: f'{px} osu!px'
+        )
+
+
+    def dx(self, ranges, dev_col, avg=False, num_best=5, compensate=False):
+        """
+        Deviation vs px, a series for every bpm. Selects by angle, bpm and rot
+        """
+        return self.__linear_series(ranges, dev_col, DataV3.COL_BPM, DataV3.COL_PX, avg, num_best, compensate,
+            lambda bpm: f'{bpm} bpm'
+        )
+
+
+    def num_notes(self, ranges, dev_col, avg=False, num_best=5):
+        """
+        Deviation vs number of notes, as a single series. Selects by angle, px, bpm and rot.
+        When averaging, all records of the same number of notes are averaged
+        """
+        if avg:
+            rows = self.select_keys(ranges, num_best)
+            if rows.shape[0] == 0:
+                return []
+
+            num_notes, stdevs = self.__get_aggregates(num_best).pooled_mean(dev_col, rows, DataV3.COL_NUM)
+        else:
+            data_select = self.select(ranges)
+            if not np.any(data_select):
+                return []
+
+            stdevs = self.__columns.get(self.data, dev_col)[data_select]
+            num_notes = self.data[DataV3.COL_NUM][data_select]
+
+        return [ Analytics.__series('notes', num_notes, stdevs) ]
+
+
+    def angle_groups(self, ranges, dev_col, avg=False, num_best=5):
+        """
+        Deviation vs angle points, a group for every bpm. Selects by bpm, px and rot
+
+        returns:
+            (bpm of each group, list of (angles, deviations) per group)
+        """
+        return self.__groups(ranges, dev_col, DataV3.COL_BPM, DataV3.COL_ANGLE, avg, num_best)
+
+
+    @staticmethod
+    def angle_series(unique_bpms, groups, fits, compensate=False):
+        """
+        Series of the deviation vs angle graph from the groups of `angle_groups` and
+        their fits (from `fit_exp_groups`, or None per group to draw them unfit)
+        """
+        series = []
+        for bpm, (angles, stdevs), fit in zip(unique_bpms, groups, fits):
+            if type(fit) == type(None) or type(fit['a']) == type(None):
+                series.append(Analytics.__series(bpm, angles, stdevs, label=f'{bpm} bpm'))
+                continue
+
+            a, b, c = fit['a'], fit['b'], fit['c']
+            label = f'{bpm} bpm  r² = {fit["r_sq"]:.4f}  snr={fit["snr"]:.4f}  a={a:.2f}  b={b:.2f}  c={c:.5f}'
+
+            if compensate:
+                y_ground = stdevs - (a + b*np.exp(c*angles))
+                series.append(Analytics.__series(bpm, angles, y_ground, fit, label, (np.asarray([ 0, max(angles) ]), np.zeros(2))))
+            else:
+                x_model = np.linspace(min(angles), max(angles), 100)
+                series.append(Analytics.__series(bpm, angles, stdevs, fit, label, (x_model, a + b*np.exp(c*x_model))))
+
+        return series
+
+
+    def angle(self, ranges, dev_col, avg=False, num_best=5, compensate=False):
+        """
+        Deviation vs angle, a series for every bpm. Only deviations are fit
+        """
+        unique_bpms, groups = self.angle_groups(ranges, dev_col, avg, num_best)
+
+        if dev_col in [ DataV3.COL_STDEV_X, DataV3.COL_STDEV_Y, DataV3.COL_STDEV_XY ]:
+            fits = Analytics.fit_exp_groups(groups)
+        else:
+            fits = [ None ]*len(groups)
+
+        return Analytics.angle_series(unique_bpms, groups, fits, compensate)
+
+
+    def vel_groups(self, ranges, dev_col):
+        """
+        Deviation vs velocity points, a group for every angle. Selects by angle, px and rot
+
+        returns:
+            (angle of each group, list of (velocities, deviations) per group)
+        """
+        data_select = self.select(ranges)
+        if not np.any(data_select):
+            return np.empty(0, dtype=self.data.dtype[DataV3.COL_ANGLE]), []
+
+        stdevs = self.__columns.get(self.data, dev_col)[data_select]
+        vels   = self.__columns.get(self.data, DataV3.COL_VEL)[data_select]
+
+        groups = GroupBy(self.data[DataV3.COL_ANGLE][data_select])
+        return groups.keys, list(zip(groups.split(vels), groups.split(stdevs)))
+
+
+    @staticmethod
+    def vel_series(unique_angs, groups, fits, compensate=False):
+        """
+        Series of the deviation vs velocity graph from the groups of `vel_groups` and
+        their fits (from `fit_linear_groups`)
+        """
+        series = []
+        for angle, (vels, stdevs), fit in zip(unique_angs, groups, fits):
+            m, b = fit['m'], fit['b']
+            if type(m) == type(None) or type(b) == type(None):
+                series.append(Analytics.__series(angle, vels, stdevs, fit))
+                continue
+
+            if np.isnan(fit['m_se_95']):
+                series.append(Analytics.__series(angle, vels, stdevs, fit, f'∠={angle:.2f}  n={stdevs.shape[0]}'))
+                continue
+
+            label = f'∠={angle:.2f}  n={stdevs.shape[0]}  σ={fit["m_dev_y"]:.2f}  m={m:.5f}±{fit["m_se_95"]:.5f}  b={b:.2f}±{fit["b_se_95"]:.2f}'
+            x_model = np.asarray([ 0, max(vels) ])
+
+            if compensate:
+                y_model = m*vels + b  # model: y = mx + b
+                series.append(Analytics.__series(angle, vels, stdevs - y_model, fit, label, (x_model, np.zeros(2))))
+            else:
+                series.append(Analytics.__series(angle, vels, stdevs, fit, label, (x_model, m*x_model + b)))
+
+        return series
+
+
+    def vel(self, ranges, dev_col, compensate=False):
+        """
+        Deviation vs velocity, a series for every angle
+        """
+        unique_angs, groups = self.vel_groups(ranges, dev_col)
+        return Analytics.vel_series(unique_angs, groups, Analytics.fit_linear_groups(groups), compensate)
+
+
+    def skill_groups(self, dev_col):
+        """
+        Deviation vs velocity points of all records, a group for every angle
+
+        returns:
+            (angle of each group, list of (velocities, deviations) per group)
+        """
+        stdevs = self.__columns.get(self.data, dev_col)
+        vels   = self.__columns.get(self.data, DataV3.COL_VEL)
+
+        groups = GroupBy(self.data[DataV3.COL_ANGLE])
+        return groups.keys, list(zip(groups.split(vels), groups.split(stdevs)))
+
+
+    @staticmethod
+    def skill_series(unique_angs, fits):
+        """
+        Slope of deviation vs velocity (ms) over angle from the fits of the groups of
+        `skill_groups`, as a single series. The series has an extra `err` array
+        holding the standard error of the slope @ 95% confidence interval
+        """
+        fit_ok = np.asarray([ type(fit['m']) != type(None) for fit in fits ], dtype=bool)
+        if not np.any(fit_ok):
+            return []
+
+        angles = np.asarray(unique_angs, dtype=np.float64)[fit_ok]
+        slopes = np.asarray([ fit['m'] for fit in fits if type(fit['m']) != type(None) ], dtype=np.float64)*2*1000
+        errs   = np.asarray([ fit['m_se_95'] for fit in fits if type(fit['m']) != type(None) ], dtype=np.float64)*2*1000
+
+        series = Analytics.__series('slope', angles, slopes)
+        series['err'] = errs
+        return [ series ]
+
+
+    def skill(self, dev_col):
+        """
+        Slope of deviation vs velocity over angle
+        """
+        unique_angs, groups = self.skill_groups(dev_col)
+        return Analytics.skill_series(unique_angs, Analytics.fit_linear_groups(groups))
+
+
+    def tap_dev(self, ranges, avg=False, num_best=5):
+        """
+        Aim avg-x vs tap deviation, a series for every bpm. Selects by angle, bpm and px.
+        Needs the avg-x column, which v1 data does not have
+        """
+        data_select = self.select(ranges)
+        if not np.any(data_select):
+            return []
+
+        groups = GroupBy(self.data[DataV3.COL_BPM][data_select])
+
+        series = []
+        for bpm, data_x, data_y in zip(groups.keys, groups.split(self.data[DataV3.COL_STDEV_T][data_select]), groups.split(self.data[DataV3.COL_AVG_X][data_select])):
+            if avg:
+                # Use best N points for data display
+                num_points = min(len(data_y), num_best)
+
+                # Average overlapping data points (those that fall on same dev-t). Points come out sorted by dev-t
+                points = GroupBy(data_x)
+                data_y = points.best_mean(data_y, num_points)
+                data_x = points.keys
+
+            series.append(Analytics.__series(bpm, data_x, data_y, label=f'{bpm} bpm'))
+
+        return series
+
+
+    def grid(self, ranges, dev_col, bpm_edges, px_edges, avg=False, num_best=5):
+        """
+        Mean deviation over a bpm × px grid. Selects by angle and rot.
+        When averaging, each setting contributes the mean of its best `num_best`
+        values instead of all of its records
+
+        parameters:
+            bpm_edges, px_edges: ascending bin edges. Bins include their left edge,
+                the last bin its right edge as well (like np.histogram)
+
+        returns:
+            dict with bpm_edges, px_edges, and the mean and count of every
+            (bpm bin, px bin) cell. The mean is nan where a cell has no data
+        """
+        bpm_edges = np.asarray(bpm_edges, dtype=np.float64)
+        px_edges  = np.asarray(px_edges, dtype=np.float64)
+        shape = (bpm_edges.shape[0] - 1, px_edges.shape[0] - 1)
+
+        if avg:
+            aggregates = self.__get_aggregates(num_best)
+            rows = self.select_keys(ranges, num_best)
+
+            # Mean of the best values of each setting. Unused slots hold inf
+            num_best = min(num_best, aggregates.num_best)
+            best  = aggregates.best(dev_col)[rows, :num_best]
+            valid = np.arange(num_best)[None, :] < np.minimum(aggregates.count()[rows], num_best)[:, None]
+
+            values = np.sum(np.where(valid, best, 0), axis=1)/np.count_nonzero(valid, axis=1)
+            bpms   = aggregates.keys[DataV3.COL_BPM][rows]
+            pxs    = aggregates.keys[DataV3.COL_PX][rows]
+        else:
+            data_select = self.select(ranges)
+
+            values = self.__columns.get(self.data, dev_col)[data_select]
+            bpms   = self.data[DataV3.COL_BPM][data_select]
+            pxs    = self.data[DataV3.COL_PX][data_select]
+
+        # Flat cell index of every value. Values outside of the grid are dropped
+        bpm_bins = np.searchsorted(bpm_edges, bpms, side='right') - 1
+        px_bins  = np.searchsorted(px_edges, pxs, side='right') - 1
+
+        # Values on the last edge (e.g. 1200 bpm, 512 osu!px) go in the last bin
+        bpm_bins[bpms == bpm_edges[-1]] = shape[0] - 1
+        px_bins[pxs == px_edges[-1]]    = shape[1] - 1
+        in_grid  = (0 <= bpm_bins) & (bpm_bins < shape[0]) & (0 <= px_bins) & (px_bins < shape[1])
+
+        cells = bpm_bins[in_grid]*shape[1] + px_bins[in_grid]
+        count = np.bincount(cells, minlength=shape[0]*shape[1])
+        total = np.bincount(cells, weights=np.asarray(values, dtype=np.float64)[in_grid], minlength=shape[0]*shape[1])
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(count > 0, total/count, np.nan)
+
+        return {
+            'bpm_edges' : bpm_edges,
+            'px_edges'  : px_edges,
+            'mean'      : mean.reshape(shape),
+            'count'     : count.reshape(shape),
+        }
+
+
+    @staticmethod
+    def fit_linear(x, y):
+        """
+        Fits y = mx + b
+
+        returns:
+            dict with m, b (None if the fit failed), n, r², SNR, the deviation of
+            y and x from the model, and the standard errors of m and b @ 95%
+            confidence interval (nan if there is not enough data for them)
+        """
+        return Analytics.fit_linear_groups([ (x, y) ])[0]
+
+
+    @staticmethod
+    def fit_linear_groups(groups, cancelled=None):
+        """
+        Fits y = mx + b for every (x, y) group in one vectorized pass.
+
+        parameters:
+            cancelled: optional threading.Event. Once set, fitting stops before the next group
+
+        returns:
+            list of dicts as returned by `fit_linear`, one per group. None if cancelled
+        """
+        if len(groups) == 0:
+            return []
+
+        if Analytics.__is_cancelled(cancelled):
+            return None
+
+        x, y, group_ids = Analytics.__concat(groups)
+        fits = MathUtils.linear_regresion_groups(x, y, group_ids, len(groups))
+
+        results = []
+        for i in range(len(groups)):
+            if Analytics.__is_cancelled(cancelled):
+                return None
+
+            fit =  { key : fits[key][i] for key in fits }
+            fit['n'] = int(fit['n'])
+
+            if np.isnan(fit['m']):
+                fit['m'] = None
+                fit['b'] = None
+
+            results.append(fit)
+
+        return results
+
+
+    @staticmethod
+    def fit_exp(x, y):
+        """
+        Fits y = a + be^(cx)
+
+        returns:
+            dict with a, b, c (None if the fit failed), n, r² and SNR
+        """
+        return Analytics.fit_exp_groups([ (x, y) ])[0]
+
+
+    @staticmethod
+    def fit_exp_groups(groups, cancelled=None):
+        """
+        Fits y = a + be^(cx) for every (x, y) group in one vectorized pass.
+
+        parameters:
+            cancelled: optional threading.Event. Once set, fitting stops before the next group
+
+        returns:
+            list of dicts as returned by `fit_exp`, one per group. None if cancelled
+        """
+        if len(groups) == 0:
+            return []
+
+        if Analytics.__is_cancelled(cancelled):
+            return None
+
+        x, y, group_ids = Analytics.__concat(groups)
+        a, b, c = MathUtils.exp_regresion_groups(x, y, group_ids, len(groups))
+
+        results = []
+        for i, (x, y) in enumerate(groups):
+            # The regression is one pass over all groups, the r² and SNR are computed per group
+            if Analytics.__is_cancelled(cancelled):
+                return None
+
+            x = np.asarray(x, dtype=np.float64)
+            y = np.asarray(y, dtype=np.float64)
+
+            fit = {
+                'n'    : y.shape[0],
+                'a'    : None,
+                'b'    : None,
+                'c'    : None,
+                'r_sq' : np.nan,
+                'snr'  : np.nan,
+            }
+
+            if np.isnan(c[i]):
+                results.append(fit)
+                continue
+
+            fit['a'] = a[i]
+            fit['b'] = b[i]
+            fit['c'] = c[i]
+
+            y_model = a[i] + b[i]*np.exp(c[i]*x)
+            avg_win = min(5, y.shape[0])
+
+            fit['r_sq'] = MathUtils.r_squared(y, y_model)
+            fit['snr']  = np.var(y, ddof=1) / np.mean(np.var(np.lib.stride_tricks.sliding_window_view(y, avg_win), ddof=1, axis=1))
+
+            results.append(fit)
+
+        return results
+
+
+    @staticmethod
+    def fit_groups(model, groups, cancelled=None):
+        if model == Analytics.MODEL_LINEAR:
+            return Analytics.fit_linear_groups(groups, cancelled)
+
+        return Analytics.fit_exp_groups(groups, cancelled)
+
+
+    @staticmethod
+    def __is_cancelled(cancelled):
+        return type(cancelled) != type(None) and cancelled.is_set()
+
+
+    def __linear_series(self, ranges, dev_col, group_col, x_col, avg, num_best, compensate, name):
+        # Deviation vs `x_col`, a linearly fit series for every `group_col`
+        unique_keys, groups = self.__groups(ranges, dev_col, group_col, x_col, avg, num_best)
+        fits = Analytics.fit_linear_groups(groups)
+
+        series = []
+        for key, (xs, stdevs), fit in zip(unique_keys, groups, fits):
+            m, b = fit['m'], fit['b']
+            if type(m) == type(None) or type(b) == type(None) or not compensate:
+                # Linear regression failed or is not shown, just the points
+                series.append(Analytics.__series(key, xs, stdevs, fit, name(key)))
+                continue
+
+            y_model = m*xs + b
+            series.append(Analytics.__series(key, xs, stdevs - y_model, fit, f'{name(key)}   σ = {np.std(stdevs - y_model):.2f}  m={m:.5f}  b={b:.2f}'))
+
+        return series
+
+
+    def __groups(self, ranges, dev_col, group_col, x_col, avg, num_best):
+        # Deviation vs `x_col` points, split into a group for every `group_col`
+        if avg:
+            # Use best N points for data display. Overlapping data points (those that fall on same `x_col`) are averaged.
+            # Computed from the per-setting aggregates, with the same selection applied to them
+            aggregates = self.__get_aggregates(num_best)
+
+            key_rows = self.select_keys(ranges, num_best)
+            groups = GroupBy(aggregates.keys[group_col][key_rows])
+            return groups.keys, [ aggregates.best_mean(dev_col, rows, x_col, num_best) for rows in groups.split(key_rows) ]
+
+        data_select = self.select(ranges)
+        stdevs = self.__columns.get(self.data, dev_col)[data_select]
+
+        groups = GroupBy(self.data[group_col][data_select])
+        return groups.keys, list(zip(groups.split(self.data[x_col][data_select]), groups.split(stdevs)))
+
+
+    def __get_aggregates(self, num_best):
+        if type(self.__aggregates) == type(None):
+            self.__aggregates = AggregateTable(self.data, num_best)
+
+        return self.__aggregates
+
+
+    @staticmethod
+    def __series(key, x, y, fit=None, label=None, model=None):
+        return {
+            'key'   : key,
+            'x'     : x,
+            'y'     : y,
+            'fit'   : fit,
+            'label' : label,
+            'model' : model,
+        }
+
+
+    @staticmethod
+    def __concat(groups):
+        # Flattens ragged (x, y) groups into x, y and the group id of each point
+        sizes = [ np.asarray(y).shape[0] for x, y in groups ]
+        group_ids = np.repeat(np.arange(len(groups)), sizes)
+
+        x = np.concatenate([ np.asarray(x, dtype=np.float64).reshape(-1) for x, y in groups ])
+        y = np.concatenate([ np.asarray(y, dtype=np.float64).reshape(-1) for x, y in groups ])
+
+        return x, y, group_ids
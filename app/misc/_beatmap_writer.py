@@ -0,0 +1,102 @@
+import numpy as np
+import io
+
+
+class BeatmapWriter():
+    """
+    Writes the .osu text of generated maps.
+
+    All note lines of a section are formatted at once from the pattern array,
+    with a single format template repeated once per note, and the sections are
+    streamed into one buffer. Cost grows linearly with the number of notes.
+    """
+
+    AUDIO_OFFSET = -48  # ms
+
+    HEADER = (
+        'osu file format v14\n'
+        '\n'
+        '[General]\n'
+        'AudioFilename: blank.mp3\n'
+        'AudioLeadIn: 0\n'
+        'PreviewTime: -1\n'
+        'Countdown: 0\n'
+        'SampleSet: Normal\n'
+        'StackLeniency: 0\n'
+        'Mode: 0\n'
+        'LetterboxInBreaks: 1\n'
+        'WidescreenStoryboard: 1\n'
+        '\n'
+        '[Editor]\n'
+        'DistanceSpacing: 0.9\n'
+        'BeatDivisor: 1\n'
+        'GridSize: 32\n'
+        'TimelineZoom: 0.2000059\n'
+        '\n'
+        '[Metadata]\n'
+        'Title:unknown\n'
+        'TitleUnicode:unknown\n'
+        'Artist:abraker\n'
+        'ArtistUnicode:abraker\n'
+        'Creator:abraker\n'
+        'Version:aim__bpm-{bpm}_dx-{dx}_rot-{rot}_deg-{angle}\n'
+        'Source:\n'
+        'Tags:\n'
+        'BeatmapID:0\n'
+        'BeatmapSetID:882805\n'
+        '\n'
+        '[Difficulty]\n'
+        'HPDrainRate:8\n'
+        'CircleSize:{cs}\n'
+        'OverallDifficulty:10\n'
+        'ApproachRate:{ar}\n'
+        'SliderMultiplier:1.4\n'
+        'SliderTickRate:1\n'
+        '\n'
+        '[Events]'
+    )
+
+    TIMING_POINTS = (
+        '\n'
+        '\n'
+        '[TimingPoints]\n'
+        '0,1000,4,1,1,100,1,0\n'
+        '\n'
+        '[HitObjects]'
+    )
+
+    SAMPLE_LINE     = '\nSample,%d,3,"pluck.wav",100'
+    HIT_OBJECT_LINE = '\n%d,%d,%d,1,0,0:0:0:0:'
+
+    @staticmethod
+    def note_times(pattern, rate_multiplier):
+        """
+        Times of the notes as written to the map (ms), truncated same as int()
+        """
+        return (pattern[:, 2]*1000 + BeatmapWriter.AUDIO_OFFSET*rate_multiplier).astype(np.int64)
+
+
+    @staticmethod
+    def write(pattern, bpm, dx, rot, angle, cs, ar, rate_multiplier):
+        """
+        parameters:
+            pattern: np.array of [[x, y, t] for notes], as made by `OsuUtils.generate_pattern2`
+            bpm, dx, rot, angle: settings the map is generated from, named in the map's version
+            cs, ar: circle size and approach rate written to the map
+            rate_multiplier: 1.5 if the map is meant to be played with DT/NC, otherwise 1.0
+
+        returns:
+            the .osu text of the map
+        """
+        num_notes = pattern.shape[0]
+
+        times = BeatmapWriter.note_times(pattern, rate_multiplier)
+        hit_objects = np.column_stack((pattern[:, 0].astype(np.int64), pattern[:, 1].astype(np.int64), times))
+
+        buffer = io.StringIO()
+        buffer.write(BeatmapWriter.HEADER.format(bpm=bpm, dx=dx, rot=rot, angle=angle, cs=cs, ar=ar))
+        buffer.write((BeatmapWriter.SAMPLE_LINE*num_notes) % tuple(times.tolist()))
+        buffer.write(BeatmapWriter.TIMING_POINTS)
+        buffer.write((BeatmapWriter.HIT_OBJECT_LINE*num_notes) % tuple(hit_objects.ravel().tolist()))
+
+        return buffer.getvalue()
@@ -0,0 +1,449 @@
+import numpy as np
+import threading
+import json
+import struct
+import shutil
+import os
+import re
+
+
+class DataLog():
+    """
+    Append-only record log backing a `stdev_data_<id>.npy` data file.
+
+    The data file itself stays a plain .npy file. New records are appended to
+    small chunk files in `stdev_data_<id>_log/` which are regular .npy files with
+    a fixed size header, so appending a record only writes the new row and
+    rewrites the shape in the header. Once a chunk fills up it is sealed and
+    merged into the data file by a background compaction step. Before a merged
+    data file replaces the old one, `compacted.json` in the log directory records
+    the last chunk it contains and its number of records. A load that finds
+    the data file with that many records drops those chunks instead of merging
+    them again, so a crash between replacing the data file and removing the
+    chunks never duplicates records. Chunk ids keep increasing past the last
+    merged one for the same reason.
+
+    The .npy header has no room for anything but the array layout, so the
+    schema version of the records (`version`, None if never written) is kept
+    in `schema.json` in the log directory.
+
+    With `mmap=True` the data file is memory mapped instead of read into memory
+    and records are appended to the data file directly. The file is grown in
+    steps past the records it holds, so it only needs to be resized once every
+    `GROW_ROWS` or more appends. Windows does not allow resizing or replacing a
+    file while any view of its mapping is alive, so in this mode no views of
+    `data` may be held over `append` or `rewrite`. Drop them and take `data`
+    again afterwards.
+    """
+
+    CHUNK_ROWS = 256   # Number of records a chunk holds before it is sealed
+    GROW_ROWS  = 1024  # Minimum number of records the memory mapped data file is grown by
+
+    # Guards the set of files making up a log so a load never observes a half finished compaction
+    _lock = threading.Lock()
+
+    __chunk_regex = re.compile(r'chunk_(\d+)\.npy$')
+
+    def __init__(self, save_file, empty=None, mmap=False):
+        self.save_file = save_file
+        self.log_dir   = f'{os.path.splitext(save_file)[0]}_log'
+        self.is_mmap   = mmap
+
+        self.__compact_thread = None
+        self.__mmap = None
+        self.__last_merged = -1  # Id of the last chunk merged into the data file
+
+        # Number of compactions that replaced the data file, so owners can tell when it changed on disk
+        self.num_compactions = 0
+
+        with DataLog._lock:
+            if not os.path.isfile(self.save_file):
+                if type(empty) == type(None):
+                    raise FileNotFoundError(self.save_file)
+
+                np.save(self.save_file, empty, allow_pickle=False)
+
+        self.__load()
+        self.version = self.__read_version()
+
+
+    def __load(self):
+        with DataLog._lock:
+            self.__chunk_ids = self.__list_chunks()
+            self.__drop_merged_chunks()
+
+        if self.is_mmap:
+            # Records appended while not memory mapped need to be in the data file first
+            if len(self.__chunk_ids) > 0:
+                self.__chunk_rows = DataLog.CHUNK_ROWS
+                self.compact(wait=True)
+
+            self.__open_mmap()
+            return
+
+        with DataLog._lock:
+            data = [ np.load(self.save_file, allow_pickle=False) ]
+            for chunk_id in self.__chunk_ids:
+                data.append(np.load(self.__chunk_file(chunk_id), allow_pickle=False))
+
+        self.dtype     = data[0].dtype
+        self.row_shape = data[0].shape[1:]
+
+        # In-memory records are kept in a buffer that grows geometrically so appends are amortized O(1)
+        num_rows = sum([ d.shape[0] for d in data ])
+        self.__buffer = np.empty((max(num_rows, 64),) + self.row_shape, dtype=self.dtype)
+        self.__buffer[:num_rows] = np.concatenate(data, axis=0)
+        self.__num_rows = num_rows
+
+        # Number of records already in the active (last) chunk
+        if len(self.__chunk_ids) > 0:
+            self.__chunk_rows = data[-1].shape[0]
+            self.__chunk_offset = DataLog.__read_header(self.__chunk_file(self.__chunk_ids[-1]))[-1]
+        else:
+            self.__chunk_rows = DataLog.CHUNK_ROWS
+
+        # Merge any sealed chunks left over from the previous session
+        if self.__num_sealed() > 0:
+            self.compact()
+
+
+    @property
+    def data(self):
+        if self.is_mmap:
+            return self.__mmap[:self.__num_rows]
+
+        return self.__buffer[:self.__num_rows]
+
+
+    def append(self, row):
+        row = np.asarray(row, dtype=self.dtype).reshape(self.row_shape)
+
+        if self.is_mmap:
+            self.__append_mmap(row)
+            return
+
+        # Update in-memory records
+        if self.__num_rows == self.__buffer.shape[0]:
+            buffer = np.empty((2*self.__buffer.shape[0],) + self.row_shape, dtype=self.dtype)
+            buffer[:self.__num_rows] = self.__buffer[:self.__num_rows]
+            self.__buffer = buffer
+
+        self.__buffer[self.__num_rows] = row
+        self.__num_rows += 1
+
+        # Write record to disk
+        with DataLog._lock:
+            if self.__chunk_rows >= DataLog.CHUNK_ROWS:
+                self.__new_chunk()
+
+            with open(self.__chunk_file(self.__chunk_ids[-1]), 'rb+') as f:
+                # Row goes in first so a crash never leaves the header pointing past the data
+                f.seek(self.__chunk_offset + self.__chunk_rows*row.nbytes)
+                f.write(row.tobytes())
+
+                f.seek(0)
+                f.write(self.__header(self.__chunk_rows + 1, self.__chunk_offset))
+
+            self.__chunk_rows += 1
+            is_sealed = (self.__chunk_rows >= DataLog.CHUNK_ROWS)
+
+        if is_sealed:
+            self.compact()
+
+
+    def compact(self, wait=False):
+        if self.__compact_thread != None and self.__compact_thread.is_alive():
+            if wait: self.__compact_thread.join()
+            return
+
+        self.__compact_thread = threading.Thread(target=self.__compact, daemon=True)
+        self.__compact_thread.start()
+
+        if wait:
+            self.__compact_thread.join()
+
+
+    def close(self):
+        if self.__compact_thread != None:
+            self.__compact_thread.join()
+
+        # Release the mapping
+        self.__mmap = None
+
+
+    def rewrite(self, data, version=None, backup_file=None):
+        # Replaces all records, possibly with a different dtype. Used to migrate data files to a new format.
+        # With `backup_file`, the records replaced are kept there
+        if type(backup_file) != type(None):
+            tmp_file = f'{backup_file}.tmp'
+            with open(tmp_file, 'wb') as f:
+                np.save(f, self.data, allow_pickle=False)
+
+            os.replace(tmp_file, backup_file)
+
+        self.close()
+
+        with DataLog._lock:
+            tmp_file = f'{os.path.splitext(self.save_file)[0]}.tmp'
+            with open(tmp_file, 'wb') as f:
+                np.save(f, data, allow_pickle=False)
+
+            # The new records include all the chunks
+            chunk_ids = self.__list_chunks()
+            if len(chunk_ids) > 0:
+                self.__write_manifest(chunk_ids[-1], data.shape[0])
+
+            os.replace(tmp_file, self.save_file)
+
+            for chunk_id in chunk_ids:
+                os.remove(self.__chunk_file(chunk_id))
+
+        self.__load()
+
+        if type(version) != type(None):
+            self.write_version(version)
+
+
+    def write_version(self, version):
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        tmp_file = f'{self.log_dir}/schema.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({ 'version' : version }, f)
+
+        os.replace(tmp_file, f'{self.log_dir}/schema.json')
+        self.version = version
+
+
+    def __read_version(self):
+        try:
+            with open(f'{self.log_dir}/schema.json') as f:
+                return json.load(f)['version']
+        except FileNotFoundError:
+            return None
+
+
+    @staticmethod
+    def __read_header(file_name):
+        with open(file_name, 'rb') as f:
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+
+            return version, shape, fortran_order, dtype, f.tell()
+
+
+    def __open_mmap(self):
+        version, shape, fortran_order, dtype, offset = DataLog.__read_header(self.save_file)
+
+        if fortran_order:
+            # Records need to be contiguous rows to be mapped
+            np.save(self.save_file, np.ascontiguousarray(np.load(self.save_file, allow_pickle=False)), allow_pickle=False)
+            version, shape, fortran_order, dtype, offset = DataLog.__read_header(self.save_file)
+
+        self.dtype     = dtype
+        self.row_shape = shape[1:]
+        self.__num_rows = shape[0]
+        self.__offset   = offset
+
+        # Header needs to be rewritable in place for any number of records, so the file never
+        # has to be replaced once it is mapped
+        if version != (1, 0) or not self.__fits_header(10**12):
+            self.__rewrite_header()
+
+        # Space past the last record is left over from previous growth
+        row_bytes = self.dtype.itemsize*int(np.prod(self.row_shape))
+        capacity  = (os.path.getsize(self.save_file) - self.__offset)//row_bytes
+
+        self.__map(max(capacity, self.__num_rows))
+
+
+    def __map(self, capacity):
+        self.__mmap = None
+        if capacity == 0:
+            self.__mmap = np.empty((0,) + self.row_shape, dtype=self.dtype)
+            return
+
+        self.__mmap = np.memmap(self.save_file, dtype=self.dtype, mode='r+', offset=self.__offset, shape=(capacity,) + self.row_shape)
+
+
+    def __append_mmap(self, row):
+        with DataLog._lock:
+            capacity = self.__mmap.shape[0]
+
+            if self.__num_rows == capacity:
+                # Grow the file and map over the extended region. The mapping is released first,
+                # as the file can not be resized while mapped on Windows
+                self.__mmap = None
+
+                try:
+                    with open(self.save_file, 'rb+') as f:
+                        f.truncate(self.__offset + (capacity + max(DataLog.GROW_ROWS, capacity//8))*row.nbytes)
+                except OSError:
+                    # Some view of `data` is still alive. Leave the file as it was
+                    self.__map(capacity)
+                    raise
+
+                capacity += max(DataLog.GROW_ROWS, capacity//8)
+                self.__map(capacity)
+
+            # Row goes in first so a crash never leaves the header pointing past the data
+            self.__mmap[self.__num_rows] = row
+            self.__mmap.flush()
+
+            with open(self.save_file, 'rb+') as f:
+                f.write(self.__header(self.__num_rows + 1, self.__offset))
+
+            self.__num_rows += 1
+
+
+    def __fits_header(self, num_rows):
+        return len(self.__header_str(num_rows)) + 10 + 1 <= self.__offset
+
+
+    def __rewrite_header(self):
+        # One time rewrite of the data file with a header large enough to grow in place
+        offset = self.__header_len() + 64
+        row_bytes = self.dtype.itemsize*int(np.prod(self.row_shape))
+
+        self.__mmap = None
+
+        tmp_file = f'{os.path.splitext(self.save_file)[0]}.tmp'
+        with open(self.save_file, 'rb') as f_src, open(tmp_file, 'wb') as f_dst:
+            f_dst.write(self.__header(self.__num_rows, offset))
+
+            f_src.seek(self.__offset)
+            shutil.copyfileobj(f_src, f_dst)
+            f_dst.truncate(offset + self.__num_rows*row_bytes)
+
+        os.replace(tmp_file, self.save_file)
+        self.__offset = offset
+
+
+    def __compact(self):
+        # Keep going in case more chunks got sealed while compacting
+        while True:
+            with DataLog._lock:
+                chunk_ids = self.__chunk_ids[:self.__num_sealed()]
+
+            if len(chunk_ids) == 0:
+                return
+
+            # Sealed chunks are never written to again, so they can be merged without holding the lock
+            data = [ np.load(self.save_file, allow_pickle=False) ]
+            for chunk_id in chunk_ids:
+                data.append(np.load(self.__chunk_file(chunk_id), allow_pickle=False))
+
+            data = np.concatenate(data, axis=0)
+
+            tmp_file = f'{self.log_dir}/compact.tmp'
+            with open(tmp_file, 'wb') as f:
+                np.save(f, data, allow_pickle=False)
+
+            with DataLog._lock:
+                # Recorded first. Until the data file is replaced, its record count does not match
+                self.__write_manifest(chunk_ids[-1], data.shape[0])
+                os.replace(tmp_file, self.save_file)
+
+                for chunk_id in chunk_ids:
+                    os.remove(self.__chunk_file(chunk_id))
+                    self.__chunk_ids.remove(chunk_id)
+
+                self.num_compactions += 1
+
+            print(f'Compacted {len(chunk_ids)} record chunk(s) into {self.save_file}')
+
+
+    def __num_sealed(self):
+        # All chunks except the active one are sealed. The active one is sealed once it is full
+        if len(self.__chunk_ids) == 0:
+            return 0
+
+        if self.__chunk_rows >= DataLog.CHUNK_ROWS:
+            return len(self.__chunk_ids)
+
+        return len(self.__chunk_ids) - 1
+
+
+    def __new_chunk(self):
+        os.makedirs(self.log_dir, exist_ok=True)
+
+        # Never reuses ids of merged chunks, those are treated as part of the data file
+        chunk_id = max(self.__chunk_ids[-1] if len(self.__chunk_ids) > 0 else -1, self.__last_merged) + 1
+        self.__chunk_offset = self.__header_len()
+
+        with open(self.__chunk_file(chunk_id), 'wb') as f:
+            f.write(self.__header(0, self.__chunk_offset))
+
+        self.__chunk_ids.append(chunk_id)
+        self.__chunk_rows = 0
+
+
+    def __drop_merged_chunks(self):
+        # Removes chunks left over from a compaction that replaced the data file but did not get to remove them
+        try:
+            with open(f'{self.log_dir}/compacted.json') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+
+        self.__last_merged = manifest['last_chunk']
+
+        num_rows = DataLog.__read_header(self.save_file)[1][0]
+        if num_rows != manifest['num_rows']:
+            # Data file was not replaced, or has changed since. Any chunks left are not in it
+            return
+
+        for chunk_id in [ chunk_id for chunk_id in self.__chunk_ids if chunk_id <= self.__last_merged ]:
+            os.remove(self.__chunk_file(chunk_id))
+            self.__chunk_ids.remove(chunk_id)
+
+
+    def __write_manifest(self, last_chunk, num_rows):
+        self.__last_merged = max(self.__last_merged, last_chunk)
+
+        tmp_file = f'{self.log_dir}/compacted.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({ 'last_chunk' : self.__last_merged, 'num_rows' : num_rows }, f)
+
+        os.replace(tmp_file, f'{self.log_dir}/compacted.json')
+
+
+    def __list_chunks(self):
+        if not os.path.isdir(self.log_dir):
+            return []
+
+        chunk_ids = []
+        for file_name in os.listdir(self.log_dir):
+            match = DataLog.__chunk_regex.match(file_name)
+            if not match:
+                continue
+
+            chunk_ids.append(int(match.group(1)))
+
+        return sorted(chunk_ids)
+
+
+    def __chunk_file(self, chunk_id):
+        return f'{self.log_dir}/chunk_{chunk_id:06d}.npy'
+
+
+    def __header_str(self, num_rows):
+        return repr({
+            'descr'         : np.lib.format.dtype_to_descr(self.dtype),
+            'fortran_order' : False,
+            'shape'         : (num_rows,) + self.row_shape,
+        })
+
+
+    def __header_len(self):
+        # Smallest 64 byte aligned header that fits any realistic record count
+        return (len(self.__header_str(10**12)) + 10 + 1 + 63)//64*64
+
+
+    def __header(self, num_rows, header_len):
+        # Same layout as `np.save` produces, but padded to a fixed length so it can be rewritten in place
+        header = self.__header_str(num_rows).ljust(header_len - 10 - 1) + '\n'
+        return np.lib.format.magic(1, 0) + struct.pack('<H', len(header)) + header.encode('latin1')
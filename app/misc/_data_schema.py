@@ -0,0 +1,154 @@
+import numpy as np
+
+
+class DataV1():
+    COL_STDEV_X = 0  # Deviation along x-axis
+    COL_STDEV_Y = 1  # Deviation along y-axis
+    COL_STDEV_T = 2  # Deviation along hit time
+    COL_BPM     = 3  # BPM of the pattern (60/s)
+    COL_PX      = 4  # Distance between notes in the pattern (osu!px)
+    COL_ANGLE   = 5  # Angle between notes in the pattern (deg)
+    COL_ROT     = 6  # Rotation of pattern (deg)
+    COL_NUM     = 7  # Number of notes in the pattern before pattern reverses
+    NUM_COLS    = 8
+
+
+class DataV2():
+    COL_STDEV_X = 0   # Deviation along x-axis
+    COL_AVG_X   = 1   # Average along x-axis
+    COL_STDEV_Y = 2   # Deviation along y-axis
+    COL_AVG_Y   = 3   # Average along y-axis
+    COL_STDEV_T = 4   # Deviation along hit time
+    COL_AVG_T   = 5   # Average along hit time
+    COL_BPM     = 6   # BPM of the pattern (60/s)
+    COL_PX      = 7   # Distance between notes in the pattern (osu!px)
+    COL_ANGLE   = 8   # Angle between notes in the pattern (deg)
+    COL_ROT     = 9   # Rotation of pattern (deg)
+    COL_NUM     = 10  # Number of notes in the pattern before pattern reverses
+    COL_CS      = 11  # Circle size of pattern (osu!px)
+    NUM_COLS    = 12
+
+
+class DataV3():
+    """
+    Records are stored as a structured array. The field names and types are
+    part of the .npy header, so a data file describes its own schema. Columns
+    are accessed by name (`data[DataV3.COL_BPM]`), which gives a view without
+    copying. New columns are added by appending to `FIELDS`; files missing
+    them still load and simply do not have those fields.
+    """
+
+    VERSION = 3
+
+    COL_STDEV_X = 'stdev_x'  # Deviation along x-axis
+    COL_AVG_X   = 'avg_x'    # Average along x-axis
+    COL_STDEV_Y = 'stdev_y'  # Deviation along y-axis
+    COL_AVG_Y   = 'avg_y'    # Average along y-axis
+    COL_STDEV_T = 'stdev_t'  # Deviation along hit time
+    COL_AVG_T   = 'avg_t'    # Average along hit time
+    COL_BPM     = 'bpm'      # BPM of the pattern (60/s)
+    COL_PX      = 'px'       # Distance between notes in the pattern (osu!px)
+    COL_ANGLE   = 'angle'    # Angle between notes in the pattern (deg)
+    COL_ROT     = 'rot'      # Rotation of pattern (deg)
+    COL_NUM     = 'num'      # Number of notes in the pattern before pattern reverses
+    COL_CS      = 'cs'       # Circle size of pattern (osu!px)
+
+    # Derived columns. Not stored; computed from the stored columns by `derive`
+    COL_STDEV_XY = 'stdev_xy'  # Deviation along both axes: (stdev_x² + stdev_y²)^½
+    COL_VEL      = 'vel'       # Velocity of the pattern (osu!px/s)
+
+    FIELDS = [
+        (COL_STDEV_X, '<f4'),
+        (COL_AVG_X,   '<f4'),
+        (COL_STDEV_Y, '<f4'),
+        (COL_AVG_Y,   '<f4'),
+        (COL_STDEV_T, '<f4'),
+        (COL_AVG_T,   '<f4'),
+        (COL_BPM,     '<u2'),
+        (COL_PX,      '<u2'),
+        (COL_ANGLE,   '<u2'),
+        (COL_ROT,     '<u2'),
+        (COL_NUM,     '<u2'),
+        (COL_CS,      '<f4'),
+    ]
+
+    DTYPE = np.dtype(FIELDS)
+
+    # Derived column -> stored columns it is computed from
+    DERIVED = {
+        COL_STDEV_XY : (COL_STDEV_X, COL_STDEV_Y),
+        COL_VEL      : (COL_PX, COL_BPM),
+    }
+
+    # Columns of the pre-v3 float64 matrix layouts
+    LEGACY = {
+        DataV1.NUM_COLS : DataV1,
+        DataV2.NUM_COLS : DataV2,
+    }
+
+
+    @staticmethod
+    def is_legacy(dtype):
+        return dtype.names == None
+
+
+    @staticmethod
+    def from_legacy(data):
+        # Settings need to be whole numbers in the uint16 range, stats finite float32 values or nan.
+        # Stats lose float64 precision
+        if data.ndim != 2 or data.shape[1] not in DataV3.LEGACY:
+            raise ValueError(f'Unknown legacy data layout with shape {data.shape}')
+
+        legacy = DataV3.LEGACY[data.shape[1]]
+
+        # Keep only the columns the legacy layout actually had
+        fields = [ (name, fmt) for name, fmt in DataV3.FIELDS if hasattr(legacy, DataV3.__col_attr(name)) ]
+        records = np.empty(data.shape[0], dtype=fields)
+
+        for name, fmt in fields:
+            values = data[:, getattr(legacy, DataV3.__col_attr(name))]
+
+            # Refuse values that would wrap or overflow instead of silently storing different ones
+            dtype = np.dtype(fmt)
+            if dtype.kind == 'u':
+                invalid = ~np.isfinite(values) | (values < 0) | (values > np.iinfo(dtype).max) | (values != np.round(values))
+            else:
+                invalid = np.isfinite(values) & (np.abs(values) > np.finfo(dtype).max)
+
+            if np.any(invalid):
+                raise ValueError(f'{np.count_nonzero(invalid)} record(s) have {name} values that do not fit {dtype}, first at record {np.argmax(invalid)}: {values[np.argmax(invalid)]}')
+
+            records[name] = values
+
+        return records
+
+
+    @staticmethod
+    def record(dtype, values):
+        # Build a single record of the data file's dtype. Values for fields the file does not have are dropped
+        record = np.zeros((), dtype=dtype)
+        for name in dtype.names:
+            record[name] = values[name]
+
+        return record
+
+
+    @staticmethod
+    def derive(data, col):
+        # Settings are stored as uint16, so promote before doing arithmetic on them
+        if col == DataV3.COL_STDEV_XY:
+            return (data[DataV3.COL_STDEV_X].astype(np.float64)**2 + data[DataV3.COL_STDEV_Y].astype(np.float64)**2)**0.5
+
+        if col == DataV3.COL_VEL:
+            return data[DataV3.COL_PX].astype(np.float64)*data[DataV3.COL_BPM]/60
+
+        raise KeyError(col)
+
+
+    @staticmethod
+    def __col_attr(name):
+        for attr, value in vars(DataV3).items():
+            if attr.startswith('COL_') and value == name:
+                return attr
+
+        raise KeyError(name)
@@ -0,0 +1,38 @@
+from app.misc._data_schema import DataV3
+
+
+class DerivedColumns():
+    """
+    Columns of the records, including the derived ones in `DataV3.DERIVED`.
+
+    Stored columns are returned as views of the records. Derived columns are
+    computed the first time they are asked for and kept until the data version
+    changes (`invalidate` is called whenever records are appended or a
+    different data file is loaded), so graphs can index either kind the same
+    way without redoing the arithmetic on every replot.
+    """
+
+    def __init__(self):
+        self.version = 0
+        self.__columns = {}
+
+
+    def invalidate(self):
+        self.version += 1
+        self.__columns = {}
+
+
+    def get(self, data, col):
+        if col not in DataV3.DERIVED:
+            return data[col]
+
+        try: return self.__columns[col]
+        except KeyError:
+            pass
+
+        column = DataV3.derive(data, col)
+        column.flags.writeable = False
+
+        self.__columns[col] = column
+        return column
+
@@ -0,0 +1,107 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from pyqtgraph.Qt import QtCore
+
+from app.misc._analytics import Analytics
+from app.misc._timing import Timing
+
+
+class FitWorker(QtCore.QObject):
+    """
+    Runs the curve fits of the graphs on a thread pool.
+
+    A graph submits the (x, y) arrays of all its series as one job along with a
+    callback. The fits run off the GUI thread and the callback is invoked on the
+    GUI thread with a fit per series, in the same order. Each graph has at most
+    one live job: submitting a new one (e.g. because the selection changed)
+    cancels the previous one, and results of cancelled jobs are never delivered.
+    """
+
+    MODEL_LINEAR = Analytics.MODEL_LINEAR  # y = mx + b
+    MODEL_EXP    = Analytics.MODEL_EXP     # y = a + be^(cx)
+
+    __job_finished = QtCore.pyqtSignal(object, int, object)
+
+    def __init__(self, num_threads=2, parent=None, timing=None):
+        QtCore.QObject.__init__(self, parent)
+
+        self.__timing = timing if type(timing) != type(None) else Timing()
+
+        self.__executor = ThreadPoolExecutor(max_workers=num_threads, thread_name_prefix='fit')
+        self.__jobs = {}  # key -> (job id, cancel event, future, callback)
+        self.__job_id = 0
+
+        self.num_submitted = 0
+        self.num_cancelled = 0
+
+        # Queued across threads, so results are delivered on the GUI thread
+        self.__job_finished.connect(self.__on_job_finished)
+
+
+    def submit(self, key, model, groups, callback):
+        """
+        parameters:
+            key:      identifies the requester. A newer job with the same key cancels older ones
+            model:    MODEL_LINEAR or MODEL_EXP
+            groups:   list of (x, y) arrays to fit
+            callback: called on the GUI thread with a list of fits (see `Analytics.fit_linear` and `Analytics.fit_exp`), one per group
+        """
+        self.cancel(key)
+
+        self.__job_id += 1
+        job_id = self.__job_id
+        cancelled = threading.Event()
+
+        future = self.__executor.submit(FitWorker.__run, self.__timing, f'fit {key}', model, groups, cancelled)
+        self.__jobs[key] = (job_id, cancelled, future, callback)
+        self.num_submitted += 1
+
+        future.add_done_callback(lambda future: self.__job_finished.emit(key, job_id, future))
+        return job_id
+
+
+    def cancel(self, key):
+        try: job_id, cancelled, future, callback = self.__jobs.pop(key)
+        except KeyError:
+            return
+
+        # Queued jobs never start; running ones stop before the next group
+        cancelled.set()
+        future.cancel()
+        self.num_cancelled += 1
+
+
+    def close(self):
+        for key in list(self.__jobs.keys()):
+            self.cancel(key)
+
+        self.__executor.shutdown(wait=False)
+
+
+    def __on_job_finished(self, key, job_id, future):
+        try: live_job_id, cancelled, live_future, callback = self.__jobs[key]
+        except KeyError:
+            return
+
+        # A newer job replaced this one
+        if live_job_id != job_id:
+            return
+
+        del self.__jobs[key]
+        if future.cancelled():
+            return
+
+        try: fits = future.result()
+        except Exception as e:
+            print(f'Fit failed: {type(e).__name__} due to "{e}"')
+            return
+
+        callback(fits)
+
+
+    @staticmethod
+    def __run(timing, name, model, groups, cancelled):
+        # All groups are fit at once
+        with timing.span(name, 'fit'):
+            return Analytics.fit_groups(model, groups, cancelled)
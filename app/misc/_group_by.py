@@ -0,0 +1,100 @@
+import numpy as np
+
+
+class GroupBy():
+    """
+    Groups values by key with a single sort so per-group reductions run in
+    O(N log N) instead of building a boolean mask per unique key.
+
+    Groups are ordered by ascending key, so the outputs of all reductions line
+    up with `GroupBy.keys` and are ready for plotting.
+    """
+
+    def __init__(self, keys):
+        keys = np.asarray(keys).reshape(-1)
+
+        self.keys, self.inverse, self.counts = np.unique(keys, return_inverse=True, return_counts=True)
+        self.inverse = self.inverse.reshape(-1)
+
+        # Permutation that lays values out contiguously per group, in original order within each group
+        self.order  = np.argsort(self.inverse, kind='stable')
+        self.starts = np.concatenate(([ 0 ], np.cumsum(self.counts)[:-1])).astype(np.int64)
+
+
+    @property
+    def num_groups(self):
+        return self.keys.shape[0]
+
+
+    def count(self):
+        return self.counts
+
+
+    def sum(self, values):
+        return np.bincount(self.inverse, weights=np.asarray(values, dtype=np.float64), minlength=self.num_groups)
+
+
+    def mean(self, values):
+        return self.sum(values)/self.counts
+
+
+    def min(self, values):
+        if self.num_groups == 0:
+            return np.empty(0)
+
+        return np.minimum.reduceat(np.asarray(values)[self.order], self.starts)
+
+
+    def max(self, values):
+        if self.num_groups == 0:
+            return np.empty(0)
+
+        return np.maximum.reduceat(np.asarray(values)[self.order], self.starts)
+
+
+    def best_mean(self, values, num_best):
+        """
+        Mean of the `num_best` lowest values of each group, in one sort over
+        all groups instead of a sort per group.
+        """
+        if self.num_groups == 0:
+            return np.empty(0)
+
+        values = np.asarray(values, dtype=np.float64)
+
+        # Sort by group, then by value, and rank values within each group
+        order = np.lexsort((values, self.inverse))
+        idxs  = self.inverse[order]
+        rank  = np.arange(idxs.shape[0]) - self.starts[idxs]
+        keep  = rank < num_best
+
+        sums = np.bincount(idxs[keep], weights=values[order][keep], minlength=self.num_groups)
+        return sums/np.minimum(self.counts, num_best)
+
+
+    def split(self, values):
+        # Per-group arrays of values, in the same order as `keys`
+        if self.num_groups == 0:
+            return []
+
+        return np.split(np.asarray(values)[self.order], self.starts[1:])
+
+
+    def regression_sums(self, x, y):
+        """
+        Per-group sums needed for a least squares line fit.
+
+        returns:
+            (n, Σx, Σy, Σx², Σxy, Σy²)
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        return (
+            self.counts.astype(np.float64),
+            self.sum(x),
+            self.sum(y),
+            self.sum(x*x),
+            self.sum(x*y),
+            self.sum(y*y),
+        )
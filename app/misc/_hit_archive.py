@@ -0,0 +1,86 @@
+import numpy as np
+import zipfile
+import os
+import re
+
+
+class HitArchive():
+    """
+    Compressed archive of the per-note offsets each record was aggregated from.
+
+    Records are grouped into chunks of `CHUNK_RECORDS` by record id. A chunk is
+    a regular .npz file with one compressed `<record_id>.npy` member per record,
+    holding the (aim x, aim y, tap) offsets of every note in the play. Records
+    are appended to the chunk without rewriting it, and readers only ever
+    decompress one record at a time.
+    """
+
+    CHUNK_RECORDS = 256
+
+    ROW_AIM_X = 0  # Direction corrected aim offset along x-axis (osu!px)
+    ROW_AIM_Y = 1  # Direction corrected aim offset along y-axis (osu!px)
+    ROW_TAP   = 2  # Tap offset (ms)
+
+    __chunk_regex = re.compile(r'hits_(\d+)\.npz$')
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+
+
+    def append(self, record_id, aim_x_offsets, aim_y_offsets, tap_offsets):
+        hits = np.vstack((aim_x_offsets, aim_y_offsets, tap_offsets)).astype(np.float32)
+
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with zipfile.ZipFile(self.__chunk_file(record_id//HitArchive.CHUNK_RECORDS), 'a', compression=zipfile.ZIP_DEFLATED) as chunk:
+            with chunk.open(f'{record_id}.npy', 'w') as f:
+                np.lib.format.write_array(f, hits, allow_pickle=False)
+
+
+    def read(self, record_id):
+        # Returns None if the record has no archived hits (made before the archive existed or play was not archived)
+        try:
+            with np.load(self.__chunk_file(record_id//HitArchive.CHUNK_RECORDS), allow_pickle=False) as chunk:
+                return chunk[str(record_id)]
+        except (FileNotFoundError, KeyError):
+            return None
+
+
+    def iter_records(self, record_ids=None):
+        """
+        Streams archived records as (record_id, hits) where hits is a 3 x n array
+        of offsets indexed by ROW_AIM_X, ROW_AIM_Y, ROW_TAP. Only one record is
+        held in memory at a time.
+
+        parameters:
+            record_ids: iterable of record ids to read. Reads every archived record if None
+        """
+        if type(record_ids) != type(None):
+            for record_id in record_ids:
+                hits = self.read(record_id)
+                if type(hits) != type(None):
+                    yield record_id, hits
+            return
+
+        for chunk_id in self.__list_chunks():
+            with np.load(self.__chunk_file(chunk_id), allow_pickle=False) as chunk:
+                for key in sorted(chunk.files, key=int):
+                    yield int(key), chunk[key]
+
+
+    def __list_chunks(self):
+        if not os.path.isdir(self.archive_dir):
+            return []
+
+        chunk_ids = []
+        for file_name in os.listdir(self.archive_dir):
+            match = HitArchive.__chunk_regex.match(file_name)
+            if not match:
+                continue
+
+            chunk_ids.append(int(match.group(1)))
+
+        return sorted(chunk_ids)
+
+
+    def __chunk_file(self, chunk_id):
+        return f'{self.archive_dir}/hits_{chunk_id:06d}.npz'
@@ -0,0 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+
+from osu_analysis import StdMapData
+from osu_analysis import BeatmapIO
+
+from app.misc._osu_utils import OsuUtils
+from app.misc._beatmap_writer import BeatmapWriter
+from app.misc._pattern_cache import PatternCache
+from app.misc._timing import Timing
+
+
+class MapGenerator():
+    """
+    Writes the generated maps, optionally preparing the next one ahead of time.
+
+    A map is generated from a dict of settings (see `SETTINGS`). `generate`
+    writes it to `map.osu` right away. `prepare` does the same work on a worker
+    thread but into a staging file next to `map.osu`, so that a later
+    `generate` with the same settings only has to rename the staging file over
+    `map.osu`. The auto increment loop prepares the next map while the current
+    one is being played.
+
+    Generated maps are dicts of:
+        text:     .osu text of the map
+        md5:      md5 of the written file
+        map_data: `StdMapData` map data of the file, None if it could not be read
+    """
+
+    SETTINGS = [ 'bpm', 'dx', 'angle', 'rot', 'notes', 'repeats', 'cs', 'ar' ]
+
+    STAGING_FILE = 'map.osu.next'
+
+    def __init__(self, pattern_cache=None, timing=None):
+        self.__pattern_cache = pattern_cache if type(pattern_cache) != type(None) else PatternCache()
+        self.__timing = timing if type(timing) != type(None) else Timing()
+
+        # Only one map is ever prepared at a time
+        self.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='map')
+        self.__prepared = None  # (settings key, map path, future)
+
+        self.num_prepared  = 0
+        self.num_used      = 0
+        self.num_discarded = 0
+
+
+    def generate(self, settings, map_path):
+        """
+        Writes the map of `settings` to `map_path`/map.osu.
+
+        returns:
+            the generated map
+        """
+        prepared = self.__take(settings, map_path)
+        if type(prepared) != type(None):
+            try:
+                with self.__timing.span('swap_map', 'generate'):
+                    os.replace(f'{map_path}/{MapGenerator.STAGING_FILE}', f'{map_path}/map.osu')
+
+                self.num_used += 1
+                return prepared
+            except OSError as e:
+                print(f'Swapping in prepared map failed: {type(e).__name__} due to "{e}"')
+
+        return MapGenerator.__write(self.__pattern_cache, self.__timing, settings, f'{map_path}/map.osu')
+
+
+    def prepare(self, settings, map_path):
+        """
+        Starts writing the map of `settings` to the staging file on the worker thread,
+        unless it is already prepared or being prepared.
+        """
+        key = MapGenerator.__key(settings)
+        if type(self.__prepared) != type(None):
+            if self.__prepared[0] == key and self.__prepared[1] == map_path:
+                return
+
+            self.num_discarded += 1
+
+        # A map still being prepared is written to the staging file before the new one, so
+        # the staging file always ends up with the latest map
+        future = self.__executor.submit(MapGenerator.__prepare, self.__pattern_cache, self.__timing, dict(settings), f'{map_path}/{MapGenerator.STAGING_FILE}')
+        self.__prepared = (key, map_path, future)
+        self.num_prepared += 1
+
+
+    def close(self):
+        if type(self.__prepared) != type(None):
+            self.__prepared[2].cancel()
+            self.__prepared = None
+
+        self.__executor.shutdown(wait=False)
+
+
+    def __take(self, settings, map_path):
+        # Map prepared for `settings`, waiting for it to finish if needed. None if there is none
+        if type(self.__prepared) == type(None):
+            return None
+
+        key, prepared_path, future = self.__prepared
+        self.__prepared = None
+
+        if key != MapGenerator.__key(settings) or prepared_path != map_path:
+            self.num_discarded += 1
+            return None
+
+        try:
+            with self.__timing.span('wait_map', 'generate'):
+                return future.result()
+        except Exception as e:
+            print(f'Preparing map failed: {type(e).__name__} due to "{e}"')
+            return None
+
+
+    @staticmethod
+    def file_md5(file_name):
+        try:
+            with open(file_name, 'rb') as f:
+                return hashlib.md5(f.read()).hexdigest()
+        except FileNotFoundError:
+            return None
+
+
+    @staticmethod
+    def __key(settings):
+        # Same values of different types are written differently (e.g. CircleSize:4 vs CircleSize:4.0)
+        return tuple((name, type(settings[name]), settings[name]) for name in MapGenerator.SETTINGS)
+
+
+    @staticmethod
+    def __prepare(pattern_cache, timing, settings, file_name):
+        # The map preview shows the pattern without DT/NC applied, have it ready as well
+        pattern_cache.get(settings['rot'], settings['dx'], settings['bpm'], settings['angle'], settings['notes'], settings['repeats'])
+        return MapGenerator.__write(pattern_cache, timing, settings, file_name)
+
+
+    @staticmethod
+    def __write(pattern_cache, timing, settings, file_name):
+        with timing.span('generate_map', 'generate'):
+            # Handle DT/NC vs nomod setting
+            rate_multiplier = 1.0 if (settings['ar'] <= 10) else 1.5
+
+            ar = min(settings['ar'], 10)
+            ar = ar if (settings['ar'] <= 10) else OsuUtils.ms_to_ar(OsuUtils.ar_to_ms(settings['ar'])*rate_multiplier)
+
+            pattern, _ = pattern_cache.get(settings['rot'], settings['dx'], settings['bpm'], settings['angle'], settings['notes'], settings['repeats'], rate_multiplier)
+            text = BeatmapWriter.write(pattern, settings['bpm'], settings['dx'], settings['rot'], settings['angle'], settings['cs'], ar, rate_multiplier)
+
+            os.makedirs(os.path.dirname(file_name), exist_ok=True)
+            BeatmapIO.save_beatmap(text, file_name)
+
+        # Map data for scoring is read now, and is used when the replay comes in as long as
+        # the file was not changed in the meantime
+        md5 = MapGenerator.file_md5(file_name)
+
+        try:
+            with timing.span('get_map_data', 'generate'):
+                map_data = StdMapData.get_map_data(BeatmapIO.open_beatmap(file_name))
+        except TypeError:
+            # Left for scoring to report
+            map_data = None
+
+        return { 'text' : text, 'md5' : md5, 'map_data' : map_data }
@@ -7,6 +7,7 @@ import math
 class OsuUtils():
 
     # Thanks joz#9960
+    @staticmethod
     def generate_pattern2(initial_angle: 'float', distance: 'float|list[float]', time: 'float|list[float]', angle: 'float|list[float]', n_points: 'int', n_repeats: 'int' = 1) -> np.array:
         """
         Create a pattern of osu circles.
@@ -25,35 +26,110 @@ class OsuUtils():
         dists  = np.array(distance, dtype='f').flatten()
         times  = np.array(time, dtype='f').flatten()
         angles = np.array(angle, dtype='f').flatten()
-        rots   = np.array([ [[ np.cos(angle), -np.sin(angle) ], [ np.sin(angle), np.cos(angle) ]] for angle in angles ])
 
-        curr_pos = np.array([ 0.0, 0.0 ])
-        curr_dir = np.array([ np.cos(initial_angle), np.sin(initial_angle) ])
+        # Per-jump values, wrapping to the start of each list
+        i = np.arange(max(n_points - 1, 0))
+
+        data, is_clip = OsuUtils.__generate(
+            np.asarray([ initial_angle ], dtype=np.float64),
+            dists[i % len(dists)][None, :],
+            times[i % len(times)][None, :],
+            angles[i % len(angles)][None, :],
+            n_points, n_repeats
+        )
+
+        return data[0], bool(is_clip[0])
+
+
+    @staticmethod
+    def generate_patterns(initial_angles, distances, times, angles, n_points: 'int', n_repeats: 'int' = 1):
+        """
+        Create many patterns of osu circles at once, one for each setting.
+
+        parameters:
+            initial_angles, distances, times, angles: a value or array of values per pattern,
+                                                      same meaning as in `generate_pattern2`
+            n_points: number of distinct points in each pattern
+            n_repeats: each pattern is played this many times, reversing direction on each repeat
+
+        returns:
+            (np.array of shape [num patterns, n_points*n_repeats, 3], np.array of is_clip per pattern)
+            each pattern being the same as `generate_pattern2` returns for its setting
+        """
+        initial_angles, distances, times, angles = np.broadcast_arrays(
+            np.asarray(initial_angles, dtype=np.float64),
+            np.asarray(distances, dtype='f'),
+            np.asarray(times, dtype='f'),
+            np.asarray(angles, dtype='f'),
+        )
+
+        initial_angles = initial_angles.reshape(-1)
+        num_jumps = max(n_points - 1, 0)
+
+        return OsuUtils.__generate(
+            initial_angles,
+            np.repeat(distances.reshape(-1, 1), num_jumps, axis=1),
+            np.repeat(times.reshape(-1, 1), num_jumps, axis=1),
+            np.repeat(angles.reshape(-1, 1), num_jumps, axis=1),
+            n_points, n_repeats
+        )
+
+
+    @staticmethod
+    def __generate(initial_angles, dists, times, angles, n_points, n_repeats):
+        """
+        Patterns from per-jump values of shape [num patterns, n_points - 1]
+
+        The direction of each jump is the previous one rotated by the jump's angle. The rotation
+        matrices are built from float32 cos/sin, so each is a rotation by atan2(sin, cos) scaled by
+        hypot(sin, cos). Accumulating those angles and scales reproduces the direction of every jump
+        without walking the notes one by one, and matches the note by note rotation to the last bit
+        of the rounded note positions.
+        """
+        if n_points < 2:
+            raise ValueError(f'A pattern needs at least 2 points, got {n_points}')
+
+        num_patterns = initial_angles.shape[0]
+
+        cos_a = np.cos(angles).astype(np.float64)
+        sin_a = np.sin(angles).astype(np.float64)
+
+        # Total rotation and scale applied to the initial direction before each jump
+        thetas = np.zeros(dists.shape)
+        scales = np.ones(dists.shape)
+        np.cumsum(np.arctan2(sin_a, cos_a)[:, :-1], axis=1, out=thetas[:, 1:])
+        np.cumprod(np.hypot(sin_a, cos_a)[:, :-1], axis=1, out=scales[:, 1:])
+        thetas += initial_angles[:, None]
+
+        lengths = scales*dists
 
-        points   = [ curr_pos ]
-        delta_ts = []
+        points = np.zeros((num_patterns, n_points, 2))
+        np.cumsum(np.cos(thetas)*lengths, axis=1, out=points[:, 1:, 0])
+        np.cumsum(np.sin(thetas)*lengths, axis=1, out=points[:, 1:, 1])
 
-        for i in range(n_points - 1):
-            curr_pos = curr_pos + curr_dir * dists[i % len(dists)]
-            delta_t  = times[i % len(times)]
-            curr_dir = rots[i % len(angles)] @ curr_dir
+        center = (np.max(points, axis=1) + np.min(points, axis=1))/2
+        points = points - center[:, None, :] + [[[ 256, 192 ]]]
 
-            points.append(curr_pos)
-            delta_ts.append(delta_t)
+        # Repeats go back and forth over the pattern, same as padding points with mode='reflect'
+        # and times with mode='symmetric', done as a single lookup instead of repeated padding
+        k = np.arange(n_points*n_repeats)
+        pt_idx = k % (2*(n_points - 1))
+        pt_idx = np.where(pt_idx < n_points, pt_idx, 2*(n_points - 1) - pt_idx)
+        dt_idx = (k - 1) % (2*(n_points - 1))
+        dt_idx = np.where(dt_idx < n_points - 1, dt_idx, 2*(n_points - 1) - 1 - dt_idx)
 
-        center = (np.max(points, axis=0) + np.min(points, axis=0))/2
-        points   = np.array(points) - center + [[ 256, 192 ]] 
-        points   = np.pad(points, ((0, (n_repeats - 1)*n_points), (0, 0)), mode='reflect')
-        delta_ts = np.pad(delta_ts, (1, (n_repeats - 1)*n_points), mode='symmetric')
-        delta_ts[0] = 0
+        delta_ts = times[:, dt_idx]
+        delta_ts[:, 0] = 0
 
-        data = np.column_stack((points, np.cumsum(delta_ts)))
+        data = np.empty((num_patterns, n_points*n_repeats, 3))
+        data[:, :, :2] = points[:, pt_idx]
+        data[:, :, 2]  = np.cumsum(delta_ts, axis=1)  # Accumulated in float32, same as the times
 
         # osu! clips note positions into boundaries of the playfield
-        is_clip = np.any((data[:, 0] < 0) | (data[:, 0] > 512)) or np.any((data[:, 1] < 0) | (data[:, 1] > 384))
+        is_clip = np.any((data[:, :, 0] < 0) | (data[:, :, 0] > 512), axis=1) | np.any((data[:, :, 1] < 0) | (data[:, :, 1] > 384), axis=1)
 
-        data[:, 0] = np.round(np.minimum(512, np.maximum(0, data[:, 0])))
-        data[:, 1] = np.round(np.minimum(384, np.maximum(0, data[:, 1])))
+        data[:, :, 0] = np.round(np.minimum(512, np.maximum(0, data[:, :, 0])))
+        data[:, :, 1] = np.round(np.minimum(384, np.maximum(0, data[:, :, 1])))
 
         return data, is_clip
 
@@ -0,0 +1,72 @@
+import collections
+import threading
+import math
+
+from app.misc._osu_utils import OsuUtils
+
+
+class PatternCache():
+    """
+    Least recently used patterns of the generated maps, with their clip flags.
+
+    The map preview regenerates its pattern on every settings change and the
+    map is generated again from the same settings when started, so patterns are
+    cached by the settings they are made from. Scrolling back to settings seen
+    before and starting a previewed map cost a lookup. Returned patterns are
+    shared and read-only.
+
+    Can be used from any thread.
+    """
+
+    MAX_PATTERNS = 64
+
+    def __init__(self, max_patterns=MAX_PATTERNS):
+        self.max_patterns = max_patterns
+
+        self.num_hits   = 0
+        self.num_misses = 0
+
+        self.__patterns = collections.OrderedDict()
+        self.__lock = threading.Lock()
+
+
+    def get(self, rot, dx, bpm, angle, notes, repeats, rate_multiplier=1.0):
+        """
+        parameters:
+            rot, dx, bpm, angle, notes, repeats: map settings, angles in degrees
+            rate_multiplier: 1.5 if the map is meant to be played with DT/NC, otherwise 1.0
+
+        returns:
+            (pattern, is_clip) as made by `OsuUtils.generate_pattern2`
+        """
+        key = (rot, dx, bpm, angle, notes, repeats, rate_multiplier)
+
+        with self.__lock:
+            try: entry = self.__patterns[key]
+            except KeyError:
+                entry = None
+
+            if type(entry) != type(None):
+                self.__patterns.move_to_end(key)
+                self.num_hits += 1
+                return entry
+
+            self.num_misses += 1
+
+        # Generated outside of the lock. Threads missing on the same settings at once each generate it
+        pattern, is_clip = OsuUtils.generate_pattern2(rot*math.pi/180, dx, 60/bpm*rate_multiplier, angle*math.pi/180, notes, repeats)
+        pattern.flags.writeable = False
+
+        with self.__lock:
+            # Drop the least recently used pattern
+            while len(self.__patterns) >= self.max_patterns:
+                self.__patterns.popitem(last=False)
+
+            entry = self.__patterns[key] = (pattern, is_clip)
+
+        return entry
+
+
+    def clear(self):
+        with self.__lock:
+            self.__patterns.clear()
@@ -0,0 +1,96 @@
+import numpy as np
+import pyqtgraph
+
+
+class PlotPool():
+    """
+    Reusable plot items of a graph, keyed by series id.
+
+    Instead of clearing the graph and creating new items on every replot,
+    a replot is wrapped in `begin` and `end`. Items plotted in between are
+    updated in place with `setData`, and items that were not plotted in that
+    round are hidden and dropped from the legend until they are used again.
+    """
+
+    # r->g->b gradient shared by all graphs
+    COLORS = np.array(
+        [
+            [  0, 100, 255, 200],
+            [100, 255, 100, 200],
+            [255, 100, 100, 200],
+        ]
+    )
+
+    __color_maps = {}
+
+    def __init__(self, graph):
+        self.__graph = graph
+        self.__items = {}  # series id -> PlotDataItem
+        self.__names = {}  # series id -> name shown in legend
+        self.__used  = set()
+
+
+    def begin(self):
+        self.__used = set()
+
+
+    def plot(self, series_id, **kwargs):
+        name = kwargs.pop('name', None)
+
+        try: item = self.__items[series_id]
+        except KeyError:
+            item = self.__graph.plot(**kwargs)
+            self.__items[series_id] = item
+            self.__names[series_id] = None
+        else:
+            item.setData(**kwargs)
+            item.show()
+
+        self.__set_name(series_id, item, name)
+        self.__used.add(series_id)
+        return item
+
+
+    def end(self):
+        for series_id, item in self.__items.items():
+            if series_id in self.__used:
+                continue
+
+            item.hide()
+            self.__set_name(series_id, item, None)
+
+
+    def clear(self):
+        self.begin()
+        self.end()
+
+
+    @staticmethod
+    def color_map(val_min, val_max):
+        # Color maps are the same for the same range, so build each only once
+        key = (float(val_min), float(val_max))
+
+        try: return PlotPool.__color_maps[key]
+        except KeyError:
+            pass
+
+        color_map = pyqtgraph.ColorMap(np.linspace(val_min, val_max, 3), PlotPool.COLORS)
+        PlotPool.__color_maps[key] = color_map
+        return color_map
+
+
+    def __set_name(self, series_id, item, name):
+        if self.__names[series_id] == name:
+            return
+
+        legend = self.__graph.getPlotItem().legend
+        if type(legend) != type(None):
+            if type(self.__names[series_id]) == type(None):
+                legend.addItem(item, name)
+            elif type(name) == type(None):
+                legend.removeItem(item)
+            else:
+                legend.getLabel(item).setText(name)
+
+        item.opts['name'] = name
+        self.__names[series_id] = name
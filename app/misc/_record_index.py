@@ -0,0 +1,141 @@
+import numpy as np
+import hashlib
+import os
+
+from app.misc._data_schema import DataV3
+
+
+class RecordIndex():
+    """
+    Hash index mapping a pattern setting (bpm, px, rot, angle, notes) to the
+    ids of the records made with it.
+
+    The index is saved next to the data file's record log along with the
+    number of records it covers and a fingerprint of them (see `fingerprint`).
+    On load, a saved index is reused as long as the data file still starts with
+    those records, and only the records appended since are indexed. Otherwise
+    it is rebuilt from the records and saved right away. Saving writes the
+    whole index, so it is meant for closing or switching data files and after
+    compaction, not for every record.
+    """
+
+    KEY_COLS = (DataV3.COL_BPM, DataV3.COL_PX, DataV3.COL_ROT, DataV3.COL_ANGLE, DataV3.COL_NUM)
+
+    FINGERPRINT_ROWS = 256  # Records sampled across the data file
+    FINGERPRINT_TAIL = 64   # Latest records, always sampled
+
+    def __init__(self, index_file, data):
+        self.index_file = index_file
+        self.num_rows   = 0
+
+        self.__index = {}
+        self.__empty = np.empty(0, dtype=np.int64)
+
+        if not self.__load(data):
+            self.rebuild(data)
+            self.save(data)
+
+
+    def lookup(self, key):
+        try: return self.__index[tuple(key)]
+        except KeyError:
+            return self.__empty
+
+
+    def add(self, key, row_id):
+        key = tuple(key)
+        self.__index[key] = np.append(self.lookup(key), row_id)
+        self.num_rows = max(self.num_rows, row_id + 1)
+
+
+    def rebuild(self, data):
+        self.__index  = {}
+        self.num_rows = 0
+        self.__add_rows(data, 0)
+
+
+    @staticmethod
+    def fingerprint(data, cols):
+        """
+        Digest of the number of records and of the `cols` values of a sample of
+        them: evenly spread over the whole file plus the latest ones. Reads a
+        fixed number of records however large the data file is, so a memory
+        mapped file is not paged in just to check a saved index against it.
+        """
+        num_rows = data.shape[0]
+
+        rows = np.arange(max(num_rows - RecordIndex.FINGERPRINT_TAIL, 0), num_rows)
+        if num_rows > 0:
+            rows = np.union1d(np.linspace(0, num_rows - 1, RecordIndex.FINGERPRINT_ROWS).astype(np.int64), rows)
+
+        sample = data[rows]
+        digest = hashlib.sha1(str(num_rows).encode())
+        for col in cols:
+            digest.update(np.ascontiguousarray(sample[col], dtype='<f8').tobytes())
+
+        return digest.hexdigest()
+
+
+    def save(self, data):
+        # `data` are the records of the data file, the index covers the first `num_rows` of them
+        num_keys = len(self.__index)
+        if num_keys == 0:
+            keys = np.empty((0, len(RecordIndex.KEY_COLS)), dtype=np.int64)
+        else:
+            keys = np.asarray(list(self.__index.keys()), dtype=np.int64)
+
+        counts  = np.asarray([ ids.shape[0] for ids in self.__index.values() ], dtype=np.int64)
+        row_ids = np.concatenate(list(self.__index.values())) if num_keys > 0 else self.__empty
+
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        fingerprint = RecordIndex.fingerprint(data[:self.num_rows], RecordIndex.KEY_COLS)
+
+        # Written to a temporary file first, so a crash never leaves a partial index behind
+        tmp_file = f'{os.path.splitext(self.index_file)[0]}.tmp.npz'
+        np.savez(tmp_file, keys=keys, row_ids=row_ids, counts=counts, num_rows=self.num_rows, fingerprint=fingerprint)
+        os.replace(tmp_file, self.index_file)
+
+
+    def __load(self, data):
+        try:
+            with np.load(self.index_file, allow_pickle=False) as index:
+                # Index of a different data file, or of records that have changed since
+                num_rows = int(index['num_rows'])
+                if num_rows > data.shape[0]:
+                    return False
+
+                if str(index['fingerprint']) != RecordIndex.fingerprint(data[:num_rows], RecordIndex.KEY_COLS):
+                    return False
+
+                self.num_rows = num_rows
+                self.__build(index['keys'], index['row_ids'], index['counts'])
+
+        except (FileNotFoundError, KeyError, ValueError):
+            return False
+
+        # Records appended since the index was saved
+        self.__add_rows(data, self.num_rows)
+        return True
+
+
+    def __add_rows(self, data, start):
+        # Indexes records from `start` on
+        if data.shape[0] > start:
+            keys = np.column_stack([ data[col][start:].astype(np.int64) for col in RecordIndex.KEY_COLS ])
+            unique_keys, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+
+            # Row ids grouped by key, in record order within each group
+            row_ids = start + np.argsort(inverse.reshape(-1), kind='stable')
+            offsets = np.concatenate(([ 0 ], np.cumsum(counts)))
+
+            for i in range(unique_keys.shape[0]):
+                key = tuple(unique_keys[i].tolist())
+                self.__index[key] = np.concatenate((self.lookup(key), row_ids[offsets[i]:offsets[i + 1]]))
+
+        self.num_rows = max(self.num_rows, data.shape[0])
+
+
+    def __build(self, keys, row_ids, counts):
+        offsets = np.concatenate(([ 0 ], np.cumsum(counts)))
+        for i in range(keys.shape[0]):
+            self.__index[tuple(keys[i].tolist())] = row_ids[offsets[i]:offsets[i + 1]]
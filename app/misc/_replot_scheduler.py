@@ -0,0 +1,122 @@
+from pyqtgraph.Qt import QtCore
+
+from app.misc._timing import Timing
+
+
+class ReplotScheduler(QtCore.QObject):
+    """
+    Coalesces replot requests into at most one recompute per graph per frame.
+
+    Region drags, checkbox toggles and deviation select changes request a
+    replot instead of running it. Requests are keyed by graph; a newer request
+    for a graph that already has one pending replaces it, and all pending
+    requests run together once the frame timer fires. Plot functions read the
+    current regions and settings when they run, so the latest request is the
+    only one that matters.
+
+    Requests may name the widget the graph is drawn in. If that widget is not
+    visible (e.g. a dock stacked behind another tab), the graph is only marked
+    dirty and its latest request runs once the widget is shown.
+    """
+
+    FRAME_MS = 16  # ~60 fps
+
+    def __init__(self, parent=None, timing=None):
+        QtCore.QObject.__init__(self, parent)
+
+        self.__timing = timing if type(timing) != type(None) else Timing()
+
+        self.__pending = {}
+        self.__dirty   = {}  # key -> latest request deferred until its widget is shown
+        self.__widgets = {}  # watched widget -> key
+
+        self.num_requests = 0  # Replots requested
+        self.num_dropped  = 0  # Requests replaced by a newer one before they ran
+        self.num_runs     = 0  # Replots that actually ran
+
+        self.__timer = QtCore.QTimer(self)
+        self.__timer.setSingleShot(True)
+        self.__timer.setInterval(ReplotScheduler.FRAME_MS)
+        self.__timer.timeout.connect(self.flush)
+
+
+    def request(self, key, callback, widget=None):
+        self.num_requests += 1
+
+        if key in self.__pending or key in self.__dirty:
+            self.num_dropped += 1
+
+        if type(widget) != type(None):
+            self.__watch(key, widget)
+
+            if not widget.isVisible():
+                # Nobody would see the result. Replot when the widget is shown instead
+                self.__pending.pop(key, None)
+                self.__dirty[key] = callback
+                return
+
+        self.__dirty.pop(key, None)
+
+        # Replacing keeps the original position, so graphs still replot in the order first requested
+        self.__pending[key] = callback
+
+        if not self.__timer.isActive():
+            self.__timer.start()
+
+
+    def cancel(self, key):
+        if self.__pending.pop(key, None) == None and self.__dirty.pop(key, None) == None:
+            return
+
+        self.num_dropped += 1
+
+
+    def flush(self):
+        # Runs all pending replots now. Requests made while running are scheduled for the next frame
+        self.__timer.stop()
+
+        pending = self.__pending
+        self.__pending = {}
+
+        with self.__timing.span('replot', 'replot'):
+            for key, callback in pending.items():
+                self.num_runs += 1
+                with self.__timing.span(key, 'replot'):
+                    callback()
+
+
+    def is_pending(self, key=None):
+        if key == None:
+            return len(self.__pending) > 0
+
+        return key in self.__pending
+
+
+    def is_dirty(self, key):
+        return key in self.__dirty
+
+
+    def eventFilter(self, obj, event):
+        if event.type() == QtCore.QEvent.Show:
+            try: key = self.__widgets[obj]
+            except KeyError:
+                return False
+
+            # Widget became visible (e.g. its dock was raised). Run the deferred replot
+            try: callback = self.__dirty.pop(key)
+            except KeyError:
+                return False
+
+            self.__pending[key] = callback
+            if not self.__timer.isActive():
+                self.__timer.start()
+
+        return False
+
+
+    def __watch(self, key, widget):
+        if widget in self.__widgets:
+            return
+
+        self.__widgets[widget] = key
+        widget.installEventFilter(self)
@@ -0,0 +1,80 @@
+import collections
+import numpy as np
+
+
+class SelectionCache():
+    """
+    Region masks and unique values of record columns, shared by all graphs.
+
+    Every graph filters the same records by the regions of its SelectPlot side
+    panels and plots the unique values of the same columns. Masks are cached by
+    (column, region bounds, data version) and unique values by (column, data
+    version), so filters that did not change since the last replot cost nothing.
+
+    The data version is bumped with `invalidate` whenever records are appended
+    or a different data file is loaded, which drops everything cached.
+
+    A mask takes a byte per record, so masks are bounded by their total size
+    rather than their number: least recently used ones are dropped once they
+    take more than `max_bytes`. The mask just made is always kept.
+    """
+
+    MAX_BYTES = 64*2**20  # Region drags produce a new mask every tick
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.version   = 0
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+
+        self.__masks   = collections.OrderedDict()
+        self.__uniques = {}
+
+
+    def invalidate(self):
+        self.version  += 1
+        self.num_bytes = 0
+
+        self.__masks   = collections.OrderedDict()
+        self.__uniques = {}
+
+
+    def select(self, data, col, bounds):
+        """
+        Mask of records with `col` within inclusive `bounds`. Returned masks are
+        shared and read-only; combine them with `&` into a new array.
+        """
+        lo, hi = bounds
+        key = (col, float(lo), float(hi), self.version)
+
+        try: mask = self.__masks[key]
+        except KeyError:
+            mask = None
+
+        if type(mask) != type(None):
+            self.__masks.move_to_end(key)
+            return mask
+
+        mask = (lo <= data[col]) & (data[col] <= hi)
+        mask.flags.writeable = False
+
+        # Drop the least recently used masks
+        while len(self.__masks) > 0 and self.num_bytes + mask.nbytes > self.max_bytes:
+            self.num_bytes -= self.__masks.popitem(last=False)[1].nbytes
+
+        self.__masks[key] = mask
+        self.num_bytes += mask.nbytes
+        return mask
+
+
+    def unique(self, data, col):
+        key = (col, self.version)
+
+        try: return self.__uniques[key]
+        except KeyError:
+            pass
+
+        unique = np.unique(data[col])
+        unique.flags.writeable = False
+
+        self.__uniques[key] = unique
+        return unique
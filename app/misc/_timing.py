@@ -0,0 +1,113 @@
+import collections
+import contextlib
+import threading
+import json
+import time
+import os
+
+
+class TimingSpan():
+
+    __slots__ = ('timing', 'name', 'cat', 't0')
+
+    def __init__(self, timing, name, cat):
+        self.timing = timing
+        self.name   = name
+        self.cat    = cat
+
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+
+    def __exit__(self, *_):
+        self.timing.add(self.name, self.cat, self.t0, time.perf_counter_ns())
+        return False
+
+
+
+class Timing():
+    """
+    Lightweight timing spans of the stages of the app.
+
+    Code to be measured is wrapped in `with timing.span('name'):`. Finished
+    spans go to a ring buffer holding the latest `max_spans` of them, which the
+    diagnostics dock summarizes and which can be dumped as a Chrome trace
+    (chrome://tracing, Perfetto). While disabled, `span` returns a shared no-op
+    context manager, so instrumented code costs one attribute check per span.
+
+    Spans can be recorded from any thread.
+    """
+
+    MAX_SPANS = 4096
+
+    __null_span = contextlib.nullcontext()
+
+    def __init__(self, enabled=False, max_spans=MAX_SPANS):
+        self.enabled = enabled
+
+        self.__spans   = collections.deque(maxlen=max_spans)  # (name, cat, thread id, start ns, end ns)
+        self.__threads = {}  # thread id -> thread name
+
+
+    def span(self, name, cat='app'):
+        if not self.enabled:
+            return Timing.__null_span
+
+        return TimingSpan(self, name, cat)
+
+
+    def add(self, name, cat, t0_ns, t1_ns):
+        thread = threading.current_thread()
+        self.__threads[thread.ident] = thread.name
+        self.__spans.append((name, cat, thread.ident, t0_ns, t1_ns))
+
+
+    def clear(self):
+        self.__spans.clear()
+
+
+    def spans(self):
+        return list(self.__spans)
+
+
+    def summary(self):
+        """
+        returns:
+            dict of span name -> { count, last_ms, mean_ms, max_ms, total_ms } over
+            the spans in the buffer, in order of first appearance
+        """
+        summary = {}
+        for name, cat, tid, t0, t1 in self.spans():
+            ms = (t1 - t0)/1e6
+
+            try: stats = summary[name]
+            except KeyError:
+                stats = summary[name] = { 'count' : 0, 'last_ms' : 0.0, 'mean_ms' : 0.0, 'max_ms' : 0.0, 'total_ms' : 0.0 }
+
+            stats['count']    += 1
+            stats['last_ms']   = ms
+            stats['max_ms']    = max(stats['max_ms'], ms)
+            stats['total_ms'] += ms
+
+        for stats in summary.values():
+            stats['mean_ms'] = stats['total_ms']/stats['count']
+
+        return summary
+
+
+    def dump_chrome_trace(self, file_name):
+        # Complete ("X") events with microsecond timestamps, plus the names of the threads
+        pid = os.getpid()
+
+        events = [
+            { 'name' : 'thread_name', 'ph' : 'M', 'pid' : pid, 'tid' : tid, 'args' : { 'name' : name } }
+            for tid, name in list(self.__threads.items())
+        ]
+
+        for name, cat, tid, t0, t1 in self.spans():
+            events.append({ 'name' : name, 'cat' : cat, 'ph' : 'X', 'pid' : pid, 'tid' : tid, 'ts' : t0/1000, 'dur' : (t1 - t0)/1000 })
+
+        with open(file_name, 'w') as f:
+            json.dump({ 'traceEvents' : events, 'displayTimeUnit' : 'ms' }, f)
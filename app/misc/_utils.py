@@ -59,6 +59,9 @@ class MathUtils():
 
     @staticmethod
     def linear_regresion(x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
         x_avg = np.mean(x)
         y_avg = np.mean(y)
 
@@ -71,6 +74,76 @@ class MathUtils():
         return b, c
 
 
+    @staticmethod
+    def linear_regresion_groups(x, y, group_ids, num_groups=None):
+        '''
+        Fits y = mx + b for every group in one pass using per-group sums
+
+        parameters:
+            group_ids: group index (0..num_groups-1) of each x, y pair
+
+        returns:
+            dict of per-group arrays:
+                n, m, b, r_sq, snr,
+                m_dev_y (deviation of y from model), m_dev_x (deviation of x from model),
+                m_se_95, b_se_95 (standard error of slope and y-intercept @ 95% confidence interval)
+            m and b are nan where the fit failed, standard errors are nan where there is not enough data
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        group_ids = np.asarray(group_ids, dtype=np.int64)
+
+        if type(num_groups) == type(None):
+            num_groups = (np.max(group_ids) + 1) if group_ids.shape[0] > 0 else 0
+
+        n = np.bincount(group_ids, minlength=num_groups).astype(np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_avg = np.bincount(group_ids, weights=x, minlength=num_groups)/n
+            y_avg = np.bincount(group_ids, weights=y, minlength=num_groups)/n
+
+            # Centered sums, so large values do not lose precision
+            dx = x - x_avg[group_ids]
+            dy = y - y_avg[group_ids]
+
+            ss_xx = np.bincount(group_ids, weights=dx*dx, minlength=num_groups)
+            ss_xy = np.bincount(group_ids, weights=dx*dy, minlength=num_groups)
+            ss_yy = np.bincount(group_ids, weights=dy*dy, minlength=num_groups)
+
+            m = ss_xy/ss_xx      # slope
+            b = y_avg - m*x_avg  # y-intercept
+
+            failed = (n < 2) | ~np.isfinite(m) | ~np.isfinite(b)
+            m[failed] = np.nan
+            b[failed] = np.nan
+
+            # Sum of squared residuals
+            ss_res = np.bincount(group_ids, weights=(dy - m[group_ids]*dx)**2, minlength=num_groups)
+
+            m_dev_y = np.sqrt(ss_res/n)      # deviation of y from model
+            m_dev_x = m_dev_y/np.abs(m)      # deviation of x from model: x - (y - b)/m = -(y - mx - b)/m
+
+            r_sq = 1 - ss_res/ss_yy
+            snr  = np.sqrt(ss_yy/n)/m_dev_y
+
+            m_se_95 = (m_dev_y/m_dev_x)/np.sqrt(n - 2)*1.96
+            m_se_95[(m_dev_x == 0) | (n < 3) | failed] = np.nan
+            b_se_95 = 2*m_se_95*x_avg
+
+        return {
+            'n'       : n.astype(np.int64),
+            'm'       : m,
+            'b'       : b,
+            'r_sq'    : r_sq,
+            'snr'     : snr,
+            'm_dev_y' : m_dev_y,
+            'm_dev_x' : m_dev_x,
+            'm_se_95' : m_se_95,
+            'b_se_95' : b_se_95,
+        }
+
+
+    @staticmethod
     def exp_regresion(x, y):
         '''
         Thanks: https://math.stackexchange.com/a/2318659
@@ -82,36 +155,102 @@ class MathUtils():
         if y.shape[0] != x.shape[0]:
             raise ValueError('x and y must have the same length')
 
+        # Settings columns may be unsigned, which would wrap around on subtraction
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+
+        # Cumulative trapezoid integral of y over x
         s = np.zeros(x.shape[0])
-        for k in range(1, x.shape[0]):
-            s[k] = s[k-1] + (x[k] - x[k-1])*(y[k] + y[k-1])/2
-
-        mat_c0 = np.linalg.inv(np.asarray([
-            [ np.sum((x - x[0])**2),  np.sum((x - x[0])*s) ],
-            [ np.sum((x - x[0])*s),   np.sum(s**2)         ]
-        ]))
-
-        mat_c1 = np.asarray([
-            [ np.sum((y - y[0])*(x - x[0])) ],
-            [ np.sum((y - y[0])*s) ]
-        ]),
-
-        mat_dot = np.dot(mat_c0, mat_c1)
-        c = mat_dot[1][0][0]
-
-        mat_ab0 = np.linalg.inv(np.asarray([
-            [ x.shape[0],          np.sum(np.exp(c*x))   ],
-            [ np.sum(np.exp(c*x)), np.sum(np.exp(2*c*x)) ]
-        ]))
-
-        mat_ab1 = np.asarray([
-            [ np.sum(y) ],
-            [ np.sum(y*np.exp(c*x)) ]
-        ])
-
-        mat_dot = np.dot(mat_ab0, mat_ab1)
-        a = mat_dot[0][0]
-        b = mat_dot[1][0]
+        np.cumsum(np.diff(x)*(y[1:] + y[:-1])/2, out=s[1:])
+
+        dx = x - x[0]
+        dy = y - y[0]
+
+        # Solve [ Σdx² Σdx*s ; Σdx*s Σs² ] * [ _ ; c ] = [ Σdy*dx ; Σdy*s ]
+        s_xx, s_xs, s_ss = np.sum(dx*dx), np.sum(dx*s), np.sum(s*s)
+        s_yx, s_ys       = np.sum(dy*dx), np.sum(dy*s)
+
+        det = s_xx*s_ss - s_xs*s_xs
+        if det == 0:
+            raise np.linalg.LinAlgError('Singular matrix')
+
+        c = (s_xx*s_ys - s_xs*s_yx)/det
+
+        # Solve [ n Σe^(cx) ; Σe^(cx) Σe^(2cx) ] * [ a ; b ] = [ Σy ; Σy*e^(cx) ]
+        e = np.exp(c*x)
+        s_e, s_ee = np.sum(e), np.sum(e*e)
+        s_y, s_ye = np.sum(y), np.sum(y*e)
+
+        det = x.shape[0]*s_ee - s_e*s_e
+        if det == 0:
+            raise np.linalg.LinAlgError('Singular matrix')
+
+        a = (s_ee*s_y - s_e*s_ye)/det
+        b = (x.shape[0]*s_ye - s_e*s_y)/det
+
+        return a, b, c
+
+
+    @staticmethod
+    def exp_regresion_groups(x, y, group_ids, num_groups=None):
+        '''
+        Fits y = a + be^(cx) for every group in one pass. Same method as `exp_regresion`
+
+        parameters:
+            group_ids: group index (0..num_groups-1) of each x, y pair. Points are
+                       integrated in the order they appear within each group
+
+        returns:
+            (a, b, c) per-group arrays. nan where the group has less than 4 points
+            or the fit is singular
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        group_ids = np.asarray(group_ids, dtype=np.int64)
+
+        if type(num_groups) == type(None):
+            num_groups = (np.max(group_ids) + 1) if group_ids.shape[0] > 0 else 0
+
+        # Lay each group out contiguously, keeping the order of points within it
+        order = np.argsort(group_ids, kind='stable')
+        x, y, group_ids = x[order], y[order], group_ids[order]
+
+        n = np.bincount(group_ids, minlength=num_groups)
+        starts = np.concatenate(([ 0 ], np.cumsum(n)[:-1])).astype(np.int64)
+        firsts = np.minimum(starts, max(x.shape[0] - 1, 0))
+
+        # Cumulative trapezoid integral of y over x, restarting at each group
+        terms = np.zeros(x.shape[0])
+        terms[1:] = np.diff(x)*(y[1:] + y[:-1])/2
+        terms[starts[n > 0]] = 0
+
+        s = np.cumsum(terms)
+        s -= s[firsts][group_ids]
+
+        dx = x - x[firsts][group_ids]
+        dy = y - y[firsts][group_ids]
+
+        segment_sum = lambda values: np.bincount(group_ids, weights=values, minlength=num_groups)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            s_xx, s_xs, s_ss = segment_sum(dx*dx), segment_sum(dx*s), segment_sum(s*s)
+            s_yx, s_ys       = segment_sum(dy*dx), segment_sum(dy*s)
+
+            det = s_xx*s_ss - s_xs*s_xs
+            c = (s_xx*s_ys - s_xs*s_yx)/det
+
+            e = np.exp(c[group_ids]*x)
+            s_e, s_ee = segment_sum(e), segment_sum(e*e)
+            s_y, s_ye = segment_sum(y), segment_sum(y*e)
+
+            det_ab = n*s_ee - s_e*s_e
+            a = (s_ee*s_y - s_e*s_ye)/det_ab
+            b = (n*s_ye - s_e*s_y)/det_ab
+
+        failed = (n < 4) | (det == 0) | (det_ab == 0) | ~np.isfinite(a) | ~np.isfinite(b) | ~np.isfinite(c)
+        a[failed] = np.nan
+        b[failed] = np.nan
+        c[failed] = np.nan
 
         return a, b, c
 
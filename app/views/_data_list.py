@@ -89,8 +89,11 @@ class DataList(QtGui.QListWidget):
         if self.selected_data_id == selected_data_id:
             return
 
+        # The data file open before stays in use if the selected one can not be loaded
+        if not self.app.load_data_file(selected_data_id):
+            return
+
         self.selected_data_id = selected_data_id
-        self.app.load_data_file(selected_data_id)
         self.app.replot_graphs()
 
 
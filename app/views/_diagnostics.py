@@ -0,0 +1,90 @@
+from pyqtgraph.Qt import QtGui
+from pyqtgraph.Qt import QtCore
+
+
+
+class Diagnostics(QtGui.QWidget):
+    """
+    Summary of the timing spans recorded by the app, one row per stage.
+    """
+
+    REFRESH_MS = 500
+
+    COLUMNS = [ 'stage', 'count', 'last (ms)', 'mean (ms)', 'max (ms)' ]
+
+    def __init__(self, timing):
+        QtGui.QWidget.__init__(self)
+
+        self.timing = timing
+
+        self.enable_chkbx = QtGui.QCheckBox('Record timings')
+        self.enable_chkbx.setChecked(self.timing.enabled)
+        self.enable_chkbx.stateChanged.connect(self.__enable_chkbx_event)
+
+        self.clear_btn = QtGui.QPushButton('Clear')
+        self.clear_btn.clicked.connect(self.__clear_btn_clicked)
+
+        self.dump_btn = QtGui.QPushButton('Save trace')
+        self.dump_btn.clicked.connect(self.__dump_btn_clicked)
+
+        self.table = QtGui.QTableWidget(0, len(Diagnostics.COLUMNS))
+        self.table.setHorizontalHeaderLabels(Diagnostics.COLUMNS)
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setStretchLastSection(True)
+
+        self.btn_layout = QtGui.QHBoxLayout()
+        self.btn_layout.addWidget(self.enable_chkbx)
+        self.btn_layout.addStretch()
+        self.btn_layout.addWidget(self.clear_btn)
+        self.btn_layout.addWidget(self.dump_btn)
+
+        self.layout = QtGui.QVBoxLayout(self)
+        self.layout.setContentsMargins(2, 2, 2, 2)
+        self.layout.addLayout(self.btn_layout)
+        self.layout.addWidget(self.table)
+
+        # Only refreshes while shown
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(Diagnostics.REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+
+
+    def showEvent(self, event):
+        QtGui.QWidget.showEvent(self, event)
+        self.refresh()
+        self.timer.start()
+
+
+    def hideEvent(self, event):
+        QtGui.QWidget.hideEvent(self, event)
+        self.timer.stop()
+
+
+    def refresh(self):
+        summary = self.timing.summary()
+        self.table.setRowCount(len(summary))
+
+        for row, (name, stats) in enumerate(summary.items()):
+            values = [ name, f'{stats["count"]}', f'{stats["last_ms"]:.2f}', f'{stats["mean_ms"]:.2f}', f'{stats["max_ms"]:.2f}' ]
+            for col, value in enumerate(values):
+                self.table.setItem(row, col, QtGui.QTableWidgetItem(value))
+
+
+    def __enable_chkbx_event(self, state):
+        self.timing.enabled = (state == QtCore.Qt.Checked)
+
+
+    def __clear_btn_clicked(self):
+        self.timing.clear()
+        self.refresh()
+
+
+    def __dump_btn_clicked(self):
+        file_name = QtGui.QFileDialog.getSaveFileName(self, 'Save trace', 'trace.json', 'Chrome trace (*.json)')
+        file_name = file_name[0]
+
+        if len(file_name) == 0:
+            return
+
+        self.timing.dump_chrome_trace(file_name)
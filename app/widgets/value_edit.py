@@ -78,3 +78,11 @@ class ValueEdit(QtWidgets.QWidget):
     def value_increase(self):
         if hasattr(self.value, 'auto_value_cache'):
             self.set_value(self.value.value() + self.value.auto_value_cache)
+
+
+    def next_value(self):
+        # Value `value_increase` would set, clamped to the range the same as the spinbox does
+        if not hasattr(self.value, 'auto_value_cache'):
+            return self.value.value()
+
+        return min(max(self.value.value() + self.value.auto_value_cache, self.value.minimum()), self.value.maximum())
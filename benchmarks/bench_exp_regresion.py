@@ -0,0 +1,118 @@
+'''
+Throughput of the exponential fit used by the deviation vs angle graph.
+
+Compares the previous loop + matrix inverse implementation against the
+vectorized `MathUtils.exp_regresion` called per group, and against the batched
+`MathUtils.exp_regresion_groups` fitting all groups at once.
+
+Run from the repository root:
+    python -m benchmarks.bench_exp_regresion
+'''
+import sys
+import time
+import numpy as np
+
+from app.misc._utils import MathUtils
+
+
+def exp_regresion_loop(x, y):
+    # Implementation prior to vectorization, kept as the baseline
+    if y.shape[0] < 4:
+        return None, None, None
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    s = np.zeros(x.shape[0])
+    for k in range(1, x.shape[0]):
+        s[k] = s[k-1] + (x[k] - x[k-1])*(y[k] + y[k-1])/2
+
+    mat_c0 = np.linalg.inv(np.asarray([
+        [ np.sum((x - x[0])**2),  np.sum((x - x[0])*s) ],
+        [ np.sum((x - x[0])*s),   np.sum(s**2)         ]
+    ]))
+
+    mat_c1 = np.asarray([
+        [ np.sum((y - y[0])*(x - x[0])) ],
+        [ np.sum((y - y[0])*s) ]
+    ])
+
+    c = np.dot(mat_c0, mat_c1)[1][0]
+
+    mat_ab0 = np.linalg.inv(np.asarray([
+        [ x.shape[0],          np.sum(np.exp(c*x))   ],
+        [ np.sum(np.exp(c*x)), np.sum(np.exp(2*c*x)) ]
+    ]))
+
+    mat_ab1 = np.asarray([
+        [ np.sum(y) ],
+        [ np.sum(y*np.exp(c*x)) ]
+    ])
+
+    mat_dot = np.dot(mat_ab0, mat_ab1)
+    return mat_dot[0][0], mat_dot[1][0], c
+
+
+def make_groups(num_groups, group_size, rng):
+    # Deviation vs angle series: a + be^(cx) plus noise, sampled at random angles
+    groups = []
+    for _ in range(num_groups):
+        x = np.sort(rng.choice(181, group_size, replace=False)).astype(np.float64)
+        y = rng.uniform(1, 3) + rng.uniform(2, 6)*np.exp(-rng.uniform(0.01, 0.05)*x) + rng.normal(0, 0.05, group_size)
+        groups.append((x, y))
+
+    return groups
+
+
+def time_it(func, min_time=0.2):
+    # Best of repeated runs, each repeated until `min_time` has passed
+    best = float('inf')
+    for _ in range(3):
+        num = 0
+        t0 = time.perf_counter()
+        while True:
+            func()
+            num += 1
+
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time:
+                break
+
+        best = min(best, elapsed/num)
+
+    return best
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    print(f'{"groups":>8} {"size":>6} {"loop fits/s":>14} {"vec fits/s":>14} {"batch fits/s":>14} {"vec x":>7} {"batch x":>8}')
+
+    for num_groups, group_size in [ (1, 20), (10, 20), (50, 40), (180, 40), (180, 160) ]:
+        groups = make_groups(num_groups, group_size, rng)
+
+        x = np.concatenate([ x for x, y in groups ])
+        y = np.concatenate([ y for x, y in groups ])
+        group_ids = np.repeat(np.arange(num_groups), group_size)
+
+        # Make sure all implementations agree before timing them
+        a, b, c = MathUtils.exp_regresion_groups(x, y, group_ids, num_groups)
+        for i, (gx, gy) in enumerate(groups):
+            ref = exp_regresion_loop(gx, gy)
+            if not np.allclose((a[i], b[i], c[i]), ref, rtol=1e-6) or not np.allclose(MathUtils.exp_regresion(gx, gy), ref, rtol=1e-6):
+                print(f'Mismatch in group {i}: {ref} vs {(a[i], b[i], c[i])}')
+                sys.exit(1)
+
+        t_loop  = time_it(lambda: [ exp_regresion_loop(gx, gy) for gx, gy in groups ])
+        t_vec   = time_it(lambda: [ MathUtils.exp_regresion(gx, gy) for gx, gy in groups ])
+        t_batch = time_it(lambda: MathUtils.exp_regresion_groups(x, y, group_ids, num_groups))
+
+        print(
+            f'{num_groups:>8} {group_size:>6} '
+            f'{num_groups/t_loop:>14.0f} {num_groups/t_vec:>14.0f} {num_groups/t_batch:>14.0f} '
+            f'{t_loop/t_vec:>7.1f} {t_loop/t_batch:>8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+'''
+Throughput of the pattern generator used for the generated maps.
+
+Compares the previous note by note implementation against the vectorized
+`OsuUtils.generate_pattern2` called per setting, and against the batched
+`OsuUtils.generate_patterns` generating all settings at once. Outputs must be
+identical, including the clip flags.
+
+Run from the repository root:
+    python -m benchmarks.bench_generate_pattern
+'''
+import sys
+import time
+import numpy as np
+
+from app.misc._osu_utils import OsuUtils
+
+
+def generate_pattern2_loop(initial_angle, distance, time, angle, n_points, n_repeats=1):
+    # Implementation prior to vectorization, kept as the baseline
+    dists  = np.array(distance, dtype='f').flatten()
+    times  = np.array(time, dtype='f').flatten()
+    angles = np.array(angle, dtype='f').flatten()
+    rots   = np.array([ [[ np.cos(angle), -np.sin(angle) ], [ np.sin(angle), np.cos(angle) ]] for angle in angles ])
+
+    curr_pos = np.array([ 0.0, 0.0 ])
+    curr_dir = np.array([ np.cos(initial_angle), np.sin(initial_angle) ])
+
+    points   = [ curr_pos ]
+    delta_ts = []
+
+    for i in range(n_points - 1):
+        curr_pos = curr_pos + curr_dir * dists[i % len(dists)]
+        delta_t  = times[i % len(times)]
+        curr_dir = rots[i % len(angles)] @ curr_dir
+
+        points.append(curr_pos)
+        delta_ts.append(delta_t)
+
+    center = (np.max(points, axis=0) + np.min(points, axis=0))/2
+    points   = np.array(points) - center + [[ 256, 192 ]]
+    points   = np.pad(points, ((0, (n_repeats - 1)*n_points), (0, 0)), mode='reflect')
+    delta_ts = np.pad(delta_ts, (1, (n_repeats - 1)*n_points), mode='symmetric')
+    delta_ts[0] = 0
+
+    data = np.column_stack((points, np.cumsum(delta_ts)))
+
+    is_clip = np.any((data[:, 0] < 0) | (data[:, 0] > 512)) or np.any((data[:, 1] < 0) | (data[:, 1] > 384))
+
+    data[:, 0] = np.round(np.minimum(512, np.maximum(0, data[:, 0])))
+    data[:, 1] = np.round(np.minimum(384, np.maximum(0, data[:, 1])))
+
+    return data, is_clip
+
+
+def make_settings(num_settings, rng):
+    # Same kind of values the app generates maps from: direction, spacing, ms between notes, angle
+    return (
+        rng.uniform(-np.pi, np.pi, num_settings),
+        rng.uniform(0, 400, num_settings),
+        60*1000/rng.uniform(60, 400, num_settings),
+        rng.uniform(0, np.pi, num_settings),
+    )
+
+
+def time_it(func, min_time=0.2):
+    # Best of repeated runs, each repeated until `min_time` has passed
+    best = float('inf')
+    for _ in range(3):
+        num = 0
+        t0 = time.perf_counter()
+        while True:
+            func()
+            num += 1
+
+            elapsed = time.perf_counter() - t0
+            if elapsed >= min_time:
+                break
+
+        best = min(best, elapsed/num)
+
+    return best
+
+
+def main():
+    rng = np.random.default_rng(0)
+
+    print(f'{"settings":>9} {"notes":>6} {"repeats":>8} {"loop maps/s":>13} {"vec maps/s":>13} {"batch maps/s":>13} {"vec x":>7} {"batch x":>8}')
+
+    for num_settings, n_points, n_repeats in [ (1, 3, 60), (1, 60, 10), (1, 2000, 60), (100, 3, 60), (100, 60, 10) ]:
+        settings = list(zip(*make_settings(num_settings, rng)))
+
+        # Make sure all implementations agree before timing them
+        data, is_clip = OsuUtils.generate_patterns(*zip(*settings), n_points, n_repeats)
+        for i, setting in enumerate(settings):
+            ref_data, ref_clip = generate_pattern2_loop(*setting, n_points, n_repeats)
+            vec_data, vec_clip = OsuUtils.generate_pattern2(*setting, n_points, n_repeats)
+
+            if not (np.array_equal(ref_data, data[i]) and np.array_equal(ref_data, vec_data) and ref_clip == is_clip[i] == vec_clip):
+                print(f'Mismatch in setting {i}: {setting}')
+                sys.exit(1)
+
+        t_loop  = time_it(lambda: [ generate_pattern2_loop(*setting, n_points, n_repeats) for setting in settings ])
+        t_vec   = time_it(lambda: [ OsuUtils.generate_pattern2(*setting, n_points, n_repeats) for setting in settings ])
+        t_batch = time_it(lambda: OsuUtils.generate_patterns(*zip(*settings), n_points, n_repeats))
+
+        print(
+            f'{num_settings:>9} {n_points:>6} {n_repeats:>8} '
+            f'{num_settings/t_loop:>13.0f} {num_settings/t_vec:>13.0f} {num_settings/t_batch:>13.0f} '
+            f'{t_loop/t_vec:>7.1f} {t_loop/t_batch:>8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main()
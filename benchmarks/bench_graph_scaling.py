@@ -0,0 +1,345 @@
+'''
+Scaling of the graph pipeline with the number of records in a data file.
+
+Generates synthetic data files of 1e3 to 1e7 records over the bpm/px/angle/rot/notes
+setting grid and times, for every size:
+    masks:          selection masks of all graphs (cold selection cache)
+    aggregates:     building the per-setting aggregate table (done on data file load)
+    aggregates_npz: loading the aggregate table saved next to the data file instead
+                    (done on data file load when the saved table is current)
+    <graph>:        series computation of every graph, as done by its plot_data,
+                    with and without averaging of data points (`_avg` suffix)
+    replot:         all of the above graphs back to back, as done by replot_graphs
+    write_data:     appending one record, as done by App.__write_data after a play
+
+Timings are the best of `--repeat` runs. Peak memory is the peak of traced
+allocations of a separate run of the stage.
+
+Results are written as JSON (`--out`, default stdout) so runs can be compared
+with `--compare`. Run from the repository root:
+    python -m benchmarks.bench_graph_scaling
+    python -m benchmarks.bench_graph_scaling --sizes 1e3 1e4 1e5 --out before.json
+    python -m benchmarks.bench_graph_scaling --sizes 1e3 1e4 1e5 --compare before.json
+'''
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.misc._data_schema import DataV3
+from app.misc._analytics import Analytics
+from app.misc._aggregate_table import AggregateTable
+from app.misc._selection_cache import SelectionCache
+from app.misc._derived_columns import DerivedColumns
+from app.misc._record_index import RecordIndex
+from app.misc._data_log import DataLog
+from app.misc._hit_archive import HitArchive
+
+
+MAX_NUM_DATA_POINTS = 5
+
+# Setting grid the records are spread over
+GRID = {
+    DataV3.COL_BPM   : np.arange(60, 401, 10),
+    DataV3.COL_PX    : np.arange(25, 501, 25),
+    DataV3.COL_ANGLE : np.arange(0, 181, 15),
+    DataV3.COL_ROT   : np.arange(0, 181, 30),
+    DataV3.COL_NUM   : np.asarray([ 30, 60, 120, 240, 500 ]),
+}
+
+# Initial selection regions of the graphs
+RANGES = {
+    'bpm'       : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_PX : (75, 125), DataV3.COL_ROT : (0, 30), DataV3.COL_NUM : (0, 120) },
+    'dx'        : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_BPM : (170, 190), DataV3.COL_ROT : (0, 30) },
+    'num_notes' : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_PX : (75, 125), DataV3.COL_BPM : (170, 190), DataV3.COL_ROT : (0, 30) },
+    'angle'     : { DataV3.COL_BPM : (170, 190), DataV3.COL_PX : (75, 125), DataV3.COL_ROT : (0, 30) },
+    'vel'       : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_PX : (75, 125), DataV3.COL_ROT : (0, 30) },
+    'tap_dev'   : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_BPM : (170, 190), DataV3.COL_PX : (75, 125) },
+    'grid'      : { DataV3.COL_ANGLE : (0, 180), DataV3.COL_ROT : (0, 30) },
+}
+
+# Cell edges of the bpm × px grid graph, as in StddevGraphGrid
+GRID_BPM_EDGES = np.arange(0, 1200 + 10, 10)
+GRID_PX_EDGES  = np.arange(0, 512 + 16, 16)
+
+DEV_COL = DataV3.COL_STDEV_X
+
+
+def make_dataset(num_rows, rng):
+    '''
+    Records played in sessions: a setting is picked from the grid and played a few
+    times in a row. Deviations grow with velocity and shrink with the angle between
+    notes, like real plays do.
+    '''
+    data = np.zeros(num_rows, dtype=DataV3.DTYPE)
+
+    # Settings of each session, repeated for each play in it
+    session_len = rng.integers(1, 8, size=num_rows//2 + 1)
+    session_ids = np.repeat(np.arange(session_len.shape[0]), session_len)[:num_rows]
+
+    for col, values in GRID.items():
+        data[col] = rng.choice(values, size=session_len.shape[0])[session_ids]
+
+    vel   = data[DataV3.COL_PX].astype(np.float64)*data[DataV3.COL_BPM]/60
+    angle = data[DataV3.COL_ANGLE].astype(np.float64)
+    skill = rng.uniform(0.8, 1.2, size=session_len.shape[0])[session_ids]
+
+    data[DataV3.COL_STDEV_X] = skill*(4 + 0.004*vel*(1.5 - angle/180)) + rng.gamma(2, 0.5, num_rows)
+    data[DataV3.COL_STDEV_Y] = skill*(3 + 0.002*vel) + rng.gamma(2, 0.5, num_rows)
+    data[DataV3.COL_STDEV_T] = skill*(10 + 0.1*data[DataV3.COL_BPM]) + rng.gamma(2, 2, num_rows)
+    data[DataV3.COL_AVG_X]   = rng.normal(0, 2, num_rows)
+    data[DataV3.COL_AVG_Y]   = rng.normal(0, 2, num_rows)
+    data[DataV3.COL_AVG_T]   = rng.normal(0, 5, num_rows)
+    data[DataV3.COL_CS]      = 4
+
+    return data
+
+
+def graph_stages(data, aggregates):
+    '''
+    Series computation of every graph. A fresh selection cache and derived column store
+    are used by every call, like the first replot after a new record was written
+    '''
+    def analytics():
+        return Analytics(data, aggregates, DerivedColumns(), SelectionCache())
+
+    def fit_angle(avg):
+        unique_bpms, groups = analytics().angle_groups(RANGES['angle'], DEV_COL, avg, MAX_NUM_DATA_POINTS)
+        return Analytics.angle_series(unique_bpms, groups, Analytics.fit_exp_groups(groups))
+
+    return {
+        'bpm'           : lambda: analytics().bpm(RANGES['bpm'], DEV_COL, False, MAX_NUM_DATA_POINTS),
+        'bpm_avg'       : lambda: analytics().bpm(RANGES['bpm'], DEV_COL, True, MAX_NUM_DATA_POINTS),
+        'dx'            : lambda: analytics().dx(RANGES['dx'], DEV_COL, False, MAX_NUM_DATA_POINTS),
+        'dx_avg'        : lambda: analytics().dx(RANGES['dx'], DEV_COL, True, MAX_NUM_DATA_POINTS),
+        'num_notes'     : lambda: analytics().num_notes(RANGES['num_notes'], DEV_COL, False, MAX_NUM_DATA_POINTS),
+        'num_notes_avg' : lambda: analytics().num_notes(RANGES['num_notes'], DEV_COL, True, MAX_NUM_DATA_POINTS),
+        'angle'         : lambda: fit_angle(False),
+        'angle_avg'     : lambda: fit_angle(True),
+        'vel'           : lambda: analytics().vel(RANGES['vel'], DEV_COL),
+        'skill'         : lambda: analytics().skill(DEV_COL),
+        'tap_dev'       : lambda: analytics().tap_dev(RANGES['tap_dev'], False, MAX_NUM_DATA_POINTS),
+        'tap_dev_avg'   : lambda: analytics().tap_dev(RANGES['tap_dev'], True, MAX_NUM_DATA_POINTS),
+        'grid'          : lambda: analytics().grid(RANGES['grid'], DEV_COL, GRID_BPM_EDGES, GRID_PX_EDGES, False, MAX_NUM_DATA_POINTS),
+        'grid_avg'      : lambda: analytics().grid(RANGES['grid'], DEV_COL, GRID_BPM_EDGES, GRID_PX_EDGES, True, MAX_NUM_DATA_POINTS),
+    }
+
+
+def masks_stage(data):
+    def run():
+        selection_cache = SelectionCache()
+        for ranges in RANGES.values():
+            data_select = np.ones(data.shape[0], dtype=bool)
+            for col, bounds in ranges.items():
+                data_select &= selection_cache.select(data, col, bounds)
+
+    return run
+
+
+class WriteDataStage():
+    '''
+    Appends records to a data file of `data` the way App.__write_data does:
+    setting lookup, record log append, index and aggregate update, cache
+    invalidation and archiving of the per-note offsets
+    '''
+
+    NUM_NOTES = 120
+
+    def __init__(self, data, rng):
+        self.__tmp_dir = tempfile.TemporaryDirectory()
+
+        save_file = os.path.join(self.__tmp_dir.name, 'stdev_data_bench.npy')
+        np.save(save_file, data, allow_pickle=False)
+
+        self.data_log   = DataLog(save_file)
+        self.data_index = RecordIndex(os.path.join(self.data_log.log_dir, 'index.npz'), self.data_log.data)
+        self.aggregates = AggregateTable(self.data_log.data, MAX_NUM_DATA_POINTS, os.path.join(self.data_log.log_dir, 'aggregates.npz'))
+        self.hit_archive = HitArchive(os.path.join(self.data_log.log_dir, 'hits'))
+        self.__saved_compactions = self.data_log.num_compactions
+
+        self.selection_cache = SelectionCache()
+        self.data_columns    = DerivedColumns()
+
+        self.__rng = rng
+
+
+    def __call__(self):
+        offsets = self.__rng.normal(0, 5, (3, WriteDataStage.NUM_NOTES))
+        setting = tuple(int(self.__rng.choice(GRID[col])) for col in RecordIndex.KEY_COLS)
+
+        data = self.data_log.data
+        data_select = self.data_index.lookup(setting)
+        if data_select.shape[0] != 0:
+            stddev_xy_curr = DataV3.derive(data[data_select], DataV3.COL_STDEV_XY)
+            np.argmax(stddev_xy_curr)
+
+        values = dict(zip(RecordIndex.KEY_COLS, setting))
+        values.update({
+            DataV3.COL_STDEV_X : np.std(offsets[0]),
+            DataV3.COL_AVG_X   : np.mean(offsets[0]),
+            DataV3.COL_STDEV_Y : np.std(offsets[1]),
+            DataV3.COL_AVG_Y   : np.mean(offsets[1]),
+            DataV3.COL_STDEV_T : np.std(offsets[2]),
+            DataV3.COL_AVG_T   : np.mean(offsets[2]),
+            DataV3.COL_CS      : 4,
+        })
+        record = DataV3.record(self.data_log.dtype, values)
+
+        self.data_log.append(record)
+        data = self.data_log.data
+
+        self.data_index.add(setting, data.shape[0] - 1)
+        self.aggregates.update(setting, record)
+        if self.data_log.num_compactions != self.__saved_compactions:
+            self.data_index.save(data)
+            self.aggregates.save(data)
+            self.__saved_compactions = self.data_log.num_compactions
+
+        self.selection_cache.invalidate()
+        self.data_columns.invalidate()
+
+        self.hit_archive.append(data.shape[0] - 1, offsets[0], offsets[1], offsets[2])
+
+
+    def close(self):
+        self.data_log.close()
+        self.__tmp_dir.cleanup()
+
+
+def time_it(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+
+    return best
+
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def scaling_exponent(sizes, seconds):
+    # Slope of log(time) over log(size): ~1 for linear, ~0 for constant
+    sizes   = np.asarray(sizes, dtype=np.float64)
+    seconds = np.asarray(seconds, dtype=np.float64)
+
+    valid = seconds > 0
+    if np.count_nonzero(valid) < 2:
+        return None
+
+    return float(np.polyfit(np.log(sizes[valid]), np.log(seconds[valid]), 1)[0])
+
+
+def run(sizes, repeat, seed, log):
+    rng = np.random.default_rng(seed)
+    results = []
+
+    def record(size, stage, func, num_repeat=repeat):
+        seconds = time_it(func, num_repeat)
+        peak    = peak_memory(func)
+        results.append({ 'size' : size, 'stage' : stage, 'seconds' : seconds, 'peak_bytes' : peak })
+        print(f'{size:>10} {stage:<14} {seconds*1000:>12.3f} ms {peak/2**20:>10.2f} MiB', file=log)
+
+    for size in sizes:
+        data = make_dataset(size, rng)
+
+        record(size, 'masks', masks_stage(data))
+        record(size, 'aggregates', lambda: AggregateTable(data, MAX_NUM_DATA_POINTS))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            table_file = os.path.join(tmp_dir, 'aggregates.npz')
+            AggregateTable(data, MAX_NUM_DATA_POINTS, table_file)
+            record(size, 'aggregates_npz', lambda: AggregateTable(data, MAX_NUM_DATA_POINTS, table_file))
+
+        aggregates = AggregateTable(data, MAX_NUM_DATA_POINTS)
+        stages = graph_stages(data, aggregates)
+
+        for stage, func in stages.items():
+            record(size, stage, func)
+
+        record(size, 'replot', lambda: [ func() for stage, func in stages.items() if not stage.endswith('_avg') ])
+
+        write_data = WriteDataStage(data, rng)
+        try: record(size, 'write_data', write_data, max(repeat, 20))
+        finally:
+            write_data.close()
+
+    stages = list(dict.fromkeys([ r['stage'] for r in results ]))
+    scaling = {}
+    for stage in stages:
+        stage_results = [ r for r in results if r['stage'] == stage ]
+        scaling[stage] = scaling_exponent([ r['size'] for r in stage_results ], [ r['seconds'] for r in stage_results ])
+
+    return {
+        'meta' : {
+            'time'     : datetime.datetime.now().isoformat(timespec='seconds'),
+            'python'   : platform.python_version(),
+            'numpy'    : np.__version__,
+            'platform' : platform.platform(),
+            'seed'     : seed,
+            'repeat'   : repeat,
+        },
+        'results' : results,
+        'scaling' : scaling,
+    }
+
+
+def compare(report, baseline_file, log):
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)
+
+    base = { (r['size'], r['stage']) : r for r in baseline['results'] }
+
+    print(f'\n{"size":>10} {"stage":<14} {"time x":>8} {"memory x":>9}', file=log)
+    for r in report['results']:
+        try: b = base[(r['size'], r['stage'])]
+        except KeyError:
+            continue
+
+        time_ratio = r['seconds']/b['seconds'] if b['seconds'] > 0 else float('nan')
+        mem_ratio  = r['peak_bytes']/b['peak_bytes'] if b['peak_bytes'] > 0 else float('nan')
+        print(f'{r["size"]:>10} {r["stage"]:<14} {time_ratio:>8.2f} {mem_ratio:>9.2f}', file=log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scaling benchmark of the graph pipeline')
+    parser.add_argument('--sizes', nargs='+', type=float, default=[ 1e3, 1e4, 1e5, 1e6, 1e7 ], help='number of records of each dataset')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage, the best is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='file to write the JSON report to, stdout if not given')
+    parser.add_argument('--compare', help='JSON report of a previous run to compare against')
+    args = parser.parse_args()
+
+    # The table goes to stderr so stdout stays machine-readable
+    log = sys.stderr
+
+    print(f'{"size":>10} {"stage":<14} {"time":>15} {"peak memory":>14}', file=log)
+    report = run([ int(size) for size in args.sizes ], args.repeat, args.seed, log)
+
+    if args.compare:
+        compare(report, args.compare, log)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    main()
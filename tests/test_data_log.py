@@ -0,0 +1,155 @@
+'''
+Crash safety and format migration of the record log backing the data files.
+
+Run from the repository root:
+    python -m pytest tests
+'''
+import os
+
+import numpy as np
+import pytest
+
+from app.misc._data_log import DataLog
+from app.misc._data_schema import DataV2, DataV3
+
+
+def make_records(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    records = np.zeros(num_rows, dtype=DataV3.DTYPE)
+
+    for name in DataV3.DTYPE.names:
+        if records.dtype[name].kind == 'u':
+            records[name] = rng.integers(0, 500, num_rows)
+        else:
+            records[name] = rng.normal(0, 10, num_rows)
+
+    return records
+
+
+def new_log(tmp_path, records, mmap=False):
+    save_file = str(tmp_path / 'stdev_data_1.npy')
+    log = DataLog(save_file, empty=np.empty(0, dtype=DataV3.DTYPE), mmap=mmap)
+
+    for record in records:
+        log.append(record)
+
+    return log
+
+
+def reload(log, mmap):
+    log.close()
+    log = DataLog(log.save_file, mmap=mmap)
+
+    data = np.array(log.data)
+    log.close()
+    return data
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(DataLog, 'CHUNK_ROWS', 4)
+    monkeypatch.setattr(DataLog, 'GROW_ROWS', 4)
+
+
+@pytest.mark.parametrize('mmap', [ False, True ])
+@pytest.mark.parametrize('reload_mmap', [ False, True ])
+def test_append_across_chunk_boundary(tmp_path, small_chunks, mmap, reload_mmap):
+    # 10 records span two sealed chunks and part of a third, or two growths of the mapped file
+    records = make_records(10)
+    log = new_log(tmp_path, records, mmap)
+
+    assert np.array_equal(log.data, records)
+    assert np.array_equal(reload(log, reload_mmap), records)
+
+
+def test_crash_before_manifest_update(tmp_path, small_chunks, monkeypatch):
+    records = make_records(6)
+
+    # Merged records are written, then the process dies before the manifest and data file are updated
+    def crash(self, last_chunk, num_rows):
+        raise SystemExit('crash')
+
+    with monkeypatch.context() as patch:
+        # Sealed chunks are compacted by hand
+        patch.setattr(DataLog, 'compact', lambda self, wait=False: None)
+        log = new_log(tmp_path, records)
+
+        patch.setattr(DataLog, '_DataLog__write_manifest', crash)
+        with pytest.raises(SystemExit):
+            log._DataLog__compact()
+
+    assert os.path.isfile(f'{log.log_dir}/compact.tmp')
+    assert np.load(log.save_file).shape[0] == 0
+
+    for mmap in [ False, True ]:
+        assert np.array_equal(reload(log, mmap), records)
+
+
+def test_crash_before_chunks_are_removed(tmp_path, small_chunks, monkeypatch):
+    records = make_records(6)
+
+    # The data file is replaced, then the process dies before the merged chunks are removed
+    def crash(file_name):
+        raise SystemExit('crash')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(DataLog, 'compact', lambda self, wait=False: None)
+        log = new_log(tmp_path, records)
+
+        patch.setattr(os, 'remove', crash)
+        with pytest.raises(SystemExit):
+            log._DataLog__compact()
+
+    assert np.load(log.save_file).shape[0] == 4
+    assert os.path.isfile(f'{log.log_dir}/chunk_000000.npy')
+
+    # Merged chunks are dropped instead of merged again
+    log = DataLog(log.save_file)
+    assert np.array_equal(log.data, records)
+
+    # New chunks do not reuse the ids of merged ones
+    more = make_records(3, seed=1)
+    for record in more:
+        log.append(record)
+
+    for mmap in [ False, True ]:
+        assert np.array_equal(reload(log, mmap), np.concatenate((records, more)))
+
+
+@pytest.mark.parametrize('mmap', [ False, True ])
+@pytest.mark.parametrize('num_rows', [ 0, 5 ])
+def test_convert_legacy_v2(tmp_path, mmap, num_rows):
+    legacy = np.arange(num_rows*DataV2.NUM_COLS, dtype=np.float64).reshape(num_rows, DataV2.NUM_COLS)
+
+    save_file = str(tmp_path / 'stdev_data_1.npy')
+    np.save(save_file, legacy)
+
+    log = DataLog(save_file, mmap=mmap)
+    assert DataV3.is_legacy(log.dtype)
+    assert type(log.version) == type(None)
+
+    backup_file = str(tmp_path / 'stdev_data_1.legacy.bak')
+    log.rewrite(DataV3.from_legacy(log.data), version=DataV3.VERSION, backup_file=backup_file)
+
+    assert np.array_equal(np.load(backup_file), legacy)
+    assert log.version == DataV3.VERSION
+
+    data = reload(log, mmap)
+    assert data.dtype == DataV3.DTYPE
+    assert data.shape == (num_rows,)
+
+    for name in DataV3.DTYPE.names:
+        assert np.array_equal(data[name], legacy[:, getattr(DataV2, f'COL_{name.upper()}')].astype(DataV3.DTYPE[name]))
+
+    log = DataLog(save_file, mmap=mmap)
+    assert log.version == DataV3.VERSION
+    log.close()
+
+
+@pytest.mark.parametrize('value', [ np.nan, -1, 2**16, 1.5 ])
+def test_convert_legacy_refuses_unrepresentable_settings(value):
+    legacy = np.zeros((3, DataV2.NUM_COLS))
+    legacy[1, DataV2.COL_BPM] = value
+
+    with pytest.raises(ValueError):
+        DataV3.from_legacy(legacy)